@@ -0,0 +1,45 @@
+"""add indexes for booking hot paths
+
+Revision ID: 3f8a2c91d6b4
+Revises: 19db0ebbcc29
+Create Date: 2026-10-18 10:12:31.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a2c91d6b4'
+down_revision = '19db0ebbcc29'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, partial index predicate)
+INDEXES = [
+    ('ix_order_court_date_start_status', 'Order', ['stadium_court_id', 'date', 'start_time', 'status'], None),
+    ('ix_order_active_court_date_start', 'Order', ['stadium_court_id', 'date', 'start_time'], 'status = 1'),
+    ('ix_order_renter_date_start_id', 'Order', ['renter_id', 'date', 'start_time', 'id'], None),
+    ('ix_stadium_disable_stadium_date_start', 'StadiumDisable', ['stadium_id', 'date', 'start_time'], None),
+    ('ix_team_order_id', 'Team', ['order_id'], None),
+    ('ix_team_member_team_user', 'TeamMember', ['team_id', 'user_id'], None),
+    ('ix_stadium_court_enabled_stadium', 'StadiumCourt', ['stadium_id'], 'is_enabled = true'),
+]
+
+
+def upgrade() -> None:
+    # build the indexes without locking the tables against writes
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,49 @@
+"""make disabled sessions unique
+
+Revision ID: 5e92d4f7a318
+Revises: c47e1b9a05d3
+Create Date: 2026-10-18 16:02:55.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e92d4f7a318'
+down_revision = 'c47e1b9a05d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # a session disabled twice: keep the earliest row
+    op.execute(
+        '''
+        DELETE FROM "StadiumDisable"
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY stadium_id, date, start_time ORDER BY id) AS rank
+                FROM "StadiumDisable"
+            ) ranked
+            WHERE rank > 1
+        )
+        '''
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_stadium_disable_stadium_date_start', 'StadiumDisable', ['stadium_id', 'date', 'start_time'],
+            unique=True, postgresql_concurrently=True,
+        )
+        # the unique index serves the same lookups
+        op.drop_index('ix_stadium_disable_stadium_date_start', table_name='StadiumDisable', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_stadium_disable_stadium_date_start', 'StadiumDisable', ['stadium_id', 'date', 'start_time'],
+            postgresql_concurrently=True,
+        )
+        op.drop_index('uq_stadium_disable_stadium_date_start', table_name='StadiumDisable', postgresql_concurrently=True)
@@ -0,0 +1,52 @@
+"""forbid double booking of a court session
+
+Revision ID: 8b5e0d7a4c12
+Revises: 3f8a2c91d6b4
+Create Date: 2026-10-18 11:03:47.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b5e0d7a4c12'
+down_revision = '3f8a2c91d6b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing double bookings: keep the earliest active order of each court session, cancel the others
+    cancelled = op.get_bind().execute(sa.text(
+        '''
+        UPDATE "Order" SET status = 0
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY stadium_court_id, date, start_time ORDER BY id) AS rank
+                FROM "Order" WHERE status = 1
+            ) ranked
+            WHERE rank > 1
+        )
+        RETURNING id
+        '''
+    )).scalars().all()
+    if cancelled:
+        print('cancelled double-booked orders: {}'.format(sorted(cancelled)))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_order_active_court_date_start', 'Order', ['stadium_court_id', 'date', 'start_time'],
+            unique=True, postgresql_where=sa.text('status = 1'), postgresql_concurrently=True,
+        )
+        # the unique index serves the same lookups
+        op.drop_index('ix_order_active_court_date_start', table_name='Order', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_order_active_court_date_start', 'Order', ['stadium_court_id', 'date', 'start_time'],
+            postgresql_where=sa.text('status = 1'), postgresql_concurrently=True,
+        )
+        op.drop_index('uq_order_active_court_date_start', table_name='Order', postgresql_concurrently=True)
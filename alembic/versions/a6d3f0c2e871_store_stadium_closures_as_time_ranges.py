@@ -0,0 +1,74 @@
+"""store stadium closures as time ranges
+
+Revision ID: a6d3f0c2e871
+Revises: 5e92d4f7a318
+Create Date: 2026-10-18 18:40:12.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3f0c2e871'
+down_revision = '5e92d4f7a318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('StadiumDisable', sa.Column('period', postgresql.TSRANGE(), nullable=True))
+    for column in ('date', 'start_time', 'end_time'):
+        op.alter_column('StadiumDisable', column, nullable=True)
+    # backfill: merge the consecutive disabled hours of a stadium into one closure
+    op.execute(
+        '''
+        WITH hours AS (
+            DELETE FROM "StadiumDisable"
+            RETURNING stadium_id, date + make_interval(hours => start_time) AS lower, date + make_interval(hours => end_time) AS upper
+        ),
+        flagged AS (
+            SELECT stadium_id, lower, upper,
+                   CASE WHEN lower <= max(upper) OVER (
+                       PARTITION BY stadium_id ORDER BY lower, upper ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) THEN 0 ELSE 1 END AS is_first
+            FROM hours
+        ),
+        islands AS (
+            SELECT stadium_id, lower, upper, sum(is_first) OVER (PARTITION BY stadium_id ORDER BY lower, upper) AS island
+            FROM flagged
+        )
+        INSERT INTO "StadiumDisable" (stadium_id, period)
+        SELECT stadium_id, tsrange(min(lower), max(upper)) FROM islands GROUP BY stadium_id, island
+        '''
+    )
+    op.drop_index('uq_stadium_disable_stadium_date_start', table_name='StadiumDisable')
+    for column in ('date', 'start_time', 'end_time'):
+        op.drop_column('StadiumDisable', column)
+    op.alter_column('StadiumDisable', 'period', nullable=False)
+    op.create_index('ix_stadium_disable_period', 'StadiumDisable', ['period'], postgresql_using='gist')
+    op.create_index('ix_stadium_disable_stadium_id', 'StadiumDisable', ['stadium_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stadium_disable_stadium_id', table_name='StadiumDisable')
+    op.drop_index('ix_stadium_disable_period', table_name='StadiumDisable')
+    op.add_column('StadiumDisable', sa.Column('date', sa.Date(), nullable=True))
+    op.add_column('StadiumDisable', sa.Column('start_time', sa.Integer(), nullable=True))
+    op.add_column('StadiumDisable', sa.Column('end_time', sa.Integer(), nullable=True))
+    op.alter_column('StadiumDisable', 'period', nullable=True)
+    # one row per disabled hour again
+    op.execute(
+        '''
+        WITH closures AS (
+            DELETE FROM "StadiumDisable" RETURNING stadium_id, period
+        )
+        INSERT INTO "StadiumDisable" (stadium_id, date, start_time, end_time)
+        SELECT DISTINCT stadium_id, CAST(hour AS date), CAST(extract(hour FROM hour) AS integer), CAST(extract(hour FROM hour) AS integer) + 1
+        FROM closures, generate_series(date_trunc('hour', lower(period)), upper(period) - interval '1 microsecond', interval '1 hour') AS hour
+        '''
+    )
+    op.drop_column('StadiumDisable', 'period')
+    for column in ('date', 'start_time', 'end_time'):
+        op.alter_column('StadiumDisable', column, nullable=False)
+    op.create_index('uq_stadium_disable_stadium_date_start', 'StadiumDisable', ['stadium_id', 'date', 'start_time'], unique=True)
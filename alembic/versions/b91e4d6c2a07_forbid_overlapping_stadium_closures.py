@@ -0,0 +1,51 @@
+"""forbid overlapping stadium closures
+
+Revision ID: b91e4d6c2a07
+Revises: f8a3c6d2b154
+Create Date: 2026-10-18 23:12:05.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b91e4d6c2a07'
+down_revision = 'f8a3c6d2b154'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # existing overlaps (left by concurrent closures): merge the closures of a stadium that overlap or touch
+    op.execute(
+        '''
+        WITH closures AS (
+            DELETE FROM "StadiumDisable"
+            RETURNING stadium_id, lower(period) AS lower, upper(period) AS upper
+        ),
+        flagged AS (
+            SELECT stadium_id, lower, upper,
+                   CASE WHEN lower <= max(upper) OVER (
+                       PARTITION BY stadium_id ORDER BY lower, upper ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) THEN 0 ELSE 1 END AS is_first
+            FROM closures
+        ),
+        islands AS (
+            SELECT stadium_id, lower, upper, sum(is_first) OVER (PARTITION BY stadium_id ORDER BY lower, upper) AS island
+            FROM flagged
+        )
+        INSERT INTO "StadiumDisable" (stadium_id, period)
+        SELECT stadium_id, tsrange(min(lower), max(upper)) FROM islands GROUP BY stadium_id, island
+        '''
+    )
+    # int4range keeps the equality on stadium_id in plain GiST (no btree_gist)
+    op.execute(
+        '''
+        ALTER TABLE "StadiumDisable" ADD CONSTRAINT ex_stadium_disable_stadium_period
+        EXCLUDE USING gist (int4range(stadium_id, stadium_id, '[]') WITH =, period WITH &&)
+        '''
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('ex_stadium_disable_stadium_period', 'StadiumDisable')
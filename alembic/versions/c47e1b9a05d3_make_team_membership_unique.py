@@ -0,0 +1,51 @@
+"""make team membership unique
+
+Revision ID: c47e1b9a05d3
+Revises: 8b5e0d7a4c12
+Create Date: 2026-10-18 14:21:09.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e1b9a05d3'
+down_revision = '8b5e0d7a4c12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # duplicated memberships: keep one row per team and user, an active one if any
+    removed = op.get_bind().execute(sa.text(
+        '''
+        DELETE FROM "TeamMember"
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (PARTITION BY team_id, user_id ORDER BY status DESC, id) AS rank
+                FROM "TeamMember"
+            ) ranked
+            WHERE rank > 1
+        )
+        RETURNING id
+        '''
+    )).scalars().all()
+    if removed:
+        print('removed duplicated team members: {}'.format(sorted(removed)))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_team_member_team_user', 'TeamMember', ['team_id', 'user_id'],
+            unique=True, postgresql_concurrently=True,
+        )
+        # the unique index serves the same lookups
+        op.drop_index('ix_team_member_team_user', table_name='TeamMember', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_team_member_team_user', 'TeamMember', ['team_id', 'user_id'], postgresql_concurrently=True,
+        )
+        op.drop_index('uq_team_member_team_user', table_name='TeamMember', postgresql_concurrently=True)
@@ -0,0 +1,41 @@
+"""add notification outbox
+
+Revision ID: d2b7e4a91f30
+Revises: a6d3f0c2e871
+Create Date: 2026-10-18 21:12:05.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e4a91f30'
+down_revision = 'a6d3f0c2e871'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('Notification',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('content', sa.String(), nullable=False),
+    sa.Column('recipients', postgresql.ARRAY(sa.String()), nullable=False),
+    sa.Column('status', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('created_time', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('sent_time', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_notification_pending_due', 'Notification', ['next_attempt_time', 'id'],
+        postgresql_where=sa.text('status = 0'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_pending_due', table_name='Notification')
+    op.drop_table('Notification')
@@ -0,0 +1,29 @@
+"""add digest to notification
+
+Revision ID: e5c1a7b3d920
+Revises: d2b7e4a91f30
+Create Date: 2026-10-18 22:05:41.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c1a7b3d920'
+down_revision = 'd2b7e4a91f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('Notification', sa.Column('digest', sa.String(), nullable=True))
+    op.create_index(
+        'ix_notification_pending_digest', 'Notification', ['digest', 'recipients'],
+        postgresql_where=sa.text('status = 0 AND digest IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_notification_pending_digest', table_name='Notification')
+    op.drop_column('Notification', 'digest')
@@ -0,0 +1,33 @@
+"""render notifications from templates
+
+Revision ID: f8a3c6d2b154
+Revises: e5c1a7b3d920
+Create Date: 2026-10-18 23:31:16.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'f8a3c6d2b154'
+down_revision = 'e5c1a7b3d920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('Notification', sa.Column('template', sa.String(), nullable=True))
+    op.add_column('Notification', sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.alter_column('Notification', 'content', nullable=True)
+    # digest entries queued so far have no payload to list; they go out on their own
+    op.execute('UPDATE "Notification" SET digest = NULL WHERE status = 0 AND digest IS NOT NULL')
+
+
+def downgrade() -> None:
+    # notifications not rendered yet cannot be sent by the previous release
+    op.execute('UPDATE "Notification" SET status = 2, last_error = \'downgraded before sending\' WHERE content IS NULL AND status = 0')
+    op.execute('UPDATE "Notification" SET content = \'\' WHERE content IS NULL')
+    op.alter_column('Notification', 'content', nullable=False)
+    op.drop_column('Notification', 'payload')
+    op.drop_column('Notification', 'template')
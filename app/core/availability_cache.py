@@ -0,0 +1,154 @@
+"""
+Availability cache.
+
+Holds the computed slot state of one stadium for one day, keyed by
+(stadium_id, date), in a pluggable backend (see app/core/cache_backends.py)
+selected by AVAILABILITY_CACHE_BACKEND. Every write path that changes
+availability must call `invalidate` after its commit.
+
+Entries are stored under versioned keys built from three generation counters
+kept in the backend: a global one (bumped by `clear`), one per stadium and one
+per (stadium, date). Invalidating bumps a counter, so with a shared backend a
+booking made in one worker makes the old entries unreachable in all of them.
+A reader takes the versions before loading from the database, hence a slow
+read that raced with a write is stored under a dead version and never served.
+
+With a shared backend each worker also keeps the decoded values in a small
+in-process LRU. A versioned key never changes meaning, so that copy cannot go
+stale; invalidation events published through the backend only free it early.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.core.cache_backends import CacheBackend, create_backend
+from app.core.config import settings
+
+
+class AvailabilityCache:
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl: int,
+        local_maxsize: int = 1024,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.local_maxsize = local_maxsize if backend.shared else 0
+        self._timer = timer
+        self._lock = threading.Lock()
+        # versioned key -> (expires_at, value)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._subscribed_pid: Optional[int] = None
+
+    def _subscribe(self) -> None:
+        # gunicorn forks the workers after importing the app, so listen from each worker process
+        if self.local_maxsize and self._subscribed_pid != os.getpid():
+            self._subscribed_pid = os.getpid()
+            self.backend.subscribe(self._on_invalidate)
+
+    @staticmethod
+    def _entry_key(stadium_id: int, day: date, kind: str, version: str) -> str:
+        return "avail:{}:{}:{}:{}".format(stadium_id, day.isoformat(), kind, version)
+
+    def versions(self, stadium_id: int, days: Sequence[date]) -> Dict[date, str]:
+        """
+        Current version of every (stadium_id, day), read with a single backend call.
+        """
+        counters = self.backend.get_counters(
+            ["avail-gen", "avail-gen:{}".format(stadium_id)]
+            + ["avail-gen:{}:{}".format(stadium_id, day.isoformat()) for day in days]
+        )
+        epoch, stadium_generation = counters[0], counters[1]
+        return {
+            day: "{}.{}.{}".format(epoch, stadium_generation, day_generation)
+            for day, day_generation in zip(days, counters[2:])
+        }
+
+    def get_many(self, stadium_id: int, kind: str, versions: Dict[date, str]) -> Dict[date, Any]:
+        """
+        Cached values of the given days; days without a live entry are left out.
+        """
+        self._subscribe()
+        found: Dict[date, Any] = {}
+        missing: List[date] = []
+        now = self._timer()
+        with self._lock:
+            for day, version in versions.items():
+                key = self._entry_key(stadium_id, day, kind, version)
+                entry = self._local.get(key)
+                if entry is not None and entry[0] > now:
+                    self._local.move_to_end(key)
+                    found[day] = entry[1]
+                else:
+                    missing.append(day)
+        if missing:
+            values = self.backend.get_many(
+                [self._entry_key(stadium_id, day, kind, versions[day]) for day in missing]
+            )
+            for day, value in zip(missing, values):
+                if value is not None:
+                    found[day] = value
+                    self._remember(self._entry_key(stadium_id, day, kind, versions[day]), value)
+        return found
+
+    def get(self, stadium_id: int, day: date, kind: str, version: str) -> Optional[Any]:
+        return self.get_many(stadium_id, kind, {day: version}).get(day)
+
+    def set(self, stadium_id: int, day: date, kind: str, value: Any, version: str) -> None:
+        key = self._entry_key(stadium_id, day, kind, version)
+        self.backend.set(key, value, self.ttl)
+        self._remember(key, value)
+
+    def _remember(self, key: str, value: Any) -> None:
+        if not self.local_maxsize:
+            return
+        with self._lock:
+            self._local[key] = (self._timer() + self.ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_maxsize:
+                self._local.popitem(last=False)
+
+    def _forget(self, prefix: str) -> None:
+        with self._lock:
+            for key in [key for key in self._local if key.startswith(prefix)]:
+                del self._local[key]
+
+    def _on_invalidate(self, message: str) -> None:
+        self._forget("avail:{}:".format(message))
+
+    def invalidate(self, stadium_id: int, day: Optional[date] = None) -> None:
+        """
+        Drop the cached state of one day of a stadium, or of every day if `day` is None.
+        """
+        if day is None:
+            self.backend.incr("avail-gen:{}".format(stadium_id))
+            message = "{}".format(stadium_id)
+        else:
+            self.backend.incr("avail-gen:{}:{}".format(stadium_id, day.isoformat()))
+            message = "{}:{}".format(stadium_id, day.isoformat())
+        self._on_invalidate(message)
+        self.backend.publish(message)
+
+    def clear(self) -> None:
+        self.backend.incr("avail-gen")
+        with self._lock:
+            self._local.clear()
+
+
+availability_cache = AvailabilityCache(
+    create_backend(
+        settings.AVAILABILITY_CACHE_BACKEND,
+        maxsize=settings.AVAILABILITY_CACHE_MAXSIZE,
+        mmap_path=settings.AVAILABILITY_CACHE_MMAP_PATH,
+        mmap_slots=settings.AVAILABILITY_CACHE_MMAP_SLOTS,
+        mmap_slot_size=settings.AVAILABILITY_CACHE_MMAP_SLOT_SIZE,
+        redis_url=settings.AVAILABILITY_CACHE_REDIS_URL,
+    ),
+    ttl=settings.AVAILABILITY_CACHE_TTL,
+    local_maxsize=settings.AVAILABILITY_CACHE_MAXSIZE,
+)
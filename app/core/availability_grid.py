@@ -0,0 +1,206 @@
+"""
+City-wide availability grid.
+
+Load the opening hours, enabled courts, closures and orders of every stadium
+for a date window in a few bulk queries, scatter them into NumPy arrays and
+answer "which stadiums can take N people at level X" over a
+stadiums x days x hours tensor with vectorized filters. The rules are the ones
+of the per-stadium timetable (app/core/timetable.py), so a stadium shown as
+free here is shown as "Available" there.
+"""
+from datetime import date, timedelta
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core.slot_bitmap import HOURS_PER_DAY
+
+
+class OrderArrays(NamedTuple):
+    """
+    Orders as aligned arrays, ordered by order id.
+
+    `court` indexes the court array given to `build_grid`, `day` counts days from the start date,
+    and `level_requirement` is -1 for an order without a team.
+    """
+    court: np.ndarray
+    day: np.ndarray
+    hour: np.ndarray
+    end_time: np.ndarray
+    status: np.ndarray
+    is_matching: np.ndarray
+    level_requirement: np.ndarray
+    vacancy: np.ndarray
+
+
+class AvailabilityGrid(NamedTuple):
+    """
+    Slot state of many stadiums over `days` consecutive days; axis 0 follows `stadium_ids`.
+
+    `open` marks the opening hours that are not disabled, `vacant_courts` counts the enabled
+    courts without any order, `active` marks the sessions with an active one-hour order, and
+    `team_slots` holds the (stadium, day, hour) indices of the teams open to matching of the first
+    order of each court, with their `team_level` and `team_vacancy`.
+    """
+    stadium_ids: np.ndarray
+    start_date: date
+    open: np.ndarray
+    has_courts: np.ndarray
+    vacant_courts: np.ndarray
+    active: np.ndarray
+    team_slots: np.ndarray
+    team_level: np.ndarray
+    team_vacancy: np.ndarray
+
+
+def build_grid(
+    *,
+    stadium_ids: np.ndarray,
+    start_date: date,
+    days: int,
+    opening_hours: np.ndarray,
+    court_stadium: np.ndarray,
+    disabled_sessions: np.ndarray,
+    orders: OrderArrays,
+) -> AvailabilityGrid:
+    """
+    Build the grid from arrays.
+
+    `opening_hours` is (stadiums, 2) of [start_time, end_time), `court_stadium` the stadium index of
+    every enabled court, and `disabled_sessions` is (n, 3) of (stadium, day, hour) indices.
+    """
+    hours = np.arange(HOURS_PER_DAY)
+    opening = (hours >= opening_hours[:, :1]) & (hours < opening_hours[:, 1:])
+    open_ = np.repeat(opening[:, None, :], days, axis=1)
+    open_[tuple(disabled_sessions.T)] = False
+
+    in_window = (orders.day >= 0) & (orders.day < days) & (orders.hour >= 0) & (orders.hour < HOURS_PER_DAY)
+    orders = OrderArrays(*(column[in_window] for column in orders))
+    order_stadium = court_stadium[orders.court]
+
+    # a court is taken at an hour by any order, cancelled ones included (as in the timetable)
+    occupied = np.zeros((len(court_stadium), days, HOURS_PER_DAY), dtype=bool)
+    occupied[orders.court, orders.day, orders.hour] = True
+    vacant_courts = np.zeros(open_.shape, dtype=np.int32)
+    np.add.at(vacant_courts, court_stadium, ~occupied)
+
+    active = np.zeros(open_.shape, dtype=bool)
+    is_active = (orders.status == 1) & (orders.end_time == orders.hour + 1)
+    active[order_stadium[is_active], orders.day[is_active], orders.hour[is_active]] = True
+
+    # only the team of the first order of a court at an hour counts
+    slot_key = (orders.court * days + orders.day) * HOURS_PER_DAY + orders.hour
+    _, first = np.unique(slot_key, return_index=True)
+    team = first[orders.is_matching[first] & (orders.level_requirement[first] >= 0)]
+
+    return AvailabilityGrid(
+        stadium_ids=stadium_ids,
+        start_date=start_date,
+        open=open_,
+        has_courts=np.bincount(court_stadium, minlength=len(stadium_ids)) > 0,
+        vacant_courts=vacant_courts,
+        active=active,
+        team_slots=np.stack([order_stadium[team], orders.day[team], orders.hour[team]], axis=1),
+        team_level=orders.level_requirement[team],
+        team_vacancy=orders.vacancy[team],
+    )
+
+
+def load_grid(db: Session, *, start_date: date, days: int) -> AvailabilityGrid:
+    """
+    Load the grid of every stadium with available times for `days` days starting at `start_date`.
+    """
+    end_date = start_date + timedelta(days=days)
+    available_times = crud.stadium_available_time.get_available_times_of_stadiums(db=db)
+    stadium_ids = np.array([row.stadium_id for row in available_times], dtype=np.int64)
+    opening_hours = np.array([(row.start_time, row.end_time) for row in available_times], dtype=np.int64).reshape(-1, 2)
+
+    # courts of stadiums without available times never open, leave them out
+    known_stadium_ids = set(stadium_ids.tolist())
+    courts = [
+        (court_id, stadium_id)
+        for court_id, stadium_id in crud.stadium_court.get_all_enabled_ids_with_stadium_id(db=db)
+        if stadium_id in known_stadium_ids
+    ]
+    court_ids = np.array([court_id for court_id, _ in courts], dtype=np.int64)
+    court_stadium = np.searchsorted(stadium_ids, [stadium_id for _, stadium_id in courts]).astype(np.int64)
+
+    disabled = [
+        (stadium_id, (session_date - start_date).days, hour)
+        for stadium_id, session_date, hour in crud.stadium_disable.get_all_disabled_sessions(
+            db=db, start_date=start_date, end_date=end_date
+        )
+    ]
+    disabled = np.array(disabled, dtype=np.int64).reshape(-1, 3)
+    disabled = disabled[np.isin(disabled[:, 0], stadium_ids)]
+    disabled[:, 0] = np.searchsorted(stadium_ids, disabled[:, 0])
+
+    rows = crud.order.get_all_with_team_by_court_ids_and_date_range(
+        db=db, stadium_court_ids=court_ids.tolist(), start_date=start_date, end_date=end_date
+    )
+    # an order joined to several teams comes once per team; keep its first row
+    first_rows = {}
+    for row in rows:
+        first_rows.setdefault(row.id, row)
+    rows = list(first_rows.values())
+    orders = OrderArrays(
+        court=np.searchsorted(court_ids, [row.stadium_court_id for row in rows]).astype(np.int64),
+        day=np.array([(row.date - start_date).days for row in rows], dtype=np.int64),
+        hour=np.array([row.start_time for row in rows], dtype=np.int64),
+        end_time=np.array([row.end_time for row in rows], dtype=np.int64),
+        status=np.array([row.status for row in rows], dtype=np.int64),
+        is_matching=np.array([bool(row.is_matching) for row in rows], dtype=bool),
+        level_requirement=np.array(
+            [-1 if row.level_requirement is None else row.level_requirement for row in rows], dtype=np.int64
+        ),
+        vacancy=np.array(
+            [0 if row.level_requirement is None else row.max_number_of_member - row.current_member_number for row in rows],
+            dtype=np.int64,
+        ),
+    )
+    return build_grid(
+        stadium_ids=stadium_ids,
+        start_date=start_date,
+        days=days,
+        opening_hours=opening_hours,
+        court_stadium=court_stadium,
+        disabled_sessions=disabled,
+        orders=orders,
+    )
+
+
+def joinable(grid: AvailabilityGrid, headcount: int, levels: List[int]) -> np.ndarray:
+    """
+    Sessions at which some court is taken by a team with the level and room for `headcount` more people.
+    """
+    result = np.zeros(grid.active.shape, dtype=bool)
+    selected = np.isin(grid.team_level, levels) & (grid.team_vacancy >= headcount)
+    result[tuple(grid.team_slots[selected].T)] = True
+    return result
+
+
+def available(grid: AvailabilityGrid, headcount: int, levels: List[int]) -> np.ndarray:
+    """
+    Stadiums x days x hours tensor of the sessions a user can book or join.
+    """
+    # an hour without active orders is available; otherwise some court must be free or have a joinable team
+    free = ~grid.active | (grid.vacant_courts > 0) | joinable(grid, headcount, levels)
+    return grid.open & grid.has_courts[:, None, None] & free
+
+
+def free_stadiums(
+    grid: AvailabilityGrid, *, day: date, start_time: int, headcount: int, levels: List[int]
+) -> List[Tuple[int, int]]:
+    """
+    (stadium_id, vacant court count) of every stadium available at a session.
+    """
+    day_index = (day - grid.start_date).days
+    if not 0 <= day_index < grid.open.shape[1] or not 0 <= start_time < HOURS_PER_DAY:
+        return []
+    is_free = available(grid, headcount, levels)[:, day_index, start_time]
+    return list(zip(
+        grid.stadium_ids[is_free].tolist(),
+        grid.vacant_courts[is_free, day_index, start_time].tolist(),
+    ))
@@ -0,0 +1,366 @@
+"""
+Storage backends of the availability and user status caches.
+
+Every backend offers the same small key-value interface: `get_many`/`set` for
+cached values (with a TTL), `get_counters`/`incr` for the generation counters
+the cache derives its versioned keys from, and `publish`/`subscribe` for
+invalidation events. Async endpoints go through `CacheBackend.run`, since the
+shared backends block on file locks or sockets.
+
+- InProcessBackend: a dict in the worker itself (one gunicorn worker only).
+- SharedMemoryBackend: an mmap'd file shared by every worker on the host.
+- RedisBackend: any server speaking the Redis protocol, shared by every host.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+from fastapi.concurrency import run_in_threadpool
+from loguru import logger
+
+
+class CacheBackend:
+    # whether other workers see what this backend stores
+    shared = False
+    # counters outlive the entries versioned with them, so a dropped counter never repeats a live version
+    COUNTER_TTL = 24 * 60 * 60
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        raise NotImplementedError
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    def publish(self, message: str) -> None:
+        """
+        Broadcast an invalidation event to the other workers (no-op without a push channel).
+        """
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        """
+        Call `callback` with every invalidation event published by another worker.
+        """
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Call `fn`, which uses this backend, from async code: in the threadpool for a shared backend,
+        so a slow cache server or a held file lock does not stall the event loop; inline otherwise.
+        """
+        if self.shared:
+            return await run_in_threadpool(fn, *args, **kwargs)
+        return fn(*args, **kwargs)
+
+
+class InProcessBackend(CacheBackend):
+    def __init__(self, maxsize: int, timer: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> (value, bumped at), oldest bump first
+        self._counters: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        now = self._timer()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None or entry[0] <= now:
+                    self._entries.pop(key, None)
+                    values.append(None)
+                    continue
+                self._entries.move_to_end(key)
+                values.append(entry[1])
+        return values
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (self._timer() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        with self._lock:
+            return [self._counters.get(key, (0,))[0] for key in keys]
+
+    def incr(self, key: str) -> int:
+        now = self._timer()
+        with self._lock:
+            value = self._counters.pop(key, (0,))[0] + 1
+            self._counters[key] = (value, now)
+            # every (stadium, date) or user ever invalidated has a counter; drop the ones idle for COUNTER_TTL
+            while next(iter(self._counters.values()))[1] + self.COUNTER_TTL <= now:
+                self._counters.popitem(last=False)
+            return value
+
+
+def _hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little")
+
+
+class SharedMemoryBackend(CacheBackend):
+    """
+    Cache shared by the workers of one host through an mmap'd file (put it under /dev/shm).
+
+    The file starts with a table of counters followed by `slots` entry slots of `slot_size`
+    bytes. A key hashes to one counter and one slot; a newer value simply overwrites whatever
+    was in its slot, and two keys sharing a counter only cause extra misses. Values larger
+    than a slot are not cached. Byte-range locks keep processes from reading torn slots.
+
+    The layout is part of the file name (`path` + ".<slots>x<slot_size>"), so workers started with
+    other settings during a rolling deploy map a file of their own instead of resizing a live one.
+    """
+    shared = True
+    COUNTERS = 4096
+    _COUNTER = struct.Struct("<Q")
+    # key hash, expires at (unix time), payload length
+    _HEADER = struct.Struct("<QdI")
+
+    def __init__(self, path: str, slots: int, slot_size: int, timer: Callable[[], float] = time.time):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._entries_offset = self.COUNTERS * self._COUNTER.size
+        size = self._entries_offset + slots * slot_size
+        self.path = "{}.{}x{}".format(path, slots, slot_size)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            file_size = os.fstat(self._fd).st_size
+            if file_size == 0:
+                os.ftruncate(self._fd, size)
+            elif file_size != size:
+                # never resize a file other processes may have mapped
+                raise ValueError("{} is {} bytes, expected {}.".format(self.path, file_size, size))
+            fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        except BaseException:
+            # closing also releases the lock
+            os.close(self._fd)
+            raise
+        self._map = mmap.mmap(self._fd, size)
+
+    @contextmanager
+    def _locked(self, operation: int, offset: int, length: int):
+        # record locks only exclude other processes, the thread lock covers this one
+        with self._lock:
+            fcntl.lockf(self._fd, operation, length, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+    def _slot_offset(self, key_hash: int) -> int:
+        return self._entries_offset + (key_hash % self.slots) * self.slot_size
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        now = self._timer()
+        values = []
+        for key in keys:
+            key_hash = _hash_key(key)
+            offset = self._slot_offset(key_hash)
+            with self._locked(fcntl.LOCK_SH, offset, self.slot_size):
+                stored_hash, expires_at, length = self._HEADER.unpack_from(self._map, offset)
+                payload = None
+                if stored_hash == key_hash and expires_at > now:
+                    start = offset + self._HEADER.size
+                    payload = self._map[start:start + length]
+            values.append(pickle.loads(payload) if payload is not None else None)
+        return values
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.slot_size - self._HEADER.size:
+            return
+        key_hash = _hash_key(key)
+        offset = self._slot_offset(key_hash)
+        with self._locked(fcntl.LOCK_EX, offset, self.slot_size):
+            self._HEADER.pack_into(self._map, offset, key_hash, self._timer() + ttl, len(payload))
+            start = offset + self._HEADER.size
+            self._map[start:start + len(payload)] = payload
+
+    def _counter_offset(self, key: str) -> int:
+        return (_hash_key(key) % self.COUNTERS) * self._COUNTER.size
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        counters = []
+        for key in keys:
+            offset = self._counter_offset(key)
+            with self._locked(fcntl.LOCK_SH, offset, self._COUNTER.size):
+                counters.append(self._COUNTER.unpack_from(self._map, offset)[0])
+        return counters
+
+    def incr(self, key: str) -> int:
+        offset = self._counter_offset(key)
+        with self._locked(fcntl.LOCK_EX, offset, self._COUNTER.size):
+            value = self._COUNTER.unpack_from(self._map, offset)[0] + 1
+            self._COUNTER.pack_into(self._map, offset, value)
+        return value
+
+
+class RedisError(Exception):
+    pass
+
+
+class RespConnection:
+    """
+    Minimal client of the Redis serialization protocol (RESP2), enough for the cache commands.
+    """
+
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: Optional[float] = 5.0):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._file = self._sock.makefile("rb")
+        if password:
+            self.execute("AUTH", password)
+        if db:
+            self.execute("SELECT", db)
+
+    @staticmethod
+    def _encode(args: Sequence[Any]) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    def read_reply(self) -> Any:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by the cache server.")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest.decode()
+        if prefix == b"-":
+            raise RedisError(rest.decode())
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            return None if length == -1 else self._file.read(length + 2)[:-2]
+        if prefix == b"*":
+            length = int(rest)
+            return None if length == -1 else [self.read_reply() for _ in range(length)]
+        raise RedisError("Unexpected reply: {!r}".format(line))
+
+    def send(self, *args: Any) -> None:
+        self._sock.sendall(self._encode(args))
+
+    def execute(self, *args: Any) -> Any:
+        self.send(*args)
+        return self.read_reply()
+
+    def pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        self._sock.sendall(b"".join(self._encode(command) for command in commands))
+        return [self.read_reply() for _ in commands]
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Cache stored in a Redis-protocol server; invalidation events go through PUBLISH/SUBSCRIBE.
+    """
+    shared = True
+    CHANNEL = "availability-cache-invalidate"
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._db = int(parsed.path.lstrip("/") or 0)
+        self._password = parsed.password
+        # one connection per thread: sync endpoints run in a thread pool
+        self._local = threading.local()
+
+    def _connect(self) -> RespConnection:
+        return RespConnection(self._host, self._port, db=self._db, password=self._password)
+
+    def _connection(self) -> RespConnection:
+        connection = getattr(self._local, "connection", None)
+        # never share a socket with the process this one was forked from
+        if connection is None or self._local.pid != os.getpid():
+            connection = self._local.connection = self._connect()
+            self._local.pid = os.getpid()
+        return connection
+
+    def _pipeline(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        try:
+            return self._connection().pipeline(commands)
+        except (OSError, ConnectionError):
+            # reconnect once, e.g. after the server closed an idle connection
+            self._local.connection = None
+            return self._connection().pipeline(commands)
+
+    def get_many(self, keys: Sequence[str]) -> List[Optional[Any]]:
+        if not keys:
+            return []
+        payloads = self._pipeline([("MGET", *keys)])[0]
+        return [pickle.loads(payload) if payload is not None else None for payload in payloads]
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self._pipeline([("SET", key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), "EX", ttl)])
+
+    def get_counters(self, keys: Sequence[str]) -> List[int]:
+        if not keys:
+            return []
+        return [int(value or 0) for value in self._pipeline([("MGET", *keys)])[0]]
+
+    def incr(self, key: str) -> int:
+        return self._pipeline([("INCR", key), ("EXPIRE", key, self.COUNTER_TTL)])[0]
+
+    def publish(self, message: str) -> None:
+        self._pipeline([("PUBLISH", self.CHANNEL, message)])
+
+    def subscribe(self, callback: Callable[[str], None]) -> None:
+        threading.Thread(target=self._listen, args=(callback,), daemon=True).start()
+
+    def _listen(self, callback: Callable[[str], None]) -> None:
+        while True:
+            try:
+                connection = RespConnection(
+                    self._host, self._port, db=self._db, password=self._password, timeout=None
+                )
+                connection.execute("SUBSCRIBE", self.CHANNEL)
+                while True:
+                    kind, _, data = connection.read_reply()
+                    if kind == b"message":
+                        callback(data.decode())
+            except Exception as e:
+                logger.warning("availability cache subscriber disconnected: {}", e)
+                time.sleep(1)
+
+
+def create_backend(
+    kind: str, *, maxsize: int, mmap_path: str, mmap_slots: int, mmap_slot_size: int, redis_url: str
+) -> CacheBackend:
+    """
+    Backend of a `kind` ("memory", "mmap" or "redis"); every cache gets an instance of its own.
+    """
+    if kind == "mmap":
+        return SharedMemoryBackend(mmap_path, slots=mmap_slots, slot_size=mmap_slot_size)
+    if kind == "redis":
+        return RedisBackend(redis_url)
+    if kind == "memory":
+        return InProcessBackend(maxsize=maxsize)
+    raise ValueError("Unknown cache backend {!r}, expected one of memory, mmap, redis.".format(kind))
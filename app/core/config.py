@@ -10,6 +10,32 @@ class Settings(BaseSettings):
     ENV: str
     test_int: int = 50
     POOL_SIZE: int
+    # availability cache: per (stadium, date) slot state kept in memory
+    AVAILABILITY_CACHE_TTL: int = 30  # seconds
+    AVAILABILITY_CACHE_MAXSIZE: int = 4096  # number of (stadium, date) entries
+    # mmap | redis | memory; "memory" is per worker, only for a single worker
+    AVAILABILITY_CACHE_BACKEND: str = "mmap"
+    AVAILABILITY_CACHE_MMAP_PATH: str = "/dev/shm/stadium-matching-availability"  # + ".<slots>x<slot_size>"
+    AVAILABILITY_CACHE_MMAP_SLOTS: int = 2048
+    AVAILABILITY_CACHE_MMAP_SLOT_SIZE: int = 32768  # bytes, larger values are not cached
+    AVAILABILITY_CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    # is_active/is_provider per user id, for the endpoints trusting the token claims (0 = always ask the database)
+    # (same backend kind as the availability cache, in a store of its own)
+    USER_STATUS_CACHE_TTL: int = 30  # seconds
+    USER_STATUS_CACHE_MAXSIZE: int = 10000  # number of users
+    USER_STATUS_CACHE_MMAP_PATH: str = "/dev/shm/stadium-matching-user-status"
+    USER_STATUS_CACHE_MMAP_SLOTS: int = 16384
+    # outbound mail: pooled SMTP connections
+    SMTP_HOST: str = "smtp.gmail.com"
+    SMTP_PORT: int = 465
+    SMTP_SSL: bool = True
+    MAIL_POOL_SIZE: int = 2  # connections
+    # notification outbox, drained by the dispatcher process (python -m app.email.dispatcher)
+    OUTBOX_BATCH_SIZE: int = 100  # notifications locked and sent per round
+    OUTBOX_POLL_INTERVAL: float = 1.0  # seconds to wait once the outbox is drained
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BACKOFF: float = 30.0  # seconds, doubled on every failed attempt
+    NOTIFICATION_DIGEST_WINDOW: float = 60.0  # seconds a digest waits for more entries to the same recipient
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = [
         "http://localhost",
         "http://localhost:4200",
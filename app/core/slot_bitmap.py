@@ -0,0 +1,83 @@
+"""
+24-bit hour bitmaps.
+
+Bit h of a mask is the one-hour session starting at h:00, so a court's day fits
+in one integer and a stadium's day in one array of them. Unions,
+intersections and counts across courts are then single NumPy reductions
+instead of a loop (or a query) per slot.
+"""
+from typing import Iterable, List
+
+import numpy as np
+
+HOURS_PER_DAY = 24
+FULL_DAY = (1 << HOURS_PER_DAY) - 1
+MASK_DTYPE = np.uint32
+
+_HOUR_BITS = np.arange(HOURS_PER_DAY, dtype=MASK_DTYPE)
+
+
+def hours_mask(start_time: int, end_time: int) -> int:
+    """
+    Mask of the sessions in [start_time, end_time), clipped to the day.
+    """
+    start_time, end_time = max(start_time, 0), min(end_time, HOURS_PER_DAY)
+    if end_time <= start_time:
+        return 0
+    return ((1 << (end_time - start_time)) - 1) << start_time
+
+
+def mask_of(hours: Iterable[int]) -> int:
+    mask = 0
+    for hour in hours:
+        if 0 <= hour < HOURS_PER_DAY:
+            mask |= 1 << hour
+    return mask
+
+
+def has_hour(mask: int, hour: int) -> bool:
+    return bool((mask >> hour) & 1)
+
+
+def hours_of(mask: int) -> List[int]:
+    return [hour for hour in range(HOURS_PER_DAY) if (mask >> hour) & 1]
+
+
+def to_array(masks: Iterable[int]) -> np.ndarray:
+    return np.fromiter(masks, dtype=MASK_DTYPE)
+
+
+def union(masks: np.ndarray) -> int:
+    """
+    Sessions set in at least one mask (e.g. some court is free).
+    """
+    return int(np.bitwise_or.reduce(masks)) if masks.size else 0
+
+
+def intersection(masks: np.ndarray) -> int:
+    """
+    Sessions set in every mask (e.g. every court is booked); FULL_DAY for no masks.
+    """
+    return int(np.bitwise_and.reduce(masks)) if masks.size else FULL_DAY
+
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """
+    Number of sessions set in each mask.
+    """
+    return ((masks[..., None] >> _HOUR_BITS) & 1).sum(axis=-1)
+
+
+def count_per_hour(masks: np.ndarray) -> np.ndarray:
+    """
+    Number of masks having each session set, e.g. free courts per hour.
+    """
+    return ((masks[..., None] >> _HOUR_BITS) & 1).sum(axis=0)
+
+
+def sessions_mask(hours: np.ndarray) -> int:
+    """
+    Mask of an array of start hours.
+    """
+    hours = hours[(hours >= 0) & (hours < HOURS_PER_DAY)].astype(MASK_DTYPE)
+    return union(np.left_shift(MASK_DTYPE(1), hours))
@@ -0,0 +1,290 @@
+"""
+Set-based timetable engine.
+
+Instead of probing the database once per (day, hour, court), load the enabled
+courts, the disabled sessions and every order/team of a stadium for the whole
+date window in a few bulk queries, then compute the grid in memory as hour
+bitmaps (see app/core/slot_bitmap.py).
+The per-day state is kept in the availability cache between requests. The
+getters are async: the loaders run on the async connection through run_sync,
+and the cache calls go through `CacheBackend.run`, off the event loop.
+"""
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core import slot_bitmap
+from app.core.availability_cache import availability_cache
+
+# cache kind of DaySlots; change it whenever DaySlots changes shape
+DAY_SLOTS_KIND = "slots-bitmap"
+
+
+class MatchingTeams(NamedTuple):
+    """
+    Teams of the orders occupying a court, one entry per team open to matching (aligned arrays).
+    """
+    start_time: np.ndarray
+    level_requirement: np.ndarray
+    vacancy: np.ndarray
+
+
+class DaySlots(NamedTuple):
+    """
+    Slot state of one stadium for one day, as 24-bit hour masks.
+
+    `occupied[i]` has the hours at which court `court_ids[i]` has an order (the first one decides),
+    `active_mask` the hours with at least one active one-hour order over all courts,
+    `matching` the teams of those first orders that other users may join.
+    """
+    date: date
+    court_ids: List[int]
+    open_hour: int
+    close_hour: int
+    open_mask: int
+    disabled_mask: int
+    active_mask: int
+    occupied: np.ndarray
+    matching: MatchingTeams
+
+
+class RentedCourt(NamedTuple):
+    renter_id: int
+    renter_name: str
+    team_id: int
+    current_member_number: int
+    max_number_of_member: int
+    level_requirement: int
+    is_matching: bool
+
+
+class RentInfoDay(NamedTuple):
+    """
+    Rent info of one stadium for one day.
+
+    `courts` lists the enabled (id, name) of the stadium ordered by id,
+    `rented` maps start_time -> stadium_court_id -> the renter and team of that court.
+    """
+    courts: List[Tuple[int, str]]
+    rented: Dict[int, Dict[int, RentedCourt]]
+
+
+# Longest window the range endpoints compute in one request
+MAX_RANGE_DAYS = 90
+# Days the range endpoints load at a time while streaming
+RANGE_CHUNK_DAYS = 7
+
+
+def _load_window(db: Session, *, stadium_id: int, start_date: date, end_date: date):
+    available_times = crud.stadium_available_time.get_available_times(db=db, stadium_id=stadium_id)
+    court_ids = crud.stadium_court.get_enabled_ids_by_stadium_id(db=db, stadium_id=stadium_id)
+    disabled_sessions = crud.stadium_disable.get_disabled_sessions(
+        db=db, stadium_id=stadium_id, start_date=start_date, end_date=end_date
+    )
+    disabled_hours_by_date: Dict[date, Set[int]] = {}
+    for session_date, hour in disabled_sessions:
+        disabled_hours_by_date.setdefault(session_date, set()).add(hour)
+    return available_times, court_ids, disabled_hours_by_date
+
+
+def load_day_slots(
+    db: Session, *, stadium_id: int, start_date: date, days: int
+) -> List[DaySlots]:
+    """
+    Load the slot state of `days` consecutive days starting at `start_date`.
+    """
+    end_date = start_date + timedelta(days=days)
+    available_times, court_ids, disabled_hours_by_date = _load_window(
+        db, stadium_id=stadium_id, start_date=start_date, end_date=end_date
+    )
+    order_rows = crud.order.get_all_with_team_by_court_ids_and_date_range(
+        db=db, stadium_court_ids=court_ids, start_date=start_date, end_date=end_date
+    )
+
+    court_index = {court_id: i for i, court_id in enumerate(court_ids)}
+    occupied_by_date: Dict[date, List[int]] = {}
+    active_mask_by_date: Dict[date, int] = {}
+    matching_by_date: Dict[date, List[Tuple[int, int, int]]] = {}
+    seen_order_ids = set()
+    for row in order_rows:
+        if row.id in seen_order_ids or not 0 <= row.start_time < slot_bitmap.HOURS_PER_DAY:
+            continue
+        seen_order_ids.add(row.id)
+        bit = 1 << row.start_time
+        if row.status == 1 and row.end_time == row.start_time + 1:
+            active_mask_by_date[row.date] = active_mask_by_date.get(row.date, 0) | bit
+        occupied = occupied_by_date.setdefault(row.date, [0] * len(court_ids))
+        i = court_index[row.stadium_court_id]
+        # only the first order of a court at a given hour counts (rows are ordered by order id)
+        if occupied[i] & bit:
+            continue
+        occupied[i] |= bit
+        if row.is_matching and row.level_requirement is not None:
+            matching_by_date.setdefault(row.date, []).append(
+                (row.start_time, row.level_requirement, row.max_number_of_member - row.current_member_number)
+            )
+
+    open_mask = slot_bitmap.hours_mask(available_times.start_time, available_times.end_time)
+    day_slots = []
+    for i in range(days):
+        current_date = start_date + timedelta(days=i)
+        matching = np.array(matching_by_date.get(current_date, []), dtype=np.int64).reshape(-1, 3)
+        day_slots.append(DaySlots(
+            date=current_date,
+            court_ids=court_ids,
+            open_hour=available_times.start_time,
+            close_hour=available_times.end_time,
+            open_mask=open_mask,
+            disabled_mask=slot_bitmap.mask_of(disabled_hours_by_date.get(current_date, ())),
+            active_mask=active_mask_by_date.get(current_date, 0),
+            occupied=slot_bitmap.to_array(occupied_by_date.get(current_date, [0] * len(court_ids))),
+            matching=MatchingTeams(start_time=matching[:, 0], level_requirement=matching[:, 1], vacancy=matching[:, 2]),
+        ))
+    return day_slots
+
+
+def _lookup_day_slots(stadium_id: int, dates: List[date]) -> Tuple[Dict[date, str], Dict[date, DaySlots]]:
+    versions = availability_cache.versions(stadium_id, dates)
+    return versions, availability_cache.get_many(stadium_id, DAY_SLOTS_KIND, versions)
+
+
+def _store_day_slots(
+    stadium_id: int, loaded: List[DaySlots], versions: Dict[date, str], cached: Dict[date, DaySlots]
+) -> None:
+    for day_slots in loaded:
+        if day_slots.date not in cached:
+            availability_cache.set(stadium_id, day_slots.date, DAY_SLOTS_KIND, day_slots, versions[day_slots.date])
+            cached[day_slots.date] = day_slots
+
+
+async def get_day_slots(
+    db: AsyncSession, *, stadium_id: int, start_date: date, days: int
+) -> List[DaySlots]:
+    """
+    Same as `load_day_slots`, but serve the days found in the availability cache from memory
+    and load only the window spanning the missing ones.
+    """
+    dates = [start_date + timedelta(days=i) for i in range(days)]
+    versions, cached = await availability_cache.backend.run(_lookup_day_slots, stadium_id, dates)
+    missing = [day for day in dates if day not in cached]
+    if missing:
+        loaded = await db.run_sync(
+            load_day_slots, stadium_id=stadium_id, start_date=missing[0], days=(missing[-1] - missing[0]).days + 1
+        )
+        await availability_cache.backend.run(_store_day_slots, stadium_id, loaded, versions, cached)
+    return [cached[day] for day in dates]
+
+
+def load_rent_info_day(db: Session, *, stadium_id: int, day: date) -> RentInfoDay:
+    rows = crud.stadium_court.get_all_with_rent_info(db=db, stadium_id=stadium_id, date=day)
+    courts: Dict[int, str] = {}
+    rented: Dict[int, Dict[int, RentedCourt]] = {}
+    for row in rows:
+        courts.setdefault(row.stadium_court_id, row.stadium_court_name)
+        # keep the first order with a team and a renter; otherwise the court counts as not rented
+        if row.team_id is None or row.renter_name is None:
+            continue
+        rented.setdefault(row.start_time, {}).setdefault(row.stadium_court_id, RentedCourt(
+            renter_id=row.renter_id,
+            renter_name=row.renter_name,
+            team_id=row.team_id,
+            current_member_number=row.current_member_number,
+            max_number_of_member=row.max_number_of_member,
+            level_requirement=row.level_requirement,
+            is_matching=row.is_matching,
+        ))
+    return RentInfoDay(courts=list(courts.items()), rented=rented)
+
+
+def _lookup_rent_info_day(stadium_id: int, day: date) -> Tuple[str, Optional[RentInfoDay]]:
+    version = availability_cache.versions(stadium_id, [day])[day]
+    return version, availability_cache.get(stadium_id, day, "rent_info", version)
+
+
+async def get_rent_info_day(db: AsyncSession, *, stadium_id: int, day: date) -> RentInfoDay:
+    version, rent_info = await availability_cache.backend.run(_lookup_rent_info_day, stadium_id, day)
+    if rent_info is None:
+        rent_info = await db.run_sync(load_rent_info_day, stadium_id=stadium_id, day=day)
+        await availability_cache.backend.run(availability_cache.set, stadium_id, day, "rent_info", rent_info, version)
+    return rent_info
+
+
+def invalidate(stadium_id: int, day: Optional[date] = None) -> None:
+    """
+    Evict the cached slot state of a stadium (one day, or every day if `day` is None).
+    Call it after committing any change to orders, teams, disabled sessions or courts.
+    """
+    availability_cache.invalidate(stadium_id, day)
+
+
+def invalidate_order(db: Session, *, order_id: int) -> None:
+    """
+    Evict the cached slot state of the stadium and date an order belongs to.
+    """
+    order_slot = crud.order.get_stadium_id_and_date(db=db, order_id=order_id)
+    if order_slot is not None:
+        invalidate(order_slot.stadium_id, order_slot.date)
+
+
+def joinable_mask(day: DaySlots, headcount: int, levels: List[int]) -> int:
+    """
+    Hours at which some court is taken by a team with the level and room for `headcount` more people.
+    """
+    selected = np.isin(day.matching.level_requirement, levels) & (day.matching.vacancy >= headcount)
+    return slot_bitmap.sessions_mask(day.matching.start_time[selected])
+
+
+def available_mask(day: DaySlots, headcount: int, levels: List[int]) -> int:
+    """
+    Hours a user can book or join, disabled hours aside.
+    """
+    if not day.court_ids:
+        # no court at all counts as fully booked
+        return 0
+    # an hour without active orders is available; otherwise some court must be free or have a joinable team
+    vacant = slot_bitmap.union(~day.occupied & slot_bitmap.FULL_DAY)
+    free = vacant | joinable_mask(day, headcount, levels)
+    return day.open_mask & (~day.active_mask | free) & slot_bitmap.FULL_DAY
+
+
+def user_slot_status(day: DaySlots, start_time: int, headcount: int, levels: List[int]) -> str:
+    """
+    Status of one hour for a user: "Disabled", "Booked" or "Available".
+    """
+    if slot_bitmap.has_hour(day.disabled_mask, start_time):
+        return "Disabled"
+    return "Available" if slot_bitmap.has_hour(available_mask(day, headcount, levels), start_time) else "Booked"
+
+
+def render_user_day(day: DaySlots, headcount: int, levels: List[int]) -> Dict[str, str]:
+    available = available_mask(day, headcount, levels)
+    return {
+        str(start_time): (
+            "Disabled" if slot_bitmap.has_hour(day.disabled_mask, start_time)
+            else "Available" if slot_bitmap.has_hour(available, start_time)
+            else "Booked"
+        )
+        for start_time in range(day.open_hour, day.close_hour)
+    }
+
+
+def provider_slot_status(day: DaySlots, start_time: int) -> str:
+    """
+    Status of one hour for a provider: "disable", "has_order" or "no_order".
+    """
+    if slot_bitmap.has_hour(day.disabled_mask, start_time):
+        return "disable"
+    if slot_bitmap.has_hour(day.active_mask, start_time):
+        return "has_order"
+    return "no_order"
+
+
+def render_provider_day(day: DaySlots) -> Dict[str, str]:
+    return {
+        str(start_time): provider_slot_status(day, start_time)
+        for start_time in range(day.open_hour, day.close_hour)
+    }
@@ -0,0 +1,68 @@
+"""
+User status cache.
+
+Keeps `is_active` and `is_provider` per user id, so the endpoints that trust
+the claims of a signed token (see `deps.get_async_token_user`) check that the
+user is still active without a database round trip. Entries live for
+USER_STATUS_CACHE_TTL seconds (0 turns the cache off) in a backend of their
+own, of the kind selected by AVAILABILITY_CACHE_BACKEND, under versioned keys
+like the availability entries: `invalidate` after deactivating a user takes
+effect in every worker at once, and a lookup that raced with it is never
+served. A per-worker backend could not see an invalidation made in another
+worker, so with it the cache stays off.
+"""
+from typing import NamedTuple, Optional, Tuple
+
+from app.core.cache_backends import CacheBackend, create_backend
+from app.core.config import settings
+
+# bytes per mmap slot, plenty for a pickled UserStatus
+MMAP_SLOT_SIZE = 128
+
+
+class UserStatus(NamedTuple):
+    is_active: bool
+    is_provider: bool
+
+
+class UserStatusCache:
+    def __init__(self, backend: CacheBackend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl if backend.shared else 0
+
+    def lookup(self, user_id: int) -> Tuple[str, Optional[UserStatus]]:
+        """
+        Current version of a user and the status cached under it, if any.
+        """
+        epoch, generation = self.backend.get_counters(["user-gen", "user-gen:{}".format(user_id)])
+        version = "{}.{}".format(epoch, generation)
+        if not self.ttl:
+            return version, None
+        value = self.backend.get_many(["user:{}:{}".format(user_id, version)])[0]
+        return version, None if value is None else UserStatus(*value)
+
+    def set(self, user_id: int, status: UserStatus, version: str) -> None:
+        if self.ttl:
+            self.backend.set("user:{}:{}".format(user_id, version), tuple(status), self.ttl)
+
+    def invalidate(self, user_id: int) -> None:
+        """
+        Drop the cached status of a user. Call it after committing a change to is_active or is_provider.
+        """
+        self.backend.incr("user-gen:{}".format(user_id))
+
+    def clear(self) -> None:
+        self.backend.incr("user-gen")
+
+
+user_status_cache = UserStatusCache(
+    create_backend(
+        settings.AVAILABILITY_CACHE_BACKEND,
+        maxsize=settings.USER_STATUS_CACHE_MAXSIZE,
+        mmap_path=settings.USER_STATUS_CACHE_MMAP_PATH,
+        mmap_slots=settings.USER_STATUS_CACHE_MMAP_SLOTS,
+        mmap_slot_size=MMAP_SLOT_SIZE,
+        redis_url=settings.AVAILABILITY_CACHE_REDIS_URL,
+    ),
+    ttl=settings.USER_STATUS_CACHE_TTL,
+)
@@ -1,8 +1,9 @@
 from .crud_user import user
-from .crud_stadium import stadium
+from .crud_stadium import stadium, async_stadium
 from .crud_stadium_court import stadium_court
 from .crud_stadium_available_time import stadium_available_time
 from .crud_stadium_disable import stadium_disable
 from .crud_order import order
 from .crud_team import team
-from .crud_team_member import team_member
\ No newline at end of file
+from .crud_team_member import team_member
+from .crud_notification import notification
\ No newline at end of file
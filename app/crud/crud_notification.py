@@ -0,0 +1,104 @@
+from typing import List, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from app.crud.base import CRUDBase
+from app.models.notification import (
+    NOTIFICATION_FAILED,
+    NOTIFICATION_PENDING,
+    NOTIFICATION_SENT,
+    Notification,
+)
+from app.schemas.notification import NotificationCreate, NotificationUpdate
+
+
+class CRUDNotification(CRUDBase[Notification, NotificationCreate, NotificationUpdate]):
+
+    def add(self, db: Session, *, obj_in: NotificationCreate, delay: float = 0) -> List[Notification]:
+        """
+        Put a notification in the outbox, in the transaction of the caller, due in `delay` seconds.
+        A notification with a digest is stored once per recipient. The caller commits.
+        """
+        if obj_in.digest is None:
+            recipient_lists = [list(obj_in.recipients)] if obj_in.recipients else []
+        else:
+            recipient_lists = [[recipient] for recipient in dict.fromkeys(obj_in.recipients)]
+        db_objs = []
+        for recipients in recipient_lists:
+            db_obj = Notification(
+                subject=obj_in.subject,
+                template=obj_in.template,
+                payload=obj_in.payload,
+                recipients=recipients,
+                digest=obj_in.digest,
+            )
+            if delay:
+                db_obj.next_attempt_time = func.now() + func.make_interval(0, 0, 0, 0, 0, 0, delay)
+            db.add(db_obj)
+            db_objs.append(db_obj)
+        return db_objs
+
+    def claim_pending(self, db: Session, *, limit: int) -> List[Notification]:
+        """
+        Lock up to `limit` pending notifications that are due, oldest first.
+        Rows locked by another dispatcher are skipped; the locks last until the caller commits.
+        """
+        return (
+            db.query(Notification)
+            .filter(Notification.status == NOTIFICATION_PENDING, Notification.next_attempt_time <= func.now())
+            .order_by(Notification.next_attempt_time, Notification.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+    def claim_digests(self, db: Session, *, digests: List[str], recipients: List[str]) -> List[Notification]:
+        """
+        Lock the pending notifications with one of the digests to one of the recipients, due or not,
+        oldest first. Rows locked by another dispatcher are skipped.
+        """
+        if not digests or not recipients:
+            return []
+        return (
+            db.query(Notification)
+            .filter(
+                Notification.status == NOTIFICATION_PENDING,
+                Notification.digest.in_(digests),
+                Notification.recipients.in_([[recipient] for recipient in recipients]),
+            )
+            .order_by(Notification.id)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+    def mark_sent(self, db: Session, *, ids: List[int]) -> None:
+        if not ids:
+            return
+        db.execute(
+            update(Notification)
+            .where(Notification.id.in_(ids))
+            .values(status=NOTIFICATION_SENT, attempts=Notification.attempts + 1, sent_time=func.now(), last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    def mark_failed(self, db: Session, *, ids: List[int], error: str, retry_in: Optional[float] = None) -> None:
+        """
+        Record a failed attempt: try again in `retry_in` seconds, or give up if it is None.
+        """
+        if not ids:
+            return
+        values = dict(attempts=Notification.attempts + 1, last_error=error)
+        if retry_in is None:
+            values.update(status=NOTIFICATION_FAILED)
+        else:
+            values.update(next_attempt_time=func.now() + func.make_interval(0, 0, 0, 0, 0, 0, retry_in))
+        db.execute(
+            update(Notification)
+            .where(Notification.id.in_(ids))
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+notification = CRUDNotification(Notification)
@@ -1,7 +1,7 @@
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, join
+from sqlalchemy import func, join, literal, tuple_, update
 from datetime import timedelta, datetime, date
 
 from app.crud.base import CRUDBase
@@ -17,6 +17,17 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
     def get_by_order_id(self, db: Session, *, order_id: int) -> Optional[Order]:
         return db.query(Order).filter(Order.id == order_id).first()
     
+    def get_stadium_id_and_date(self, db: Session, *, order_id: int):
+        """
+        Get (stadium_id, date) of an order, i.e. the availability cache entry it belongs to.
+        """
+        return (
+            db.query(StadiumCourt.stadium_id, Order.date)
+            .join(StadiumCourt, Order.stadium_court_id == StadiumCourt.id)
+            .filter(Order.id == order_id)
+            .first()
+        )
+
     def get_all_by_renter_id(self, db: Session, *, renter_id: int) -> Optional[Order]:
         return db.query(Order).filter(Order.renter_id == renter_id).all()
     
@@ -50,78 +61,60 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
             update_data = obj_in.dict(exclude_unset=True)
         return super().update(db, db_obj=db_obj, obj_in=update_data)
     
-    def is_booked(
-        self, db: Session, *,  stadium_id: int, date: datetime, start_time: int, end_time: int
+    def get_all_with_team_by_court_ids_and_date_range(
+        self, db: Session, *, stadium_court_ids: List[int], start_date: date, end_date: date
     ):
         """
-        Check if the court is booked at a specific time.
+        Get every order (with its team, if any) of the given courts in [start_date, end_date).
         """
-        court_ids_subquery = (
-            db.query(StadiumCourt.id)
-            .filter(StadiumCourt.stadium_id == stadium_id)
-            .filter(StadiumCourt.is_enabled == True)
+        if not stadium_court_ids:
+            return []
+        return (
+            db.query(
+                Order.id, Order.stadium_court_id, Order.date, Order.start_time, Order.end_time,
+                Order.status, Order.is_matching, Team.level_requirement, Team.max_number_of_member,
+                Team.current_member_number
+            )
+            .outerjoin(Team, Order.id == Team.order_id)
+            .filter(
+                Order.stadium_court_id.in_(stadium_court_ids),
+                Order.date >= start_date,
+                Order.date < end_date,
+            )
+            .order_by(Order.id, Team.id)
             .all()
         )
-        
-        court_ids = [court_id for (court_id,) in court_ids_subquery]
-        booked_court_count = (
-            db.query(func.count(Order.stadium_court_id))
+
+    def count_active_by_session(
+        self, db: Session, *, stadium_court_ids: List[int], start_date: date, end_date: date
+    ) -> Dict[Tuple[date, int], int]:
+        """
+        Count active one-hour orders of the given courts per (date, start_time) in [start_date, end_date).
+        """
+        if not stadium_court_ids:
+            return {}
+        counts = (
+            db.query(Order.date, Order.start_time, func.count(Order.id))
             .filter(
-                Order.stadium_court_id.in_(court_ids),
-                Order.date == date,
-                Order.start_time == start_time,
-                Order.end_time == end_time,
+                Order.stadium_court_id.in_(stadium_court_ids),
+                Order.date >= start_date,
+                Order.date < end_date,
+                Order.end_time == Order.start_time + 1,
                 Order.status == 1,
             )
-            .scalar()
-        )
-        if booked_court_count !=0:
-            return('at_least_one_court_be_booked')
-        elif booked_court_count == len(court_ids):
-            return('all_court_be_booked')
-        else:
-            return('none_be_booked')
-    
-    def headcount_and_level_requirement_checking(
-        self, db: Session, *,  stadium_id: int, current_date: datetime, start_time: int, headcount:int, levels:list
-    ):
-        court_available_count = 0
-        court_ids_subquery = (
-            db.query(StadiumCourt.id)
-            .filter(StadiumCourt.stadium_id == stadium_id)
-            .filter(StadiumCourt.is_enabled == True)
+            .group_by(Order.date, Order.start_time)
             .all()
         )
-        court_ids = [court_id for (court_id,) in court_ids_subquery]
-        for court_id in court_ids:
-        # Check if there is an order for the court within the specified time range
-            order = (
-                db.query(Order)
-                .filter(
-                    Order.stadium_court_id == court_id,
-                    Order.date == current_date,
-                    Order.start_time == start_time,
-                )
-                .first()
-            )
-            if order:
-                if order.is_matching == True:
-                    #has order and is_matching,  checking limit about headcount and level
-                    team = db.query(Team).filter(Team.order_id == order.id, Team.level_requirement.in_(levels)).first()
-                    if team:
-                        if (team.max_number_of_member - team.current_member_number) >= headcount:
-                            court_available_count = court_available_count+1
-            else:
-                court_available_count = court_available_count+1
-        if court_available_count>0:
-            return True
-        else:
-            return False
-            
+        return {(order_date, start_time): count for order_date, start_time, count in counts}
+
     def get_user_order_history(
-            self, db: Session, *, user_id: int
+            self, db: Session, *, user_id: int, limit: Optional[int] = None, after: Optional[Tuple[date, int, int]] = None
     ):
-        orders = (
+        """
+        Get the orders rented by user_id ordered by (date, start_time, id), with their team members.
+        Use `after` = (date, start_time, order_id) of the last order of the previous page for keyset pagination.
+        """
+        orders_query = (
             db.query(Order.id, Order.date, Order.start_time, Order.end_time, Stadium.name, Stadium.venue_name, StadiumCourt.name, 
                     Order.status, Team.current_member_number, Team.max_number_of_member
             )
@@ -129,22 +122,33 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
             .join(Stadium, StadiumCourt.stadium_id == Stadium.id)
             .join(Team, Order.id == Team.order_id)
             .filter(Order.renter_id == user_id)
-            .order_by(Order.date, Order.start_time)
-            .all()
         )
+        if after is not None:
+            orders_query = orders_query.filter(tuple_(Order.date, Order.start_time, Order.id) > tuple_(*after))
+        orders_query = orders_query.order_by(Order.date, Order.start_time, Order.id)
+        if limit is not None:
+            orders_query = orders_query.limit(limit)
+        orders = orders_query.all()
 
-        order_history = []
-        for order in orders:
+        # Fetch the team members of all orders at once, keyed by order id
+        team_members_by_order_id = {}
+        if orders:
             team_members = (
-                db.query(User.name, User.email)
+                db.query(Team.order_id, User.name, User.email)
                 .join(TeamMember, User.id == TeamMember.user_id)
                 .join(Team, TeamMember.team_id == Team.id)
-                .filter(Team.order_id == order[0])
+                .filter(Team.order_id.in_([order[0] for order in orders]))
                 .filter(TeamMember.status == 1)
                 .filter(TeamMember.user_id != user_id)
+                .order_by(Team.order_id, TeamMember.id)
                 .all()
             )
-            team_member_data = [{'name': name, 'email': email} for name, email in team_members]
+            for order_id, name, email in team_members:
+                team_members_by_order_id.setdefault(order_id, []).append({'name': name, 'email': email})
+
+        order_history = []
+        for order in orders:
+            team_member_data = team_members_by_order_id.get(order[0], [])
 
             if order[7] == 1:
                 status = "已核准"
@@ -182,15 +186,69 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
     def cancel_order_by_id(
             self, db: Session, *, order_id: int
     ):
+        """
+        Set the order cancelled. The caller commits.
+        """
         order = db.query(Order).filter(Order.id == order_id).first()
         if order:
             order.status = 0
-            db.commit()
-            db.refresh(order)
+            db.flush()
             return order
         else:
             return None
         
+    def cancel_by_stadium_sessions(
+            self, db: Session, *, stadium_id: int, sessions: List[Tuple[date, int]]
+    ) -> List[int]:
+        """
+        Cancel the active orders on the enabled courts of a stadium at any of the (date, start_time) sessions,
+        with one UPDATE. Return the ids of the cancelled orders. The caller commits.
+        """
+        if not sessions:
+            return []
+        cancelled = db.execute(
+            update(Order)
+            .where(
+                Order.stadium_court_id == StadiumCourt.id,
+                StadiumCourt.stadium_id == stadium_id,
+                StadiumCourt.is_enabled == True,
+                tuple_(Order.date, Order.start_time).in_(sessions),
+                Order.status == 1,
+            )
+            .values(status=0)
+            .returning(Order.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        return sorted(cancelled)
+
+    def get_member_emails_by_order_ids(self, db: Session, *, order_ids: List[int]):
+        """
+        Get (order_id, date, start_time, stadium_court_name, email) of the active team members and the renter
+        of every order in order_ids, in one query; the renter comes last for each order.
+        """
+        if not order_ids:
+            return []
+        members = (
+            db.query(Order.id, Order.date, Order.start_time, StadiumCourt.name, User.email, literal(0).label("is_renter"))
+            .join(StadiumCourt, Order.stadium_court_id == StadiumCourt.id)
+            .join(Team, Team.order_id == Order.id)
+            .join(TeamMember, TeamMember.team_id == Team.id)
+            .join(User, TeamMember.user_id == User.id)
+            .filter(Order.id.in_(order_ids), TeamMember.status == 1)
+        )
+        renters = (
+            db.query(Order.id, Order.date, Order.start_time, StadiumCourt.name, User.email, literal(1).label("is_renter"))
+            .join(StadiumCourt, Order.stadium_court_id == StadiumCourt.id)
+            .join(User, Order.renter_id == User.id)
+            .filter(Order.id.in_(order_ids))
+        )
+        rows = members.union_all(renters).all()
+        return [
+            (order_id, order_date, start_time, stadium_court_name, email)
+            for order_id, order_date, start_time, stadium_court_name, email, _ in sorted(rows, key=lambda row: (row[0], row[5]))
+            if email is not None
+        ]
+
     def get_order_member_email(
             self, db: Session, *, order_id:int
     ):
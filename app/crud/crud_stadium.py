@@ -1,12 +1,12 @@
-from typing import Any, Dict, Optional, Union, List
+from typing import Any, Dict, Optional, Tuple, Union, List
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import and_, func
 
 from app import crud
-from app.crud.base import CRUDBase
+from app.crud.base import AsyncCRUDBase, CRUDBase
 
 from app.models.stadium_court import StadiumCourt
 from app.models.team import Team
@@ -29,63 +29,72 @@ class CRUDStadium(CRUDBase[Stadium, StadiumCreate, StadiumUpdate]):
             db.query(Stadium).filter(Stadium.id == stadium_id).first()
         )
     
+    def get_by_stadium_ids(
+        self, db: Session, *, stadium_ids: List[int]
+    ) -> List[Stadium]:
+        if not stadium_ids:
+            return []
+        return (
+            db.query(Stadium).filter(Stadium.id.in_(stadium_ids)).order_by(Stadium.id).all()
+        )
+
     def get_by_stadium_court_id(
         self, db: Session, *, stadium_court_id: int
     ) -> Optional[Stadium]:
         return (
             db.query(Stadium).join(StadiumCourt, StadiumCourt.stadium_id == Stadium.id).filter(StadiumCourt.id == stadium_court_id).first()
         )
-    
-    # get current people in stadium
-    def get_stadium_current_people_count(
-        self,
-        db: Session, *, 
-        stadium_id: int, 
-    ) -> Any:
-        
-    # Get the stadium_court_ids for the given stadium_id
-        stadium_court_ids = (
-            db.query(StadiumCourt.id)
-            .filter(StadiumCourt.stadium_id == stadium_id)
-            .filter(StadiumCourt.is_enabled == True)
-            .all()
-        )
-        
-        if not stadium_court_ids:
-            return None
 
-        # Extract the ids as a list
-        stadium_court_ids = [court_id for (court_id,) in stadium_court_ids]
-        number_of_courts = len(stadium_court_ids)
+    # get enabled court count and current people of many stadiums at once
+    def get_stadiums_occupancy(
+        self,
+        db: Session, *,
+        stadium_ids: List[int],
+    ) -> Dict[int, Tuple[int, int]]:
+        """
+        Return {stadium_id: (current_people_count, number_of_courts)} in one grouped query.
+        Stadiums without enabled courts are left out.
+        """
+        if not stadium_ids:
+            return {}
 
         # Get the current date and time
         current_datetime = datetime.now(tz=ZoneInfo("Asia/Taipei"))
-        # test_date = date(2023, 11, 17)
-        # test_hour = 10
 
-        # Get the sum of current_member_number for the selected orders and teams
-        current_people_count = (
-            db.query(func.sum(Team.current_member_number))
-            .join(Order, Team.order_id == Order.id)
-            .filter(Order.stadium_court_id.in_(stadium_court_ids))
-            .filter(Order.date == current_datetime.date())
-            .filter(Order.start_time <= current_datetime.hour)
-            .filter(Order.end_time > current_datetime.hour)
-            # .filter(Order.date == test_date)
-            # .filter(Order.start_time <= test_hour)
-            # .filter(Order.end_time > test_hour)
-            .filter(Order.status == 1)  # Assuming status 1 represents an active order
-            .scalar() or 0  # If there are no records, return 0
+        occupancy = (
+            db.query(
+                StadiumCourt.stadium_id,
+                func.coalesce(func.sum(Team.current_member_number), 0),
+                func.count(func.distinct(StadiumCourt.id)),
+            )
+            .outerjoin(
+                Order,
+                and_(
+                    Order.stadium_court_id == StadiumCourt.id,
+                    Order.date == current_datetime.date(),
+                    Order.start_time <= current_datetime.hour,
+                    Order.end_time > current_datetime.hour,
+                    Order.status == 1,  # Assuming status 1 represents an active order
+                ),
+            )
+            .outerjoin(Team, Team.order_id == Order.id)
+            .filter(StadiumCourt.stadium_id.in_(stadium_ids))
+            .filter(StadiumCourt.is_enabled == True)
+            .group_by(StadiumCourt.stadium_id)
+            .all()
         )
-
-
-        return current_people_count, number_of_courts
+        return {
+            stadium_id: (current_people_count, number_of_courts)
+            for stadium_id, current_people_count, number_of_courts in occupancy
+        }
 
     def get_stadium_list(
             self, 
             db: Session, 
             *, 
             user_id: int,
+            skip: int = 0,
+            limit: Optional[int] = None,
     ) -> Optional[List[StadiumList]]:
         selected_columns = (Stadium.id ,Stadium.name, Stadium.venue_name, Stadium.picture, Stadium.area, Stadium.max_number_of_people)
         # return all stadium
@@ -94,6 +103,9 @@ class CRUDStadium(CRUDBase[Stadium, StadiumCreate, StadiumUpdate]):
         if user_id:
             stadiums_query = stadiums_query.filter(Stadium.created_user == user_id)
 
+        stadiums_query = stadiums_query.order_by(Stadium.id).offset(skip)
+        if limit is not None:
+            stadiums_query = stadiums_query.limit(limit)
         stadiums = stadiums_query.all()
             
         return stadiums
@@ -136,4 +148,5 @@ class CRUDStadium(CRUDBase[Stadium, StadiumCreate, StadiumUpdate]):
             update_data = obj_in.dict(exclude_unset=True)
         return super().update(db, db_obj=db_obj, obj_in=update_data)
     
-stadium = CRUDStadium(Stadium)
\ No newline at end of file
+stadium = CRUDStadium(Stadium)
+async_stadium = AsyncCRUDBase[Stadium, StadiumCreate, StadiumUpdate](Stadium)
\ No newline at end of file
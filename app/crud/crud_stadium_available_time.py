@@ -58,5 +58,16 @@ class CRUDStadiumAvailableTime (CRUDBase[StadiumAvailableTime, StadiumAvailableT
             .first()
         )
         return available_times
+
+    def get_available_times_of_stadiums(self, db: Session):
+        """
+        Get (stadium_id, start_time, end_time) of every stadium with available times, ordered by stadium_id.
+        """
+        return (
+            db.query(StadiumAvailableTime.stadium_id, StadiumAvailableTime.start_time, StadiumAvailableTime.end_time)
+            .distinct(StadiumAvailableTime.stadium_id)
+            .order_by(StadiumAvailableTime.stadium_id, StadiumAvailableTime.id)
+            .all()
+        )
     
 stadium_available_time = CRUDStadiumAvailableTime(StadiumAvailableTime)
\ No newline at end of file
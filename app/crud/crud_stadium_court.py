@@ -1,11 +1,20 @@
-from typing import Any, Dict, Optional, Union
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+from sqlalchemy import Date, DateTime, and_, case, cast, exists, func, literal, or_, true, tuple_
 from sqlalchemy.orm import Session
 
 from app import crud
 from app.crud.base import CRUDBase
 
+from app.models.order import Order
+from app.models.stadium import Stadium
+from app.models.stadium_available_time import StadiumAvailableTime
 from app.models.stadium_court import StadiumCourt
+from app.models.stadium_disable import StadiumDisable
+from app.models.team import Team
+from app.models.team_member import TeamMember
+from app.models.user import User
 from app.schemas.stadium_court import (
     StadiumCourtCreate,
     StadiumCourtUpdate
@@ -33,7 +42,149 @@ class CRUDStadiumCourt(CRUDBase[StadiumCourt, StadiumCourtCreate, StadiumCourtUp
                 db.query(StadiumCourt).filter(StadiumCourt.stadium_id == stadium_id).all()
             )
 
+    def get_enabled_ids_by_stadium_id(
+        self, db: Session, *, stadium_id: int
+    ) -> List[int]:
+        court_ids = (
+            db.query(StadiumCourt.id)
+            .filter(StadiumCourt.stadium_id == stadium_id, StadiumCourt.is_enabled == True)
+            .order_by(StadiumCourt.id)
+            .all()
+        )
+        return [court_id for (court_id,) in court_ids]
+
+    def get_all_enabled_ids_with_stadium_id(self, db: Session) -> List[Tuple[int, int]]:
+        """
+        Get (id, stadium_id) of every enabled court, ordered by id.
+        """
+        return (
+            db.query(StadiumCourt.id, StadiumCourt.stadium_id)
+            .filter(StadiumCourt.is_enabled == True)
+            .order_by(StadiumCourt.id)
+            .all()
+        )
     
+    def get_all_with_rent_info(
+        self, db: Session, *, stadium_id: int, date: Any, start_time: Optional[int] = None
+    ):
+        """
+        Get every enabled court of a stadium with its active orders, teams and renters
+        (all None if the court is not rented) on a date, or at a specific time of it, in one query.
+        """
+        order_filter = and_(
+            Order.stadium_court_id == StadiumCourt.id,
+            Order.date == date,
+            Order.status != 0,
+        )
+        if start_time is not None:
+            order_filter = and_(order_filter, Order.start_time == start_time)
+        return (
+            db.query(
+                StadiumCourt.id.label('stadium_court_id'), StadiumCourt.name.label('stadium_court_name'),
+                Order.id.label('order_id'), Order.start_time, Order.renter_id, User.name.label('renter_name'),
+                Team.id.label('team_id'), Team.current_member_number, Team.max_number_of_member,
+                Team.level_requirement, Order.is_matching
+            )
+            .outerjoin(Order, order_filter)
+            .outerjoin(Team, Order.id == Team.order_id)
+            .outerjoin(User, Order.renter_id == User.id)
+            .filter(StadiumCourt.stadium_id == stadium_id, StadiumCourt.is_enabled == True)
+            .order_by(StadiumCourt.id, Order.id, Team.id)
+            .all()
+        )
+
+    def get_free_courts(
+        self, db: Session, *, stadium_id: int, date: Any, start_time: int
+    ):
+        """
+        Get (id, name) of the enabled courts of a stadium without an active order at a specific time.
+        """
+        active_order = exists().where(
+            Order.stadium_court_id == StadiumCourt.id,
+            Order.date == date,
+            Order.start_time == start_time,
+            Order.status == 1,
+        )
+        return (
+            db.query(StadiumCourt.id, StadiumCourt.name)
+            .filter(StadiumCourt.stadium_id == stadium_id, StadiumCourt.is_enabled == True, ~active_order)
+            .order_by(StadiumCourt.id)
+            .all()
+        )
+
+    def search_slots(
+        self, db: Session, *, start_date: date, end_date: date, start_hour: int, end_hour: int,
+        headcount: int, levels: List[int], user_id: Optional[int] = None, limit: Optional[int] = None,
+        after: Optional[Tuple[date, int, int, int]] = None
+    ):
+        """
+        Get the (court, date, start_time) sessions in [start_date, end_date] x [start_hour, end_hour)
+        where headcount people can rent a free court or join an open team of one of the levels.
+
+        Rows are ranked by (date, start_time, kind, stadium_court_id) with kind 0 for a team to join
+        and 1 for a free court; use `after` = that key of the last row of the previous page for keyset
+        pagination. Teams rented or joined by user_id are left out. Every session of every enabled
+        court is looked up once through the unique index of active orders.
+        """
+        day_offset = func.generate_series(0, (end_date - start_date).days).table_valued("value").render_derived(name="day_offset")
+        hour = func.generate_series(start_hour, end_hour - 1).table_valued("value").render_derived(name="hour")
+        session_date = cast(literal(start_date, Date) + day_offset.c.value, Date)
+        session_start = cast(session_date, DateTime) + func.make_interval(0, 0, 0, 0, hour.c.value)
+        kind = case((Order.id.is_(None), 1), else_=0)
+
+        is_open = exists().where(
+            StadiumAvailableTime.stadium_id == StadiumCourt.stadium_id,
+            StadiumAvailableTime.start_time <= hour.c.value,
+            StadiumAvailableTime.end_time > hour.c.value,
+        )
+        is_disabled = exists().where(
+            StadiumDisable.stadium_id == StadiumCourt.stadium_id,
+            StadiumDisable.period.overlaps(func.tsrange(session_start, session_start + func.make_interval(0, 0, 0, 0, 1))),
+        )
+        joinable_team = and_(
+            Order.is_matching == True,
+            Team.level_requirement.in_(levels),
+            Team.max_number_of_member - Team.current_member_number >= headcount,
+        )
+        if user_id is not None:
+            joinable_team = and_(
+                joinable_team,
+                Order.renter_id != user_id,
+                ~exists().where(TeamMember.team_id == Team.id, TeamMember.user_id == user_id, TeamMember.status == 1),
+            )
+
+        slots_query = (
+            db.query(
+                StadiumCourt.stadium_id, Stadium.name.label('stadium_name'), StadiumCourt.id.label('stadium_court_id'),
+                StadiumCourt.name.label('stadium_court_name'), session_date.label('date'), hour.c.value.label('start_time'),
+                kind.label('kind'), Team.id.label('team_id'), Team.current_member_number, Team.max_number_of_member,
+                Team.level_requirement
+            )
+            .select_from(StadiumCourt)
+            .join(Stadium, StadiumCourt.stadium_id == Stadium.id)
+            .join(day_offset, true())
+            .join(hour, true())
+            .outerjoin(Order, and_(
+                Order.stadium_court_id == StadiumCourt.id,
+                Order.date == session_date,
+                Order.start_time == hour.c.value,
+                Order.status == 1,
+            ))
+            .outerjoin(Team, Order.id == Team.order_id)
+            .filter(StadiumCourt.is_enabled == True, is_open, ~is_disabled)
+            .filter(or_(and_(Order.id.is_(None), Stadium.max_number_of_people >= headcount), joinable_team))
+        )
+        if after is not None:
+            # the (date, start_time) bound prunes sessions before any order lookup
+            slots_query = slots_query.filter(
+                tuple_(session_date, hour.c.value) >= tuple_(after[0], after[1]),
+                tuple_(session_date, hour.c.value, kind, StadiumCourt.id) > tuple_(*after),
+            )
+        slots_query = slots_query.order_by(session_date, hour.c.value, kind, StadiumCourt.id)
+        if limit is not None:
+            slots_query = slots_query.limit(limit)
+        return slots_query.all()
+
     def create(self, db: Session, *, name: str, stadium_id: int) -> StadiumCourt:
         db_obj = StadiumCourt(
             stadium_id=stadium_id,
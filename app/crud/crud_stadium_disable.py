@@ -1,11 +1,14 @@
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects.postgresql import Range, insert
 from sqlalchemy.orm import Session
 from datetime import timedelta, datetime, date
 
 from app import crud
 from app.crud.base import CRUDBase
 
+from app.models.stadium import Stadium
 from app.models.stadium_disable import StadiumDisable
 from app.schemas.stadium_disable import (
     StadiumDisableCreate,
@@ -14,6 +17,27 @@ from app.schemas.stadium_disable import (
 )
 
 
+def _session_start(day: Union[date, str], hour: int) -> datetime:
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+
+
+def _sessions_between(start: datetime, end: datetime):
+    """
+    (date, start_time) of every one-hour session overlapping [start, end).
+    """
+    current = start.replace(minute=0, second=0, microsecond=0)
+    while current < end:
+        yield current.date(), current.hour
+        current += timedelta(hours=1)
+
+
+def _lock_stadium(db: Session, stadium_id: int) -> None:
+    # closures of a stadium are rewritten one caller at a time, so a merge or trim sees every closure it affects
+    db.query(Stadium.id).filter(Stadium.id == stadium_id).with_for_update().first()
+
+
 class CRUDStadiumDisable(CRUDBase[StadiumDisable, StadiumDisableCreate, StadiumDisableUpdate]):
     
     def get_all_by_stadium_id(
@@ -26,35 +50,121 @@ class CRUDStadiumDisable(CRUDBase[StadiumDisable, StadiumDisableCreate, StadiumD
     def get_by_stadium_id_and_session(
          self, db: Session, *, obj_in: StadiumDisableInDBBase
     ) -> Optional[StadiumDisable]:
+        """
+        Get the closure covering a session, if any.
+        """
         return (
             db.query(StadiumDisable)
-            .filter_by(StadiumDisable.stadium_id==obj_in.stadium_id, StadiumDisable.date==obj_in.date, 
-                       StadiumDisable.start_time==obj_in.start_time, StadiumDisable.end_time==obj_in.end_time).first()
-        )           
+            .filter(
+                StadiumDisable.stadium_id == obj_in.stadium_id,
+                StadiumDisable.period.overlaps(Range(
+                    _session_start(obj_in.date, obj_in.start_time), _session_start(obj_in.date, obj_in.end_time)
+                )),
+            )
+            .first()
+        )
 
     
     def create(self, db: Session, *, obj_in: StadiumDisableCreate) -> StadiumDisable:
-        
-        db_obj = StadiumDisable(
+        self.disable_period(
+            db,
             stadium_id=obj_in.stadium_id,
-            date=obj_in.date,
-            start_time=obj_in.start_time,
-            end_time=obj_in.start_time+1,
+            start=_session_start(obj_in.date, obj_in.start_time),
+            end=_session_start(obj_in.date, obj_in.start_time + 1),
         )
-        db.add(db_obj)
         db.commit()
-        db.refresh(db_obj)
-        return db_obj
+        return self.get_by_stadium_id_and_session(
+            db, obj_in=StadiumDisableInDBBase(
+                stadium_id=obj_in.stadium_id, date=obj_in.date, start_time=obj_in.start_time, end_time=obj_in.start_time + 1
+            )
+        )
 
-    
-    def delete_by_stadium_id_and_session(self, db: Session, *, stadium_id: int, date: date, start_time: int) -> StadiumDisable:
+
+    def disable_period(self, db: Session, *, stadium_id: int, start: datetime, end: datetime) -> List[Range]:
+        """
+        Close the stadium from start up to end, merged with the closures it overlaps or touches into one row.
+        Return the periods of those previous closures. The caller commits.
+        """
+        _lock_stadium(db, stadium_id)
+        period = Range(start, end)
+        merged = db.execute(
+            delete(StadiumDisable)
+            .where(
+                StadiumDisable.stadium_id == stadium_id,
+                or_(StadiumDisable.period.overlaps(period), StadiumDisable.period.adjacent_to(period)),
+            )
+            .returning(StadiumDisable.period)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.add(StadiumDisable(
+            stadium_id=stadium_id,
+            period=Range(min([start] + [x.lower for x in merged]), max([end] + [x.upper for x in merged])),
+        ))
+        db.flush()
+        return merged
+
+    def undisable_period(self, db: Session, *, stadium_id: int, start: datetime, end: datetime) -> List[Range]:
+        """
+        Reopen the stadium from start up to end, trimming or splitting the closures it overlaps.
+        Return the parts of them that were removed. The caller commits.
+        """
+        if end <= start:
+            return []
+        _lock_stadium(db, stadium_id)
+        period = Range(start, end)
+        removed = db.execute(
+            delete(StadiumDisable)
+            .where(StadiumDisable.stadium_id == stadium_id, StadiumDisable.period.overlaps(period))
+            .returning(StadiumDisable.period)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        remaining = []
+        for closure in removed:
+            if closure.lower < start:
+                remaining.append({"stadium_id": stadium_id, "period": Range(closure.lower, start)})
+            if closure.upper > end:
+                remaining.append({"stadium_id": stadium_id, "period": Range(end, closure.upper)})
+        if remaining:
+            db.execute(insert(StadiumDisable).values(remaining))
+        return [Range(max(closure.lower, start), min(closure.upper, end)) for closure in removed]
+
+    def get_sessions_in_periods(
+        self, periods: List[Range], stadium_open_hour: int, stadium_close_hour: int
+    ) -> List[Tuple[date, int]]:
+        """
+        Every (date, start_time) within the opening hours that overlaps one of the periods.
+        """
+        return sorted({
+            (session_date, start_time)
+            for period in periods
+            for session_date, start_time in _sessions_between(period.lower, period.upper)
+            if stadium_open_hour <= start_time < stadium_close_hour
+        })
+
+    def has_time_slots(
+        self, start_date: date, start_time: int, end_date: date, end_time: int, stadium_open_hour: int, stadium_close_hour: int
+    ) -> bool:
+        """
+        Whether generate_time_slots would return any session, without generating them.
+        """
+        current_datetime = datetime.combine(start_date, datetime.min.time()) + timedelta(hours=start_time)
+        end_datetime = datetime.combine(end_date, datetime.min.time()) + timedelta(hours=end_time)
+        # a whole day covers every hour, so look at most 24 hours ahead
+        end_datetime = min(end_datetime, current_datetime + timedelta(days=1))
+        while current_datetime < end_datetime:
+            if stadium_open_hour <= current_datetime.hour < stadium_close_hour:
+                return True
+            current_datetime += timedelta(hours=1)
+        return False
+
+    def delete_by_stadium_id_and_session(self, db: Session, *, stadium_id: int, date: date, start_time: int):
         #in update stadium page, if update stadium_court, call this 
-        stadium_disable = db.query(StadiumDisable).filter_by(stadium_id=stadium_id, date=date, 
-                                                                start_time=start_time).first()
-        if stadium_disable is not None:
-            db.delete(stadium_disable)
+        removed = self.undisable_period(
+            db, stadium_id=stadium_id, start=_session_start(date, start_time), end=_session_start(date, start_time + 1)
+        )
+        if removed:
             db.commit()
-            return stadium_disable
+            return removed
         else:
             return None
     
@@ -65,15 +175,62 @@ class CRUDStadiumDisable(CRUDBase[StadiumDisable, StadiumDisableCreate, StadiumD
         Check if the stadium is disabled at a specific time.
         """
         return (
-            db.query(StadiumDisable)
+            db.query(StadiumDisable.id)
             .filter(
                 StadiumDisable.stadium_id == stadium_id,
-                StadiumDisable.date == date,
-                StadiumDisable.start_time == start_time,
+                StadiumDisable.period.overlaps(Range(_session_start(date, start_time), _session_start(date, start_time + 1))),
             )
             .first() is not None
         )
     
+    def get_disabled_periods(
+        self, db: Session, *, stadium_id: int, start: datetime, end: datetime
+    ) -> List[Range]:
+        """
+        Get the closures of a stadium overlapping [start, end).
+        """
+        if end <= start:
+            return []
+        periods = (
+            db.query(StadiumDisable.period)
+            .filter(StadiumDisable.stadium_id == stadium_id, StadiumDisable.period.overlaps(Range(start, end)))
+            .all()
+        )
+        return [period for (period,) in periods]
+
+    def get_all_disabled_sessions(
+        self, db: Session, *, start_date: date, end_date: date
+    ) -> Set[Tuple[int, date, int]]:
+        """
+        Get every disabled (stadium_id, date, start_time) of all stadiums in [start_date, end_date).
+        """
+        start, end = _session_start(start_date, 0), _session_start(end_date, 0)
+        if end <= start:
+            return set()
+        periods = (
+            db.query(StadiumDisable.stadium_id, StadiumDisable.period)
+            .filter(StadiumDisable.period.overlaps(Range(start, end)))
+            .all()
+        )
+        return {
+            (stadium_id, *session)
+            for stadium_id, period in periods
+            for session in _sessions_between(max(period.lower, start), min(period.upper, end))
+        }
+
+    def get_disabled_sessions(
+        self, db: Session, *, stadium_id: int, start_date: date, end_date: date
+    ) -> Set[Tuple[date, int]]:
+        """
+        Get every disabled (date, start_time) of a stadium in [start_date, end_date).
+        """
+        start, end = _session_start(start_date, 0), _session_start(end_date, 0)
+        return {
+            session
+            for period in self.get_disabled_periods(db, stadium_id=stadium_id, start=start, end=end)
+            for session in _sessions_between(max(period.lower, start), min(period.upper, end))
+        }
+
     def generate_time_slots(self, start_date: date, start_time: int, end_date: date, end_time: int, stadium_open_hour: int, stadium_close_hour: int):
     
 
@@ -1,6 +1,7 @@
 from typing import Any, Dict, Optional, Union
 from app.schemas.order import OrderWithTeamInfoMessage
 
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 
 from app.crud.base import CRUDBase
@@ -41,15 +42,19 @@ class CRUDTeam(CRUDBase[Team, TeamCreate, TeamUpdate]):
         db.commit()
         return True
     
-    def decrease_current_member_number(self, db: Session,* , team_id: int) -> bool:
-        team = db.query(Team).filter(Team.id == team_id).first()
-        if not team:
-            return False  # Team not found
-        # Decrease current_member_number by 1
-        team.current_member_number -= 1
-        # Commit the changes to the database
-        db.commit()
-        return True
+    def add_members(self, db: Session, *, team_id: int, number: int):
+        """
+        Add `number` to current_member_number in one conditional UPDATE, only if the team has room for them.
+        Return the updated (id, order_id, max_number_of_member, current_member_number, level_requirement),
+        or None if the team does not exist or is too full. The caller commits.
+        """
+        return db.execute(
+            update(Team)
+            .where(Team.id == team_id, Team.current_member_number + number <= Team.max_number_of_member)
+            .values(current_member_number=Team.current_member_number + number)
+            .returning(Team.id, Team.order_id, Team.max_number_of_member, Team.current_member_number, Team.level_requirement)
+            .execution_options(synchronize_session=False)
+        ).first()
 
 
 team = CRUDTeam(Team)
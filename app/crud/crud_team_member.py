@@ -1,5 +1,7 @@
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Set, Union
 
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 from app.crud.base import CRUDBase
@@ -19,6 +21,59 @@ class CRUDTeamMember(CRUDBase[TeamMember, TeamMemberCreate, TeamMemberUpdate]):
     def get_all_by_user_id(self, db: Session, *, user_id: int) -> Optional[TeamMember]:
         return db.query(TeamMember).filter(TeamMember.user_id == user_id).all()
 
+    def get_joined_team_ids(self, db: Session, *, user_id: int, team_ids: List[int]) -> Set[int]:
+        """
+        Return the subset of team_ids the user has a TeamMember row in.
+        """
+        if not team_ids:
+            return set()
+        joined_team_ids = (
+            db.query(TeamMember.team_id)
+            .filter(TeamMember.user_id == user_id, TeamMember.team_id.in_(team_ids))
+            .distinct()
+            .all()
+        )
+        return {team_id for (team_id,) in joined_team_ids}
+
+    def get_active_members_by_team_ids(
+        self, db: Session, *, team_ids: List[int], exclude_user_id: Optional[int] = None
+    ) -> Dict[int, List[Dict[str, str]]]:
+        """
+        Get the name and email of the active members of every team in team_ids, keyed by team id.
+        """
+        if not team_ids:
+            return {}
+        query = (
+            db.query(TeamMember.team_id, User.name, User.email)
+            .join(User, TeamMember.user_id == User.id)
+            .filter(TeamMember.team_id.in_(team_ids))
+            .filter(TeamMember.status == 1)
+        )
+        if exclude_user_id is not None:
+            query = query.filter(TeamMember.user_id != exclude_user_id)
+        members_by_team_id = {}
+        for team_id, name, email in query.order_by(TeamMember.team_id, TeamMember.id).all():
+            members_by_team_id.setdefault(team_id, []).append({"name": name, "email": email})
+        return members_by_team_id
+
+    def activate_members(self, db: Session, *, team_id: int, user_ids: List[int]) -> List[int]:
+        """
+        Upsert an active TeamMember row for every user, and return the ids of the users who were
+        not active members of the team before. The caller commits.
+        """
+        if not user_ids:
+            return []
+        # sorted, so concurrent joins with overlapping users lock the rows in the same order
+        stmt = insert(TeamMember).values(
+            [{"team_id": team_id, "user_id": user_id, "status": 1} for user_id in sorted(set(user_ids))]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TeamMember.team_id, TeamMember.user_id],
+            set_={"status": 1},
+            where=TeamMember.status != 1,
+        ).returning(TeamMember.user_id)
+        return db.execute(stmt).scalars().all()
+
     def create(self, db: Session, *, obj_in: TeamMemberCreate) -> TeamMember:
         db_obj = TeamMember(
             team_member_id = obj_in.team_member_id,
@@ -48,20 +103,27 @@ class CRUDTeamMember(CRUDBase[TeamMember, TeamMemberCreate, TeamMemberUpdate]):
         return True
     
     def leave_team(self, db=Session, *, team_id:int, user_id: int):
-        rows_affected = (
-            db.query(TeamMember)
-            .filter(TeamMember.team_id == team_id, TeamMember.user_id == user_id)
-            .update({"status": 0})
+        """
+        Set the membership of the user inactive and decrease current_member_number of the team by 1,
+        in one statement and only if the user was an active member.
+        Return the updated (id, order_id, current_member_number) of the team, or None if nothing changed.
+        The caller commits.
+        """
+        left_member = (
+            update(TeamMember)
+            .where(TeamMember.team_id == team_id, TeamMember.user_id == user_id, TeamMember.status == 1)
+            .values(status=0)
+            .returning(TeamMember.team_id)
+            .cte("left_member")
         )
-
-        # Commit the changes to the database
-        db.commit()
-
-        # Check if the update was successful (at least one row affected)
-        if rows_affected > 0:
-            return True
-        else:
-            return False
+        updated_team = db.execute(
+            update(Team)
+            .where(Team.id.in_(select(left_member.c.team_id)))
+            .values(current_member_number=Team.current_member_number - 1)
+            .returning(Team.id, Team.order_id, Team.current_member_number)
+            .execution_options(synchronize_session=False)
+        ).first()
+        return updated_team
         
     def get_all_team_member_email_by_team_id(self, db=Session, *, team_id:int):
         # team_members = db.query(TeamMember).filter(TeamMember.team_id == team_id).all()
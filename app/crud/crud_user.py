@@ -4,6 +4,7 @@ from typing import Any, Dict, Optional, Union, List
 from sqlalchemy.orm import Session
 
 from app.core.security import get_password_hash, verify_password
+from app.core.user_status_cache import user_status_cache
 from app.crud.base import CRUDBase
 from app.models.user import User
 from app.schemas.user import UserCreate, UserUpdate
@@ -57,7 +58,15 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             hashed_password = get_password_hash(update_data["password"])
             del update_data["password"]
             update_data["hashed_password"] = hashed_password
-        return super().update(db, db_obj=db_obj, obj_in=update_data)
+        updated = super().update(db, db_obj=db_obj, obj_in=update_data)
+        user_status_cache.invalidate(updated.id)
+        return updated
+
+    def deactivate(self, db: Session, *, db_obj: User) -> User:
+        """
+        Deactivate a user. Endpoints trusting the token claims reject them from the next request on.
+        """
+        return self.update(db, db_obj=db_obj, obj_in={"is_active": False})
 
     def authenticate(self, db: Session, *, email: str, password: str) -> Optional[User]:
         user = self.get_by_email(db, email=email)
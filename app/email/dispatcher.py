@@ -0,0 +1,180 @@
+"""
+Outbox dispatcher.
+
+A standalone process (`python -m app.email.dispatcher`) that drains the
+Notification outbox. Request handlers only insert rows, in the transaction of
+the change they notify about, so a notification exists if and only if the
+change was committed, and it survives restarts of the API workers.
+
+Each round locks a batch of due notifications with SELECT ... FOR UPDATE SKIP
+LOCKED, so several dispatchers can run side by side without taking the same
+rows, renders them (app/email/notifications.py), delivers them over pooled
+SMTP connections and records the outcome in
+the same transaction. A due notification with a digest takes along every
+pending one of the same digest to the same recipient, due or not, and they go
+out as one mail listing all of them. Delivery is at least once: a dispatcher dying between
+sending and committing leaves its rows pending for the next round.
+"""
+import signal
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.core.config import settings
+from app.database.session import SessionLocal
+from app.email.mailer import Mail, Mailer, is_temporary, mailer as default_mailer
+from app.email import notifications as templates
+from app.models.notification import Notification
+
+# longest wait between two attempts of a notification, in seconds
+MAX_RETRY_DELAY = 3600
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        mailer: Mailer,
+        *,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = 100,
+        max_attempts: int = 5,
+        retry_backoff: float = 30.0,
+        poll_interval: float = 1.0,
+    ):
+        self.mailer = mailer
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+
+    def retry_delay(self, notification: Notification, error: Exception) -> Optional[float]:
+        """
+        Seconds to wait before the next attempt, or None to give up.
+        """
+        if not is_temporary(error) or notification.attempts + 1 >= self.max_attempts:
+            return None
+        return min(self.retry_backoff * 2 ** notification.attempts, MAX_RETRY_DELAY)
+
+    @staticmethod
+    def render(notification: Notification) -> Tuple[str, str]:
+        if notification.template is None:
+            # queued before the templates, already rendered
+            return notification.subject, notification.content
+        return templates.render(notification.template, notification.payload)
+
+    def dispatch_once(self) -> int:
+        """
+        Deliver one batch of due notifications. Return the number of notifications handled.
+        """
+        db = self.session_factory()
+        try:
+            notifications = crud.notification.claim_pending(db, limit=self.batch_size)
+            digested = [x for x in notifications if x.digest is not None]
+            if digested:
+                claimed_ids = {x.id for x in notifications}
+                notifications.extend(
+                    x for x in crud.notification.claim_digests(
+                        db,
+                        digests=list({x.digest for x in digested}),
+                        recipients=list({x.recipients[0] for x in digested}),
+                    )
+                    if x.id not in claimed_ids
+                )
+
+            # the entries of a digest to one recipient go out as one message
+            by_digest: Dict[Tuple[str, str], List[Notification]] = {}
+            for notification in notifications:
+                if notification.digest is not None:
+                    by_digest.setdefault((notification.digest, notification.recipients[0]), []).append(notification)
+            # and the same message to several people as one envelope
+            by_content: Dict[Tuple[str, str], List[Notification]] = {}
+            unrenderable: List[Tuple[List[Notification], Exception]] = []
+            for notification in notifications:
+                if notification.digest is None:
+                    try:
+                        by_content.setdefault(self.render(notification), []).append(notification)
+                    except Exception as e:
+                        unrenderable.append(([notification], e))
+            for (digest, _), entries in by_digest.items():
+                entries.sort(key=lambda x: x.id)
+                try:
+                    message = templates.render_digest(digest, [(x.template, x.payload) for x in entries])
+                except Exception as e:
+                    unrenderable.append((entries, e))
+                else:
+                    by_content.setdefault(message, []).extend(entries)
+            for group, e in unrenderable:
+                logger.error("fail to render {} notification(s): {!r}", len(group), e)
+                crud.notification.mark_failed(db, ids=[x.id for x in group], error=repr(e))
+
+            sent_ids = []
+            for (subject, content), group in by_content.items():
+                # a large group goes out as several envelopes; only the notifications with a recipient
+                # in an undelivered one are retried, so the delivered envelopes are not sent again
+                delivered = set()
+                error = None
+                for envelope in Mailer.group([Mail(subject, content, tuple(x.recipients)) for x in group]):
+                    try:
+                        self.mailer.deliver(envelope)
+                    except Exception as e:
+                        logger.error("fail to send {!r} to {} recipient(s): {}", subject, len(envelope.recipients), e)
+                        # leave the rest of the group for the next attempt too
+                        error = e
+                        break
+                    delivered.update(envelope.recipients)
+                for notification in group:
+                    if delivered.issuperset(notification.recipients):
+                        sent_ids.append(notification.id)
+                    else:
+                        crud.notification.mark_failed(
+                            db, ids=[notification.id], error=str(error), retry_in=self.retry_delay(notification, error)
+                        )
+            crud.notification.mark_sent(db, ids=sent_ids)
+            db.commit()
+            return len(notifications)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def run(self, stop: Optional[threading.Event] = None) -> None:
+        """
+        Dispatch until `stop` is set, waiting `poll_interval` seconds whenever the outbox is drained.
+        """
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                try:
+                    handled = self.dispatch_once()
+                except Exception as e:
+                    logger.exception("outbox dispatch failed: {}", e)
+                    handled = 0
+                if handled < self.batch_size:
+                    stop.wait(self.poll_interval)
+        finally:
+            self.mailer.close()
+
+
+def main() -> None:
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    dispatcher = OutboxDispatcher(
+        default_mailer,
+        batch_size=settings.OUTBOX_BATCH_SIZE,
+        max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+        retry_backoff=settings.OUTBOX_RETRY_BACKOFF,
+        poll_interval=settings.OUTBOX_POLL_INTERVAL,
+    )
+    logger.info("outbox dispatcher started")
+    dispatcher.run(stop)
+    logger.info("outbox dispatcher stopped")
+
+
+if __name__ == "__main__":
+    main()
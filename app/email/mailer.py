@@ -0,0 +1,194 @@
+"""
+Outbound mail.
+
+Notifications of the API go through the outbox table and are delivered by the
+dispatcher process (app/email/dispatcher.py) with `Mailer.deliver`, which
+replaced the in-memory queue and worker threads mails used to go through.
+Messages with the same subject and body are merged into one envelope with all
+their recipients (recipients never see each other, the To header is not set),
+and every envelope goes over persistent SMTP connections taken from a small
+pool instead of a new TLS handshake and login per message.
+"""
+import os
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from email.mime.text import MIMEText
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+
+# most servers accept at least 100 recipients per envelope
+MAX_RECIPIENTS_PER_MESSAGE = 100
+
+
+class Mail(NamedTuple):
+    subject: str
+    html: str
+    recipients: Tuple[str, ...]
+
+
+class SMTPConnectionPool:
+    """
+    Up to `size` logged-in SMTP connections, reused across messages.
+
+    A connection idle for more than `max_idle` seconds is probed with NOOP before reuse;
+    a broken one is dropped and replaced by a new connection.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        *,
+        use_ssl: bool = True,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        size: int = 2,
+        timeout: float = 10.0,
+        max_idle: float = 30.0,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        # connections are never shared with the process this one was forked from
+        self._pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(self.size)
+        # (connection, released at)
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        connection = smtp_class(self.host, self.port, timeout=self.timeout)
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    @staticmethod
+    def _close(connection: smtplib.SMTP) -> None:
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    def _take_idle(self) -> Optional[smtplib.SMTP]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if not self._idle:
+                return None
+            connection, released_at = self._idle.pop()
+        if self._timer() - released_at > self.max_idle:
+            try:
+                connection.noop()
+            except (smtplib.SMTPException, OSError):
+                connection.close()
+                return None
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection. If the block raises, the connection is closed instead of returned.
+        """
+        slots = self._slots
+        slots.acquire()
+        try:
+            connection = self._take_idle() or self._connect()
+            try:
+                yield connection
+            except BaseException:
+                connection.close()
+                raise
+            with self._lock:
+                self._idle.append((connection, self._timer()))
+        finally:
+            slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._close(connection)
+
+
+def is_temporary(error: Exception) -> bool:
+    """
+    Whether a delivery error is worth retrying later (4xx replies, dropped connections, timeouts).
+    """
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    # dropped or refused connections, timeouts
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class Mailer:
+    def __init__(
+        self,
+        pool: SMTPConnectionPool,
+        *,
+        sender: str,
+    ):
+        self.pool = pool
+        self.sender = sender
+
+    @staticmethod
+    def group(batch: Sequence[Mail]) -> List[Mail]:
+        """
+        Merge the messages with the same subject and body, in order, into envelopes of
+        at most MAX_RECIPIENTS_PER_MESSAGE distinct recipients.
+        """
+        recipients_by_content: Dict[Tuple[str, str], Dict[str, None]] = {}
+        for mail in batch:
+            recipients_by_content.setdefault((mail.subject, mail.html), {}).update(dict.fromkeys(mail.recipients))
+        envelopes = []
+        for (subject, html), recipients in recipients_by_content.items():
+            recipients = list(recipients)
+            for i in range(0, len(recipients), MAX_RECIPIENTS_PER_MESSAGE):
+                envelopes.append(Mail(subject, html, tuple(recipients[i:i + MAX_RECIPIENTS_PER_MESSAGE])))
+        return envelopes
+
+    def deliver(self, mail: Mail) -> None:
+        """
+        Deliver one envelope now, in a single attempt. Raise if the server does not take it.
+        """
+        message = MIMEText(mail.html, "html")
+        message["Subject"] = mail.subject
+        message["From"] = self.sender
+        with self.pool.connection() as connection:
+            refused = connection.sendmail(self.sender, list(mail.recipients), message.as_string())
+        if refused:
+            logger.warning("{!r} refused for {}", mail.subject, ", ".join(refused))
+
+    def close(self) -> None:
+        """
+        Close the pooled connections.
+        """
+        self.pool.close()
+
+
+mailer = Mailer(
+    SMTPConnectionPool(
+        settings.SMTP_HOST,
+        settings.SMTP_PORT,
+        use_ssl=settings.SMTP_SSL,
+        username=settings.ADMIN_NAME,
+        password=settings.ADMIN_PASSWORD,
+        size=settings.MAIL_POOL_SIZE,
+    ),
+    sender=settings.ADMIN_EMAIL,
+)
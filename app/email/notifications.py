@@ -0,0 +1,79 @@
+"""
+Notification templates.
+
+A notification is the name of a template and a small JSON payload: that is
+what the outbox stores, and the dispatcher renders it when sending. The Jinja2
+templates of app/email/templates are compiled once, when this module is
+imported, so rendering a message only runs compiled template code.
+"""
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template
+from markupsafe import Markup
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), "templates")
+
+# digests: the pending notifications of one kind to one recipient are sent as one mail
+ORDER_CANCELLED_DIGEST = "order_cancelled"
+
+# payload values are escaped; a missing one is an error instead of an empty string
+_environment = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, undefined=StrictUndefined, auto_reload=False
+)
+
+
+class NotificationTemplate(NamedTuple):
+    subject: str
+    template: Template
+    # digest the notification is merged into; its template must have an `entry` block
+    digest: Optional[str] = None
+
+
+def _template(subject: str, file_name: str, digest: Optional[str] = None) -> NotificationTemplate:
+    return NotificationTemplate(subject, _environment.get_template(file_name), digest)
+
+
+TEMPLATES: Dict[str, NotificationTemplate] = {
+    "rent_success": _template("Stadium Matching - 成功租借場地通知", "rent_success.html"),
+    "join_success": _template("Stadium Matching - 成功加入隊伍通知", "join_success.html"),
+    "new_member": _template("Stadium Matching - 新隊員加入隊伍通知", "new_member.html"),
+    "member_left": _template("Stadium Matching - 成員退出通知", "member_left.html"),
+    "order_cancelled": _template("Stadium Matching - 訂單取消通知", "order_cancelled.html"),
+    "venue_disabled": _template("Stadium Matching - 訂單取消通知", "venue_disabled.html", ORDER_CANCELLED_DIGEST),
+    "capacity_reduced": _template("Stadium Matching - 訂單取消通知", "capacity_reduced.html", ORDER_CANCELLED_DIGEST),
+    "court_removed": _template("Stadium Matching - 訂單取消通知", "court_removed.html", ORDER_CANCELLED_DIGEST),
+}
+
+DIGESTS: Dict[str, NotificationTemplate] = {
+    ORDER_CANCELLED_DIGEST: _template("Stadium Matching - 訂單取消通知", "cancellation_digest.html"),
+}
+
+
+def render(name: str, payload: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Subject and html of a notification.
+    """
+    notification = TEMPLATES[name]
+    return notification.subject, notification.template.render(payload)
+
+
+def render_entry(name: str, payload: Dict[str, Any]) -> Markup:
+    """
+    The `entry` block of a notification, as listed in a digest.
+    """
+    template = TEMPLATES[name].template
+    return Markup("".join(template.blocks["entry"](template.new_context(payload))))
+
+
+def render_digest(digest: str, entries: List[Tuple[str, Dict[str, Any]]]) -> Tuple[str, str]:
+    """
+    Subject and html of the mail listing the (template name, payload) entries of a digest;
+    a single entry is sent as the notification itself.
+    """
+    if len(entries) == 1:
+        return render(*entries[0])
+    notification = DIGESTS[digest]
+    return notification.subject, notification.template.render(
+        entries=[render_entry(name, payload) for name, payload in entries]
+    )
@@ -11,4 +11,8 @@ class LevelRequirement(MultiValueEnum):
 
 class RentStatus(enum.Enum):
     Approved = 1
-    Cancelled = 0
\ No newline at end of file
+    Cancelled = 0
+
+class JoinListPeriod(str, enum.Enum):
+    upcoming = "upcoming"
+    past = "past"
\ No newline at end of file
@@ -11,6 +11,7 @@ from starlette.requests import Request
 from starlette.responses import HTMLResponse
 
 from app.core.config import settings
+from app.database.session import async_engine
 from app.routers.api_v1.api import api_router
 from app.utils import get_tw_time
 
@@ -51,6 +52,12 @@ if os.environ.get("ENV") == "dev":
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+@app.on_event("shutdown")
+async def dispose_async_engine():
+    # close the asyncpg pool of this worker
+    await async_engine.dispose()
+
+
 @app.get("/api/healthchecker")
 def read_root():
     return {"msg": "Hello World"}
@@ -5,4 +5,5 @@ from .stadium_court import StadiumCourt
 from .stadium import Stadium
 from .team_member import TeamMember
 from .team import Team
-from .user import User
\ No newline at end of file
+from .user import User
+from .notification import Notification
\ No newline at end of file
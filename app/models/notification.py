@@ -0,0 +1,43 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.sql import func
+from app.database.base_class import Base
+
+
+# status of a notification in the outbox
+NOTIFICATION_PENDING = 0
+NOTIFICATION_SENT = 1
+NOTIFICATION_FAILED = 2
+
+
+class Notification(Base):
+    """
+    Outbox of the mail to send, written in the transaction of the change it notifies about
+    and delivered by the dispatcher (app/email/dispatcher.py).
+    """
+    __tablename__ = "Notification"
+    __table_args__ = (
+        # the dispatcher takes the pending notifications that are due, oldest first
+        Index("ix_notification_pending_due", "next_attempt_time", "id", postgresql_where=text("status = 0")),
+        # pending notifications to merge into the digest of a recipient
+        Index(
+            "ix_notification_pending_digest", "digest", "recipients",
+            postgresql_where=text("status = 0 AND digest IS NOT NULL"),
+        ),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subject = Column(String, nullable=False)
+    # template name and payload, rendered by app/email/notifications.py when sending
+    template = Column(String)
+    payload = Column(JSONB)
+    # html of the notifications queued before the templates
+    content = Column(String)
+    recipients = Column(ARRAY(String), nullable=False)
+    # kind of digest: the pending notifications of one kind to one recipient go out as one mail
+    digest = Column(String)
+    status = Column(Integer, nullable=False, default=NOTIFICATION_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_time = Column(DateTime(timezone=True), nullable=False, default=func.now())
+    last_error = Column(String)
+    created_time = Column(DateTime(timezone=True), default=func.now())
+    sent_time = Column(DateTime(timezone=True))
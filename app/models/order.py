@@ -1,11 +1,23 @@
-from sqlalchemy import Boolean, Column, Date, DateTime, Integer, ForeignKey
+from sqlalchemy import Boolean, Column, Date, DateTime, Index, Integer, ForeignKey, text
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.sql import func
 from app.database.base_class import Base
 
 
+# at most one active order per court and session; the rent path matches IntegrityErrors on this name
+ACTIVE_ORDER_SLOT_INDEX = "uq_order_active_court_date_start"
+
+
 class Order(Base):
     __tablename__ = "Order"
+    __table_args__ = (
+        # availability checks: orders of a court at a date/hour with a given status
+        Index("ix_order_court_date_start_status", "stadium_court_id", "date", "start_time", "status"),
+        # the same lookups restricted to active orders, which also forbids double booking
+        Index(ACTIVE_ORDER_SLOT_INDEX, "stadium_court_id", "date", "start_time", unique=True, postgresql_where=text("status = 1")),
+        # order history of a renter, in keyset pagination order
+        Index("ix_order_renter_date_start_id", "renter_id", "date", "start_time", "id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     stadium_court_id = Column(
         Integer,
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean
+from sqlalchemy import Column, Index, Integer, String, ForeignKey, Boolean, text
 from sqlalchemy.sql import func
 from app.database.base_class import Base
 
 
 class StadiumCourt(Base):
     __tablename__ = "StadiumCourt"
+    __table_args__ = (
+        # enabled courts of a stadium
+        Index("ix_stadium_court_enabled_stadium", "stadium_id", postgresql_where=text("is_enabled = true")),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     stadium_id = Column(
         Integer,
@@ -1,16 +1,30 @@
-from sqlalchemy import Column, Date, Integer, ForeignKey
+from sqlalchemy import Column, Index, Integer, ForeignKey, text
+from sqlalchemy.dialects.postgresql import TSRANGE, ExcludeConstraint
 from sqlalchemy.sql import func
 from app.database.base_class import Base
 
 
 class StadiumDisable(Base):
     __tablename__ = "StadiumDisable"
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    __table_args__ = (
+        # closures overlapping a time window
+        Index("ix_stadium_disable_period", "period", postgresql_using="gist"),
+        Index("ix_stadium_disable_stadium_id", "stadium_id"),
+        # closures of a stadium never overlap; int4range keeps the equality on stadium_id in plain GiST (no btree_gist)
+        ExcludeConstraint(
+            (text("int4range(stadium_id, stadium_id, '[]')"), "="),
+            ("period", "&&"),
+            name="ex_stadium_disable_stadium_period",
+            using="gist",
+        ),
+    )
+    id = Column(
+        Integer, primary_key=True, autoincrement=True
+    )
     stadium_id = Column(
         Integer,
         ForeignKey("Stadium.id", ondelete="CASCADE"),
         nullable=False
     )
-    date = Column(Date, nullable=False)
-    start_time = Column(Integer, nullable=False)
-    end_time = Column(Integer, nullable=False)
\ No newline at end of file
+    # one closure of the stadium: [start, end) in local time, on the hour
+    period = Column(TSRANGE, nullable=False)
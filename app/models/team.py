@@ -1,10 +1,13 @@
-from sqlalchemy import Column, DateTime, Integer, String, ForeignKey
+from sqlalchemy import Column, DateTime, Index, Integer, String, ForeignKey
 from sqlalchemy.sql import func
 from app.database.base_class import Base
 
 
 class Team(Base):
     __tablename__ = "Team"
+    __table_args__ = (
+        Index("ix_team_order_id", "order_id"),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     order_id = Column(
         Integer,
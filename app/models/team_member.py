@@ -1,10 +1,14 @@
-from sqlalchemy import Column, DateTime, Integer, String, ForeignKey
+from sqlalchemy import Column, DateTime, Index, Integer, String, ForeignKey
 from sqlalchemy.sql import func
 from app.database.base_class import Base
 
 
 class TeamMember(Base):
     __tablename__ = "TeamMember"
+    __table_args__ = (
+        # one membership row per user and team, (re)activated by upsert on join
+        Index("uq_team_member_team_user", "team_id", "user_id", unique=True),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     team_id = Column(
         Integer,
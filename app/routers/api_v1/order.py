@@ -1,36 +1,56 @@
 import json
 from typing import Any, Optional
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, date
 
 import requests
-from fastapi import APIRouter, Depends, HTTPException, Response, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 #from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session,joinedload
 
 from app import crud, models, schemas
-from app.core import security
+from app.core import security, timetable
 from app.core.config import settings
 from app.routers import deps
+from app.utils import decode_cursor, encode_cursor
 import traceback
-from app.email.send_email import send_email_background
+from app.email.send_email import queue_email
 
 
 router = APIRouter()
 
 
 @router.post("/my-rent-list/", response_model=schemas.OrderRentResponse)
-def get_rent_list(
-    db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_active_user)
+async def get_rent_list(
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: schemas.TokenUser = Depends(deps.get_async_token_user),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None
 ):
-    rent_list = crud.order.get_user_order_history(db=db, user_id=current_user.id)
+    """
+    Retrieve the orders rented by current_user, one page at a time.
+    Pass the returned next_cursor to get the next page; next_cursor is None on the last page.
+    """
+    after = None
+    if cursor:
+        try:
+            cursor_date, cursor_start_time, cursor_order_id = decode_cursor(cursor)
+            after = (date.fromisoformat(cursor_date), int(cursor_start_time), int(cursor_order_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
 
+    # fetch one extra order to know whether there is a next page
+    rent_list = await db.run_sync(crud.order.get_user_order_history, user_id=current_user.id, limit=limit + 1, after=after)
+    next_cursor = None
+    if len(rent_list) > limit:
+        rent_list = rent_list[:limit]
+        last_order = rent_list[-1]
+        next_cursor = encode_cursor(last_order["order_time"], last_order["start_time"], last_order["order_id"])
     
-    return {"orders": rent_list}
+    return {"orders": rent_list, "next_cursor": next_cursor}
 
 @router.post("/order-cancel", response_model=schemas.OrderCancelResponse)
 def cancel_order(
-    background_tasks: BackgroundTasks,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
     order_id: int = None
@@ -42,17 +62,20 @@ def cancel_order(
         order_info = crud.order.get_by_order_id(db=db, order_id=order_id)
         stadium_info = crud.stadium.get_by_stadium_court_id(db=db, stadium_court_id=order_info.stadium_court_id)
         stadium_court_info = crud.stadium_court.get_by_stadium_court_id(db=db, stadium_court_id=order_info.stadium_court_id)
+        order = schemas.NotificationOrder(
+            date=order_info.date,
+            start_time=order_info.start_time,
+            end_time=order_info.end_time,
+            stadium=stadium_info.name,
+            venue=stadium_info.venue_name,
+            court=stadium_court_info.name,
+        )
         for email in team_member_emails:
-            send_email_background(
-                background_tasks,
-                '訂單取消通知',
-                '您的訂單已被取消！<br><br>'
-                '訂單資訊：<br>'
-                '日期: ' + str(order_info.date) + '<br>'
-                '時間: ' + str(order_info.start_time) + ':00-' + str(order_info.start_time + 1) + ':00<br>'
-                '地點: ' + stadium_info.name + ' ' + stadium_info.venue_name + ' ' + stadium_court_info.name ,
-                [str(email)]
-            )
+            queue_email(db, 'order_cancelled', {'order': order}, [str(email)])
+        # the cancellation and its notifications commit together
+        db.commit()
+        db.refresh(cancel_result)
+        timetable.invalidate_order(db=db, order_id=order_id)
 
     else:
         raise HTTPException(status_code=400, detail="Order is not available to cancel.")
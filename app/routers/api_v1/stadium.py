@@ -3,16 +3,19 @@ from typing import Any, Optional
 from datetime import timedelta, datetime, date
 
 import requests
-from fastapi import APIRouter, Depends, HTTPException, Response, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 #from loguru import logger
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import crud, models, schemas
-from app.core import security
+from app.core import availability_grid, security, timetable
 from app.core.config import settings
 from app.routers import deps
 from app.enums import LevelRequirement
-from app.email.send_email import send_email_background
+from app.email.send_email import queue_email
 from app.models.stadium import Stadium
 from app.models.stadium_available_time import StadiumAvailableTime
 from app.models.stadium_court import StadiumCourt
@@ -25,15 +28,15 @@ router = APIRouter()
 
 
 @router.post("/timetable/", response_model=schemas.StadiumAvailabilityResponse)
-def get_stadium_availability(
+async def get_stadium_availability(
     stadium_id: int,
     query_date: str,
     headcount: int,
     level_requirement: str,
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_async_db)
 ):
     try:
-        stadium = crud.stadium.get_by_stadium_id(db=db, stadium_id=stadium_id)
+        stadium = await crud.async_stadium.get(db, id=stadium_id)
         if not stadium:
             raise HTTPException(status_code=404, detail="Stadium not found")
 
@@ -47,50 +50,20 @@ def get_stadium_availability(
             "message": "success",
             "data": [],
         }
-        available_times = crud.stadium_available_time.get_available_times(
-            db=db, stadium_id=stadium_id
+        # Load the slot state of the next 7 days (from the availability cache or in bulk), then compute the grid in memory
+        # (the loaders run on the async connection through run_sync, the cache calls off the event loop)
+        levels = [level.values[1] for level in LevelRequirement if level_requirement.upper() in level.name]
+        day_slots = await timetable.get_day_slots(
+            db, stadium_id=stadium_id, start_date=query_date.date(), days=7
         )
-
-        # Iterate over the next 7 days
-        for i in range(7):
-            current_date = query_date + timedelta(days=i)
-            availability_data = {"day_{}".format(i + 1): {}}
-            # Iterate over the available time slots in a day
-            for start_time in range(available_times.start_time, available_times.end_time):   
-                end_time = start_time + 1
-
-                #先看這個時段有沒有被disable
-                # Check if the stadium is disabled at this time
-                is_disabled = crud.stadium_disable.is_disabled(
-                    db=db, stadium_id=stadium_id, date=current_date, start_time=start_time
-                )
-
-                if is_disabled:
-                    availability_data["day_{}".format(i + 1)][str(start_time)] = "Disabled"
-                else:
-                    # Check if the court is booked at this time
-                    # 看該時段之下，該stadium之下的所有stadium court是否被借走
-                    # 如果至少還有一個可以被租借（沒有order紀錄）則 Available
-                    booking_result = crud.order.is_booked(
-                        db=db, stadium_id=stadium_id, date=current_date, start_time=start_time, end_time=end_time
-                    )
-                    levels = [level.values[1] for level in LevelRequirement if level_requirement.upper() in level.name]
-                    headcount_and_level_checking_result = crud.order.headcount_and_level_requirement_checking(
-                        db=db, stadium_id=stadium_id, current_date=current_date, start_time=start_time, headcount= headcount, levels = levels
-                    )
-                    if booking_result == 'all_court_be_booked':
-                        availability_data["day_{}".format(i + 1)][str(start_time)] = "Booked"
-                    elif booking_result == 'none_be_booked':
-                        availability_data["day_{}".format(i + 1)][str(start_time)] = "Available"
-                    elif booking_result == 'at_least_one_court_be_booked':
-                        if headcount_and_level_checking_result==True:
-                            availability_data["day_{}".format(i + 1)][str(start_time)] = "Available"
-                        else:
-                            availability_data["day_{}".format(i + 1)][str(start_time)] = "Booked"
+        for i, day in enumerate(day_slots):
+            availability_data = {"day_{}".format(i + 1): timetable.render_user_day(day, headcount, levels)}
             response_data["data"].append(availability_data)
 
         return response_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         print('Error:', e)
         traceback.print_exc()
@@ -98,16 +71,16 @@ def get_stadium_availability(
     
 
 @router.post("/providertimetable/", response_model=schemas.StadiumAvailabilityResponse)
-def get_stadium_availability_for_provider(
+async def get_stadium_availability_for_provider(
     stadium_id: int,
     query_date: str,
-    db: Session = Depends(deps.get_db)
+    db: AsyncSession = Depends(deps.get_async_db)
 ):
     #有訂單/可下架/已下架 下架單位是stadium
     #已下架->已經被disable
     #有訂單->該stadium 之下的所有 stadium court ，至少有一個stadium court有該時段的訂單
     try:
-        stadium = crud.stadium.get_by_stadium_id(db=db, stadium_id=stadium_id)
+        stadium = await crud.async_stadium.get(db, id=stadium_id)
         if not stadium:
             raise HTTPException(status_code=404, detail="Stadium not found")
 
@@ -121,44 +94,85 @@ def get_stadium_availability_for_provider(
             "message": "success",
             "data": [],
         }
-        available_times = crud.stadium_available_time.get_available_times(
-            db=db, stadium_id=stadium_id
+        # Fetch the slot state of the whole week once (shared with the user timetable through the availability cache)
+        day_slots = await timetable.get_day_slots(
+            db, stadium_id=stadium_id, start_date=query_date.date(), days=7
         )
-        # Iterate over the next 7 days
-        for i in range(7):
-            current_date = query_date + timedelta(days=i)
-            availability_data = {"day_{}".format(i + 1): {}}
-            # Iterate over the available time slots in a day
-            for start_time in range(available_times.start_time, available_times.end_time):  
-                end_time = start_time + 1
-                #先看這個時段有沒有被disable
-                # Check if the stadium is disabled at this time
-                is_disabled = crud.stadium_disable.is_disabled(
-                    db=db, stadium_id=stadium_id, date=current_date, start_time=start_time
-                )
-
-                if is_disabled:
-                    availability_data["day_{}".format(i + 1)][str(start_time)] = "disable"
-                else:
-                    # Check if the court is booked at this time
-                    result = crud.order.is_booked(
-                        db=db, stadium_id=stadium_id, date=current_date, start_time=start_time, end_time=end_time
-                    )
-
-                    if result=='at_least_one_court_be_booked':
-                        availability_data["day_{}".format(i + 1)][str(start_time)] = "has_order"
-                    else:
-                        availability_data["day_{}".format(i + 1)][str(start_time)] = "no_order"
+        for i, day in enumerate(day_slots):
+            availability_data = {"day_{}".format(i + 1): timetable.render_provider_day(day)}
             response_data["data"].append(availability_data)
 
         return response_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         print('Error:', e)
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
 
+async def _get_range_days(stadium_id: int, start_date: date, end_date: date, db: AsyncSession) -> int:
+    stadium = await crud.async_stadium.get(db, id=stadium_id)
+    if not stadium:
+        raise HTTPException(status_code=404, detail="Stadium not found")
+    days = (end_date - start_date).days + 1
+    if days <= 0 or days > timetable.MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid date range. end_date must be within {} days after start_date.".format(timetable.MAX_RANGE_DAYS),
+        )
+    return days
+
+
+async def _stream_days(db: AsyncSession, stadium_id: int, start_date: date, days: int, render):
+    # one NDJSON line per day, loaded a week at a time so the first week is sent before the last one is computed
+    for offset in range(0, days, timetable.RANGE_CHUNK_DAYS):
+        day_slots = await timetable.get_day_slots(
+            db, stadium_id=stadium_id, start_date=start_date + timedelta(days=offset),
+            days=min(timetable.RANGE_CHUNK_DAYS, days - offset),
+        )
+        for day in day_slots:
+            yield json.dumps({"date": day.date.isoformat(), "timetable": render(day)}) + "\n"
+
+
+@router.post("/timetable/range/")
+async def get_stadium_availability_in_range(
+    stadium_id: int,
+    start_date: date,
+    end_date: date,
+    headcount: int,
+    level_requirement: str,
+    db: AsyncSession = Depends(deps.get_async_db)
+):
+    """
+    Stream the user timetable from start_date to end_date (inclusive) as NDJSON, one day per line.
+    """
+    days = await _get_range_days(stadium_id, start_date, end_date, db)
+    levels = [level.values[1] for level in LevelRequirement if level_requirement.upper() in level.name]
+    return StreamingResponse(
+        _stream_days(db, stadium_id, start_date, days, lambda day: timetable.render_user_day(day, headcount, levels)),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/providertimetable/range/")
+async def get_stadium_availability_for_provider_in_range(
+    stadium_id: int,
+    start_date: date,
+    end_date: date,
+    db: AsyncSession = Depends(deps.get_async_db)
+):
+    """
+    Stream the provider timetable from start_date to end_date (inclusive) as NDJSON, one day per line.
+    """
+    days = await _get_range_days(stadium_id, start_date, end_date, db)
+    return StreamingResponse(
+        _stream_days(db, stadium_id, start_date, days, timetable.render_provider_day),
+        media_type="application/x-ndjson",
+    )
+
+
 @router.post("/create", response_model=schemas.stadium_court.StadiumCourtCreateWithMessage)
 def create_stadium(
     *,
@@ -198,21 +212,26 @@ def create_stadium(
 
 
 @router.get("/stadium-list/", response_model=schemas.stadium.StadiumListMessage)
-def get_stadium_list_with_created_user(
-    db: Session = Depends(deps.get_db),
+async def get_stadium_list_with_created_user(
+    db: AsyncSession = Depends(deps.get_async_db),
+    created_user: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
 ) -> Any:
     """
     Retrieve stadium list w/ or w/o created_user.
     """
     try:
               
-        stadiums = crud.stadium.get_stadium_list(db=db, user_id=None)
+        stadiums = await db.run_sync(crud.stadium.get_stadium_list, user_id=created_user, skip=skip, limit=limit)
+        # enabled court count and current people of all listed stadiums in one query
+        occupancy = await db.run_sync(
+            crud.stadium.get_stadiums_occupancy, stadium_ids=[stadium_id for stadium_id, *_ in stadiums]
+        )
 
         stadiums_data = []
         for stadium_id, name, venue_name, picture, area,  max_number_of_people in stadiums:
-            current_people_count, number_of_courts = crud.stadium.get_stadium_current_people_count(
-            db=db, stadium_id=stadium_id
-            )
+            current_people_count, number_of_courts = occupancy.get(stadium_id, (0, 0))
             stadiums_data.append({'stadium_id': stadium_id, 'name': name, 'venue_name': venue_name, 'picture': picture, 'area': area, 
                                   'max_number_of_people': max_number_of_people*number_of_courts, 'current_people_count': current_people_count})
             
@@ -223,6 +242,39 @@ def get_stadium_list_with_created_user(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
+@router.get("/available-list/", response_model=schemas.stadium.StadiumAvailableListMessage)
+async def get_available_stadium_list(
+    query_date: date,
+    level_requirement: str,
+    start_time: int = Query(..., ge=0, lt=24),
+    headcount: int = Query(..., ge=1),
+    db: AsyncSession = Depends(deps.get_async_db),
+) -> Any:
+    """
+    Retrieve every stadium with a court to rent or a team to join at query_date, start_time
+    for headcount people at level_requirement, from one availability grid of all stadiums.
+    """
+    try:
+        levels = [level.values[1] for level in LevelRequirement if level_requirement.upper() in level.name]
+        grid = await db.run_sync(availability_grid.load_grid, start_date=query_date, days=1)
+        free_court_counts = dict(availability_grid.free_stadiums(
+            grid, day=query_date, start_time=start_time, headcount=headcount, levels=levels
+        ))
+        stadiums = await db.run_sync(crud.stadium.get_by_stadium_ids, stadium_ids=list(free_court_counts))
+
+        stadiums_data = [
+            {'stadium_id': stadium.id, 'name': stadium.name, 'venue_name': stadium.venue_name, 'address': stadium.address,
+             'picture': stadium.picture, 'area': stadium.area, 'google_map_url': stadium.google_map_url,
+             'free_court_count': free_court_counts[stadium.id]}
+            for stadium in stadiums
+        ]
+        return {"message": "success", "query_date": query_date, "start_time": start_time, "stadium": stadiums_data}
+
+    except Exception as e:
+        print('Error:', e)
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/info", response_model=schemas.stadium.StadiumInfoMessage)
 def get_stadium(
     stadium_id: int,
@@ -279,6 +331,7 @@ def delete_stadium(
             detail="No stadium to delete.",
         )
     isDeleteSuccessfully = crud.stadium.delete(db=db, db_obj=stadium)
+    timetable.invalidate(stadium_id)
     if isDeleteSuccessfully:
         return {'message': 'success', 'data': None}
     else:
@@ -287,7 +340,6 @@ def delete_stadium(
 @router.post("/disable", response_model=schemas.stadium_disable.StadiumDisableResponse)
 def disable_stadium(
     StadiumDisableContinue_in: schemas.stadium_disable.StadiumDisableContinue,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(deps.get_db),
     current_user: models.user = Depends(deps.get_current_active_user),
 ) -> Any:
@@ -309,62 +361,42 @@ def disable_stadium(
         StadiumDisableContinue_in.end_time, statium_available_times[0].start_time, statium_available_times[0].end_time)
     
     if disable_sessions:
-    
-        return_data = []
-        cancel_order_list = []      
-        
-        for session in disable_sessions:
-            stadium_disable = crud.stadium_disable.is_disabled(
-                db=db, stadium_id=StadiumDisableContinue_in.stadium_id, date=session['date'], start_time=session['start_time']
-            )
-            if stadium_disable:
-                    continue
-
-            disable_obj_in = schemas.stadium_disable.StadiumDisableCreate(
+        # one transaction: store the closure, cancel the orders of the sessions it newly closes, collect who to notify
+        try:
+            previous_periods = crud.stadium_disable.disable_period(
+                db=db,
                 stadium_id=StadiumDisableContinue_in.stadium_id,
-                date=session['date'],
-                start_time=session['start_time'],
-                end_time=session['start_time']+1
+                start=datetime.combine(StadiumDisableContinue_in.start_date, datetime.min.time()) + timedelta(hours=StadiumDisableContinue_in.start_time),
+                end=datetime.combine(StadiumDisableContinue_in.end_date, datetime.min.time()) + timedelta(hours=StadiumDisableContinue_in.end_time),
             )
-            
-            disable_obj = crud.stadium_disable.create(db=db, obj_in=disable_obj_in)
-            if disable_obj:
-                return_data.append({'date': disable_obj.date, 'start_time': disable_obj.start_time})
-
-                stadium_courts = crud.stadium_court.get_all_by_stadium_id(db=db, stadium_id=StadiumDisableContinue_in.stadium_id)
-          
-                for stadium_court in stadium_courts:
-                    stadium_court_id = stadium_court.id
-                    orders_to_be_cancelled = crud.order.get_all_id_by_date_and_start_time(
-                        db=db, stadium_court_id=stadium_court_id ,date=disable_obj.date, start_time=disable_obj.start_time
-                    )
-
-                    if orders_to_be_cancelled:
-                        for order_to_be_cancelled in orders_to_be_cancelled:
-                            order_id = order_to_be_cancelled.id
-                            cancel_order = crud.order.cancel_order_by_id(db=db, order_id=order_id)
-                            cancel_order_list.append(cancel_order.id)
-            else:
-                return {'message': 'fail', 'stadium_id': StadiumDisableContinue_in.stadium_id, 'sessions': None, 'cancel_orders': None}
-            
-        stadium_info = crud.stadium.get_by_stadium_id(db=db, stadium_id=StadiumDisableContinue_in.stadium_id)
-        for order in cancel_order_list:
-            team_member_emails = crud.order.get_order_member_email(db=db, order_id=order)
-            order_info = crud.order.get_by_order_id(db=db, order_id=order)
-            stadium_court_info = crud.stadium_court.get_by_stadium_court_id(db=db, stadium_court_id=order_info.stadium_court_id)
-            for email in team_member_emails:
-                send_email_background(
-                    background_tasks,
-                    '訂單取消通知',
-                    '因場館於該時段暫時關閉，<br>訂單已被取消！<br><br>'
-                    '訂單資訊：<br>'
-                    '日期: ' + str(order_info.date) + '<br>'
-                    '時間: ' + str(order_info.start_time) + ':00-' + str(order_info.start_time + 1) + ':00<br>'
-                    '地點: ' + stadium_info.name + ' ' + stadium_info.venue_name + ' ' + stadium_court_info.name ,
-                    [str(email)]
-                )
+        except SQLAlchemyError as e:
+            print('Error:', e)
+            db.rollback()
+            return {'message': 'fail', 'stadium_id': StadiumDisableContinue_in.stadium_id, 'sessions': None, 'cancel_orders': None}
+        already_disabled = set(crud.stadium_disable.get_sessions_in_periods(previous_periods, 0, 24))
+        disabled = [
+            (session['date'], session['start_time']) for session in disable_sessions
+            if (session['date'], session['start_time']) not in already_disabled
+        ]
+        return_data = [{'date': session_date, 'start_time': start_time} for session_date, start_time in disabled]
+        cancel_order_list = crud.order.cancel_by_stadium_sessions(
+            db=db, stadium_id=StadiumDisableContinue_in.stadium_id, sessions=disabled
+        )
+        notices = crud.order.get_member_emails_by_order_ids(db=db, order_ids=cancel_order_list)
+        for order_id, order_date, order_start_time, stadium_court_name, email in notices:
+            order = schemas.NotificationOrder(
+                date=order_date,
+                start_time=order_start_time,
+                end_time=order_start_time + 1,
+                stadium=stadium.name,
+                venue=stadium.venue_name,
+                court=stadium_court_name,
+            )
+            queue_email(db, 'venue_disabled', {'order': order}, [str(email)])
+        db.commit()
+        for session_date in sorted({session_date for session_date, _ in disabled}):
+            timetable.invalidate(StadiumDisableContinue_in.stadium_id, session_date)
 
-            
     else:
         raise HTTPException(
             status_code=400,
@@ -401,39 +433,39 @@ def undisable_stadium(
             detail="No stadium to undisable.",
         )
     
-    statium_available_times = crud.stadium_available_time.get_all_by_stadium_id(db=db, stadium_id=stadium_id)
-
-    undisable_sessions = crud.stadium_disable.generate_time_slots(
-        start_date, start_time, end_date, 
-        end_time, statium_available_times[0].start_time, statium_available_times[0].end_time)
-    
-    if undisable_sessions:  
-
-        return_data = []
-
-        for session in undisable_sessions:
-            stadium_disable = crud.stadium_disable.is_disabled(
-                db=db, stadium_id=stadium_id, date=session['date'], start_time=session['start_time']
-            )
-            if not stadium_disable:
-                continue
-            
-            undisable_obj = crud.stadium_disable.delete_by_stadium_id_and_session(
-                db=db, stadium_id=stadium_id, date=session['date'], start_time=session['start_time']
-            )
-            if undisable_obj:
-                return_data.append({'date': undisable_obj.date, 'start_time': undisable_obj.start_time})
-            else:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Fail to undisable stadium. Stadium ID: {stadium_id}, Date: {session['date']}, Start Time: {session['start_time']}",
-                )
-            
-    else:
+    # trim the closures overlapping the range, then report the sessions within opening hours that reopened
+    try:
+        removed_periods = crud.stadium_disable.undisable_period(
+            db=db,
+            stadium_id=stadium_id,
+            start=datetime.combine(start_date, datetime.min.time()) + timedelta(hours=start_time),
+            end=datetime.combine(end_date, datetime.min.time()) + timedelta(hours=end_time),
+        )
+    except SQLAlchemyError as e:
+        print('Error:', e)
+        db.rollback()
         raise HTTPException(
             status_code=400,
-            detail="The undisable time is not valid.",
+            detail=f"Fail to undisable stadium. Stadium ID: {stadium_id}, Date: {start_date}, Start Time: {start_time}",
         )
+    available_times = crud.stadium_available_time.get_available_times(db=db, stadium_id=stadium_id)
+    undisabled = crud.stadium_disable.get_sessions_in_periods(
+        removed_periods, available_times.start_time, available_times.end_time
+    ) if available_times is not None else []
+    if not undisabled:
+        # tell an empty range apart from a range without disabled sessions
+        if available_times is None or not crud.stadium_disable.has_time_slots(
+            start_date, start_time, end_date, end_time, available_times.start_time, available_times.end_time
+        ):
+            raise HTTPException(
+                status_code=400,
+                detail="The undisable time is not valid.",
+            )
+    db.commit()
+    for session_date in sorted({session_date for session_date, _ in undisabled}):
+        timetable.invalidate(stadium_id, session_date)
+    return_data = [{'date': session_date, 'start_time': session_start_time} for session_date, session_start_time in undisabled]
+
     if return_data:
             message = 'success'
     else:
@@ -443,7 +475,6 @@ def undisable_stadium(
 
 @router.put("/", response_model=schemas.stadium.StadiumInfoMessage)
 def update_stadium(
-    background_tasks: BackgroundTasks,
     stadium_obj_in: schemas.stadium.StadiumUpdateAdditionalInfo,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user)
@@ -534,24 +565,8 @@ def update_stadium(
                 end_time = update_available_times.end_time
             )
             db.add(create_available_time)
-        db.commit()    
-
-        data = schemas.StadiumInfo(
-            stadium_id = stadium_obj_in.stadium_id,
-            name = stadium_obj_in.name,
-            venue_name = stadium_obj_in.venue_name,
-            address = stadium_obj_in.address,
-            picture = stadium_obj_in.picture,
-            area = stadium_obj_in.area,
-            description = stadium_obj_in.description,
-            google_map_url = stadium_obj_in.google_map_url,
-            created_user = orig_stadium.created_user,
-            max_number_of_people = stadium_obj_in.max_number_of_people,
-            stadium_courts = [schemas.StadiumCourtForInfo(id=x.id, name=x.name) for x in crud.stadium_court.get_all_by_stadium_id(db=db, stadium_id=orig_stadium.id)],
-            available_times = stadium_obj_in.available_times
-        )
-
-        # send mail => only send mail after successfully commit
+        # notify the members of the cancelled orders, in the same transaction
+        db.flush()
         for disabled_court in stadium_courts_to_disable:
             canceled_orders_related_data = db.query(Order.date, Order.start_time, Order.end_time, StadiumCourt.name.label('stadium_court_name'), Stadium.name, Stadium.venue_name, Team.id.label('team_id')) \
                          .join(StadiumCourt, Order.stadium_court_id == StadiumCourt.id) \
@@ -562,11 +577,15 @@ def update_stadium(
             for order_related_data in canceled_orders_related_data:
                 # get team member emails
                 member_emails = crud.team_member.get_all_team_member_email_by_team_id(db=db, team_id=order_related_data.team_id)
-                mail_content = '因租借場地已被下架，<br>訂單已被取消！<br><br>訂單資訊：<br>日期：{}<br>時間：{}<br>地點：{}<br>' \
-                        .format(str(order_related_data.date), 
-                                '{}:00-{}:00'.format(order_related_data.start_time, order_related_data.end_time), 
-                                '{} {} {}'.format(order_related_data.name, order_related_data.venue_name, order_related_data.stadium_court_name))
-                send_email_background(background_tasks, 'Stadium Matching - 訂單取消通知', mail_content, recipients=member_emails)
+                order = schemas.NotificationOrder(
+                    date=order_related_data.date,
+                    start_time=order_related_data.start_time,
+                    end_time=order_related_data.end_time,
+                    stadium=order_related_data.name,
+                    venue=order_related_data.venue_name,
+                    court=order_related_data.stadium_court_name,
+                )
+                queue_email(db, 'court_removed', {'order': order}, recipients=member_emails)
 
         # if updated max_number_of_people is smaller than before => cancel
         # check if existing team with max_number_of_member exceeding new max_number_of_people
@@ -582,11 +601,34 @@ def update_stadium(
             for order_related_data in canceled_orders_related_data:
                 # get team member emails
                 member_emails = crud.team_member.get_all_team_member_email_by_team_id(db=db, team_id=order_related_data.team_id)
-                mail_content = '因租借場地之最大使用人數調降，<br>隊伍人數超過場地之最大使用人數，<br>訂單已被取消！<br><br>訂單資訊：<br>日期：{}<br>時間：{}<br>地點：{}<br>' \
-                        .format(str(order_related_data.date), 
-                                '{}:00-{}:00'.format(order_related_data.start_time, order_related_data.end_time), 
-                                '{} {} {}'.format(order_related_data.name, order_related_data.venue_name, order_related_data.stadium_court_name))
-                send_email_background(background_tasks, 'Stadium Matching - 訂單取消通知', mail_content, recipients=member_emails)
+                order = schemas.NotificationOrder(
+                    date=order_related_data.date,
+                    start_time=order_related_data.start_time,
+                    end_time=order_related_data.end_time,
+                    stadium=order_related_data.name,
+                    venue=order_related_data.venue_name,
+                    court=order_related_data.stadium_court_name,
+                )
+                queue_email(db, 'capacity_reduced', {'order': order}, recipients=member_emails)
+
+        db.commit()
+        # courts, opening hours and orders may all have changed
+        timetable.invalidate(orig_stadium.id)
+
+        data = schemas.StadiumInfo(
+            stadium_id = stadium_obj_in.stadium_id,
+            name = stadium_obj_in.name,
+            venue_name = stadium_obj_in.venue_name,
+            address = stadium_obj_in.address,
+            picture = stadium_obj_in.picture,
+            area = stadium_obj_in.area,
+            description = stadium_obj_in.description,
+            google_map_url = stadium_obj_in.google_map_url,
+            created_user = orig_stadium.created_user,
+            max_number_of_people = stadium_obj_in.max_number_of_people,
+            stadium_courts = [schemas.StadiumCourtForInfo(id=x.id, name=x.name) for x in crud.stadium_court.get_all_by_stadium_id(db=db, stadium_id=orig_stadium.id)],
+            available_times = stadium_obj_in.available_times
+        )
 
         return {'message': 'success', 'data': data}
     except Exception as e:
@@ -1,36 +1,40 @@
 import json
 from typing import Any, Optional, List
+from datetime import date, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
 #from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app import crud, models, schemas
+from app.core import timetable
 from app.core.config import settings
 from app.routers import deps
-from app.utils import get_weekday
+from app.utils import decode_cursor, encode_cursor, get_weekday
 from app.enums import LevelRequirement
 from app.models.stadium import Stadium
 from app.models.stadium_court import StadiumCourt
-from app.models.order import Order
+from app.models.order import ACTIVE_ORDER_SLOT_INDEX, Order
 from app.models.team import Team
 from app.models.team_member import TeamMember
 from app.models.user import User
-from app.email.send_email import send_email_background
+from app.email.send_email import queue_email
 
 
 router = APIRouter()
 
 @router.post("/rent-info", response_model=schemas.stadium_court.StadiumCourtWithRentInfoMessage)
-def get_rent_info(
+async def get_rent_info(
     stadium_id: int,
     date: str,
     start_time: int,
     # end_time: int,
     headcount: int,
     level_requirement: str,
-    db: Session = Depends(deps.get_db),
-    current_user: Optional[models.User] = Depends(deps.get_user_or_none)
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: Optional[schemas.TokenUser] = Depends(deps.get_async_token_user_or_none)
 ) -> Any:
     """
     Retrieve stadium_court with used status.
@@ -39,44 +43,41 @@ def get_rent_info(
     # 一個場地同一時段只會租給一組人，loop stadium_court找出是否已出租+租場地的人的資訊+隊伍資訊
     # 需考慮headcount
     # NEW ADD: 考慮headcount是否大於stadium max_number_of_people
-    db_stadium = crud.stadium.get_by_stadium_id(db=db, stadium_id=stadium_id)
+    db_stadium = await crud.async_stadium.get(db, id=stadium_id)
     if db_stadium is None:
         raise HTTPException(
             status_code=400,
             detail="Fail to find stadium with stadium_id = {}.".format(stadium_id),
         )
     resultList = []
-    # Step 1: Get stadium_courts by stadium_id
-    stadium_courts = crud.stadium_court.get_all_by_stadium_id(db=db, stadium_id=stadium_id)
-    # Step 2: Loop stadium_courts to find if court is already rented
-    for stadium_court in stadium_courts:
-        # query StadiumCourt, Order, Team
-        query = db.query(StadiumCourt.id.label('stadium_court_id'), StadiumCourt.name.label('stadium_court_name'), Order.renter_id, User.name.label('renter_name'), Team.id.label('team_id'), Team.current_member_number, Team.max_number_of_member, Team.level_requirement, Order.is_matching) \
-            .join(Order, StadiumCourt.id == Order.stadium_court_id) \
-            .join(Team, Order.id == Team.order_id) \
-            .join(User, Order.renter_id == User.id) \
-            .filter(StadiumCourt.is_enabled == True) \
-            .filter(StadiumCourt.id == stadium_court.id) \
-            .filter(Order.start_time == start_time) \
-            .filter(Order.date == date) \
-            .filter(Order.status != 0)
-            # .filter(Order.is_matching == True)
-            # .filter(Team.level_requirement <= level_requirement)
-            # .filter(Team.max_number_of_member-Team.current_member_number >= headcount)
-        result = query.first()
+    # Step 1: Get enabled stadium_courts with their rent info (order + team + renter) of the whole day, cached per (stadium, date)
+    rent_info = await timetable.get_rent_info_day(
+        db, stadium_id=stadium_id, day=datetime.strptime(date, "%Y-%m-%d").date()
+    )
+    rented_courts = rent_info.rented.get(start_time, {})
+    # Step 2: Find the teams current_user is already in with a single lookup
+    joined_team_ids = set()
+    if current_user:
+        joined_team_ids = await db.run_sync(
+            crud.team_member.get_joined_team_ids, user_id=current_user.id,
+            team_ids=[x.team_id for x in rented_courts.values()]
+        )
+    # Step 3: Loop stadium_courts to find if court is already rented
+    for stadium_court_id, stadium_court_name in rent_info.courts:
+        stadium_court = rented_courts.get(stadium_court_id)
         # stadium_court is rented for this time
-        if result is not None:
-            orig_level_requirement_val = result.level_requirement
+        if stadium_court is not None:
+            orig_level_requirement_val = stadium_court.level_requirement
             result = schemas.stadium_court.StadiumCourtWithRentInfo(
-                stadium_court_id = stadium_court.id,
-                name = stadium_court.name,
-                # is_matching = result.is_matching,
-                renter_id = result.renter_id,
-                renter_name = result.renter_name,
-                team_id = result.team_id,
-                current_member_number = result.current_member_number,
-                max_number_of_member = result.max_number_of_member,
-                level_requirement = LevelRequirement(result.level_requirement).value.split('_'), # convert level_requirement from code to string
+                stadium_court_id = stadium_court_id,
+                name = stadium_court_name,
+                # is_matching = stadium_court.is_matching,
+                renter_id = stadium_court.renter_id,
+                renter_name = stadium_court.renter_name,
+                team_id = stadium_court.team_id,
+                current_member_number = stadium_court.current_member_number,
+                max_number_of_member = stadium_court.max_number_of_member,
+                level_requirement = LevelRequirement(stadium_court.level_requirement).value.split('_'), # convert level_requirement from code to string
                 status = '', # '加入' if result.max_number_of_member - result.current_member_number >= headcount else ('已滿' if result.max_number_of_member == result.current_member_number else '無法加入')
                 status_description = ''
             )
@@ -87,13 +88,9 @@ def get_rent_info(
                     result.status = '無法加入'
                     result.status_description = '該時段租借者即為使用者'
                 # check if current_user is under this team
-                team_members = db.query(Team.id.label('team_id'), TeamMember.user_id.label('member_id')) \
-                  .join(TeamMember, Team.id == TeamMember.team_id) \
-                  .filter(Team.id == result.team_id).all()
-                for team_member in team_members:
-                    if team_member.member_id == current_user.id:
-                        result.status = '無法加入'
-                        result.status_description = '使用者已加入該隊伍'
+                if result.team_id in joined_team_ids:
+                    result.status = '無法加入'
+                    result.status_description = '使用者已加入該隊伍'
             if result.status == '': # 如果已因為使用者身分而無法加入則跳過下面的check
                 if result.max_number_of_member == result.current_member_number: # is_match = False的也會在這邊 (create Team的時候max_number_of_member會等於current_member_number)
                     result.status = '已滿'
@@ -112,8 +109,8 @@ def get_rent_info(
         # stadium_court is not rented for this time
         else:
             result = schemas.stadium_court.StadiumCourtWithRentInfo(
-                stadium_court_id = stadium_court.id,
-                name = stadium_court.name,
+                stadium_court_id = stadium_court_id,
+                name = stadium_court_name,
                 status = '租借',
                 status_description = ''
             )
@@ -124,9 +121,76 @@ def get_rent_info(
 
     return {"message": "success", "data": resultList}
 
+@router.get("/search/", response_model=schemas.stadium_court.StadiumCourtSearchResponse)
+async def search_stadium_court(
+    start_date: date,
+    end_date: date,
+    headcount: int = Query(..., ge=1),
+    level_requirement: str = Query(...),
+    start_hour: int = Query(0, ge=0, le=23),
+    end_hour: int = Query(24, ge=1, le=24),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(deps.get_async_db),
+    current_user: Optional[schemas.TokenUser] = Depends(deps.get_async_token_user_or_none)
+) -> Any:
+    """
+    Find the free courts and the open teams headcount people at level_requirement can rent or join
+    from start_date to end_date (inclusive), between start_hour and end_hour, earliest first.
+    Pass the returned next_cursor to get the next page; next_cursor is None on the last page.
+    """
+    days = (end_date - start_date).days + 1
+    if days <= 0 or days > timetable.MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid date range. end_date must be within {} days after start_date.".format(timetable.MAX_RANGE_DAYS),
+        )
+    if start_hour >= end_hour:
+        raise HTTPException(status_code=400, detail="Invalid hour range. end_hour must be after start_hour.")
+    after = None
+    if cursor:
+        try:
+            cursor_date, cursor_start_time, cursor_kind, cursor_stadium_court_id = decode_cursor(cursor)
+            after = (date.fromisoformat(cursor_date), int(cursor_start_time), int(cursor_kind), int(cursor_stadium_court_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    levels = [level.values[1] for level in LevelRequirement if level_requirement.upper() in level.name]
+    # fetch one extra slot to know whether there is a next page
+    slots = await db.run_sync(
+        crud.stadium_court.search_slots, start_date=start_date, end_date=end_date, start_hour=start_hour,
+        end_hour=end_hour, headcount=headcount, levels=levels, user_id=current_user.id if current_user else None,
+        limit=limit + 1, after=after
+    )
+    next_cursor = None
+    if len(slots) > limit:
+        slots = slots[:limit]
+        last_slot = slots[-1]
+        next_cursor = encode_cursor(last_slot.date, last_slot.start_time, last_slot.kind, last_slot.stadium_court_id)
+
+    data = []
+    for slot in slots:
+        result = schemas.stadium_court.StadiumCourtSearchResult(
+            stadium_id = slot.stadium_id,
+            stadium_name = slot.stadium_name,
+            stadium_court_id = slot.stadium_court_id,
+            name = slot.stadium_court_name,
+            date = slot.date,
+            start_time = slot.start_time,
+            status = '租借',
+        )
+        if slot.team_id is not None:
+            result.status = '加入'
+            result.team_id = slot.team_id
+            result.current_member_number = slot.current_member_number
+            result.max_number_of_member = slot.max_number_of_member
+            result.level_requirement = LevelRequirement(slot.level_requirement).value.split('_')
+        data.append(result)
+
+    return {"message": "success", "data": data, "next_cursor": next_cursor}
+
 @router.post("/rent", response_model=schemas.order.OrderWithTeamInfoMessage)
 def rent(
-    background_tasks: BackgroundTasks,
     rent_obj_in: schemas.order.OrderCreateWithTeamInfo,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user)
@@ -152,7 +216,24 @@ def rent(
             is_matching = rent_obj_in.is_matching
         )
         db.add(create_order_obj)
-        db.flush() # flush to get autoincremented id
+        try:
+            db.flush() # flush to get autoincremented id
+        except IntegrityError as e:
+            # somebody else holds an active order on this court at this time
+            if getattr(e.orig.diag, "constraint_name", None) != ACTIVE_ORDER_SLOT_INDEX:
+                raise
+            db.rollback()
+            timetable.invalidate(stadium_court.stadium_id, rent_obj_in.date)
+            free_courts = crud.stadium_court.get_free_courts(
+                db=db, stadium_id=stadium_court.stadium_id, date=rent_obj_in.date, start_time=rent_obj_in.start_time
+            )
+            raise HTTPException(
+                status_code=409,
+                detail={
+                    "message": "Fail to rent stadium_court. stadium_court_id = {} is already rented at this time.".format(rent_obj_in.stadium_court_id),
+                    "alternative_courts": [{"stadium_court_id": x.id, "name": x.name} for x in free_courts],
+                },
+            )
         # create team
         # convert level_requirement from str array to integer value
         level_requirement_value = 0
@@ -197,7 +278,6 @@ def rent(
                 status = 1
             )
             db.add(create_team_member_obj)
-        db.commit()
 
         team_members = [schemas.user.UserCredential(name=x.name, email=x.email) for x in member_list]
         data = schemas.order.OrderWithTeamInfo(
@@ -213,7 +293,7 @@ def rent(
             team_id = create_team_obj.id,
             team_members = team_members
         )
-        # send mail to related users
+        # notify related users, in the transaction of the order
         # renter
         related_data = db.query(Order.date, Order.start_time, Order.end_time, StadiumCourt.name.label('stadium_court_name'), Stadium.name, Stadium.venue_name, User.email.label('renter_email'), User.name.label('renter_name')) \
                          .join(StadiumCourt, Order.stadium_court_id == StadiumCourt.id) \
@@ -221,16 +301,27 @@ def rent(
                          .join(User, Order.renter_id == User.id) \
                          .filter(Order.id == data.id) \
                          .first()
-        mail_content = '<br><br>隊伍及場地租借資訊：<br>日期：{}<br>時間：{}<br>地點：{}<br>租借者：{}<br>隊伍人數：{}<br>' \
-                        .format(str(related_data.date), 
-                                '{}:00-{}:00'.format(related_data.start_time, related_data.end_time), 
-                                '{} {} {}'.format(related_data.name, related_data.venue_name, related_data.stadium_court_name),
-                                related_data.renter_name,
-                                '{}/{}'.format(data.current_member_number, data.max_number_of_member))
-        send_email_background(background_tasks, 'Stadium Matching - 成功租借場地通知', '已成功租借場地！' + mail_content, recipients=[current_user.email])
+        payload = {
+            'order': schemas.NotificationOrder(
+                date=related_data.date,
+                start_time=related_data.start_time,
+                end_time=related_data.end_time,
+                stadium=related_data.name,
+                venue=related_data.venue_name,
+                court=related_data.stadium_court_name,
+            ),
+            'team': schemas.NotificationTeam(
+                renter=related_data.renter_name,
+                current_member_number=data.current_member_number,
+                max_number_of_member=data.max_number_of_member,
+            ),
+        }
+        queue_email(db, 'rent_success', payload, recipients=[current_user.email])
         # team members
         recipients = [x.email for x in team_members]
-        send_email_background(background_tasks, 'Stadium Matching - 成功加入隊伍通知', '已成功加入隊伍！' + mail_content, recipients=recipients)
+        queue_email(db, 'join_success', payload, recipients=recipients)
+        db.commit()
+        timetable.invalidate(stadium_court.stadium_id, rent_obj_in.date)
 
         return {'message': 'success', 'data': data}
     except HTTPException:
@@ -241,7 +332,6 @@ def rent(
 
 @router.post("/join", response_model=schemas.team.TeamInfoMessage)
 def join(
-    background_tasks: BackgroundTasks,
     join_obj_in: schemas.team.TeamJoinInfo,
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
@@ -256,24 +346,8 @@ def join(
             detail="Fail to join. No team data with team_id = {}.".format(join_obj_in.team_id),
         )
     try:
-        # update current_member_number of team
-        team_obj.current_member_number += len(join_obj_in.team_member_emails)+1 # other team_member + current_user
-        db.add(team_obj)
-        # add current_user & team_member into TABLE team_member
-        # current user
-        # check if team_member already have data but status = False (if so, just update the status to True)
-        team_member_obj = db.query(TeamMember).filter(TeamMember.team_id == join_obj_in.team_id, TeamMember.user_id == current_user.id).first()
-        if team_member_obj is not None:
-            team_member_obj.status = 1
-            db.add(team_member_obj)
-        else:
-            user_create_team_member_obj = models.team_member.TeamMember(
-                team_id = join_obj_in.team_id,
-                user_id = current_user.id,
-                status = 1
-            )
-            db.add(user_create_team_member_obj)
-        # other team_member
+        # current_user & other team_member
+        user_ids = [current_user.id]
         for member_email in join_obj_in.team_member_emails:
             member = db.query(User).filter(User.email == member_email).first()
             if member is None:
@@ -281,29 +355,33 @@ def join(
                     status_code=400,
                     detail="Fail to join. No user data with email = {}.".format(member_email),
                 )
-            # check if team_member already have data but status = False (if so, just update the status to True)
-            team_member_obj = db.query(TeamMember).filter(TeamMember.team_id == join_obj_in.team_id, TeamMember.user_id == member.id).first()
-            if team_member_obj is not None:
-                team_member_obj.status = 1
-                db.add(team_member_obj)
-            else:
-                create_team_member_obj = models.team_member.TeamMember(
-                    team_id = join_obj_in.team_id,
-                    user_id = member.id,
-                    status = 1
-                )
-                db.add(create_team_member_obj)
-        db.commit()
+            user_ids.append(member.id)
+        # add them into TABLE team_member (or set status back to 1), then count only the users who were not in the team yet
+        joined_user_ids = crud.team_member.activate_members(db=db, team_id=join_obj_in.team_id, user_ids=user_ids)
+        if not joined_user_ids:
+            db.rollback()
+            raise HTTPException(
+                status_code=400,
+                detail="Fail to join. Users have already joined team_id = {}.".format(join_obj_in.team_id),
+            )
+        # update current_member_number of team, atomically and only if the team has room for them
+        updated_team = crud.team.add_members(db=db, team_id=join_obj_in.team_id, number=len(joined_user_ids))
+        if updated_team is None:
+            db.rollback()
+            raise HTTPException(
+                status_code=400,
+                detail="Fail to join. team_id = {} does not have enough vacancies.".format(join_obj_in.team_id),
+            )
 
         data = schemas.team.TeamInfo(
-            id = team_obj.id,
-            order_id = team_obj.order_id,
-            max_number_of_member = team_obj.max_number_of_member,
-            current_member_number = team_obj.current_member_number,
-            level_requirement = team_obj.level_requirement,
+            id = updated_team.id,
+            order_id = updated_team.order_id,
+            max_number_of_member = updated_team.max_number_of_member,
+            current_member_number = updated_team.current_member_number,
+            level_requirement = updated_team.level_requirement,
         )
 
-        # send mail to related users
+        # notify related users, in the transaction of the join
         # joined members
         related_data = db.query(Order.date, Order.start_time, Order.end_time, StadiumCourt.name.label('stadium_court_name'), Stadium.name, Stadium.venue_name, User.email.label('renter_email'), User.name.label('renter_name')) \
                          .join(StadiumCourt, Order.stadium_court_id == StadiumCourt.id) \
@@ -311,29 +389,36 @@ def join(
                          .join(User, Order.renter_id == User.id) \
                          .filter(Order.id == data.order_id) \
                          .first()
-        mail_content = '已成功加入隊伍！<br><br>隊伍及場地資訊：<br>日期：{}<br>時間：{}<br>地點：{}<br>租借者：{}<br>隊伍人數：{}<br>' \
-                        .format(str(related_data.date), 
-                                '{}:00-{}:00'.format(related_data.start_time, related_data.end_time), 
-                                '{} {} {}'.format(related_data.name, related_data.venue_name, related_data.stadium_court_name),
-                                related_data.renter_name,
-                                '{}/{}'.format(data.current_member_number, data.max_number_of_member))
-        joined_recipents = [current_user.email]
-        joined_recipents.extend(join_obj_in.team_member_emails)
-        send_email_background(background_tasks, 'Stadium Matching - 成功加入隊伍通知', mail_content, recipients=joined_recipents)
+        payload = {
+            'order': schemas.NotificationOrder(
+                date=related_data.date,
+                start_time=related_data.start_time,
+                end_time=related_data.end_time,
+                stadium=related_data.name,
+                venue=related_data.venue_name,
+                court=related_data.stadium_court_name,
+            ),
+            'team': schemas.NotificationTeam(
+                renter=related_data.renter_name,
+                current_member_number=data.current_member_number,
+                max_number_of_member=data.max_number_of_member,
+            ),
+        }
+        # only the users added by this join, in the order of the request (the others were members already)
+        joined_users = {x.id: x for x in db.query(User.id, User.email, User.name).filter(User.id.in_(joined_user_ids))}
+        joined_users = [joined_users.pop(x) for x in user_ids if x in joined_users]
+        queue_email(db, 'join_success', payload, recipients=[x.email for x in joined_users])
         # members of joined team
         # renter + team_member
         team_member_objs = db.query(TeamMember.user_id.label('member_id'), User.email.label('member_email')) \
                              .join(User, TeamMember.user_id == User.id) \
-                             .filter(TeamMember.team_id == team_obj.id) \
+                             .filter(TeamMember.team_id == updated_team.id) \
                              .all()
         recipients = [related_data.renter_email]
-        recipients.extend([x.member_email for x in team_member_objs if x.member_email not in joined_recipents])
-        joined_member_names = []
-        for joined_member_email in joined_recipents:
-            joined_member_name = crud.user.get_by_email(db=db, email=joined_member_email).name
-            joined_member_names.append(joined_member_name)
-        mail_content = '新成員 {} '.format(', '.join(joined_member_names)) + mail_content
-        send_email_background(background_tasks, 'Stadium Matching - 新隊員加入隊伍通知', mail_content, recipients=recipients)
+        recipients.extend([x.member_email for x in team_member_objs if x.member_id not in joined_user_ids])
+        queue_email(db, 'new_member', dict(payload, members=[x.name for x in joined_users]), recipients=recipients)
+        db.commit()
+        timetable.invalidate_order(db=db, order_id=updated_team.order_id)
 
         return {'message': 'success', 'team': data}
     except HTTPException:
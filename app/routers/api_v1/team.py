@@ -1,16 +1,20 @@
 import json
 from typing import Any, Optional
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, date
+from zoneinfo import ZoneInfo
 
 import requests
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 #from loguru import logger
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session,joinedload
 
 from app import crud, models, schemas
 from app.core import security
 from app.core.config import settings
 from app.routers import deps
+from app.enums import JoinListPeriod
+from app.utils import decode_cursor, encode_cursor
 import traceback
 
 
@@ -20,9 +24,16 @@ router = APIRouter()
 @router.post("/my-join-list/", response_model=schemas.TeamJointListResponse)
 def get_join_list(
     db: Session = Depends(deps.get_db),
-    current_user: models.User = Depends(deps.get_current_active_user)
+    current_user: models.User = Depends(deps.get_current_active_user),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    period: Optional[JoinListPeriod] = None
 ):
-    print('current_user.id',current_user.id)
+    """
+    Retrieve the teams current_user joined, one page at a time.
+    period = upcoming / past only returns teams from today on / before today.
+    Pass the returned next_cursor to get the next page; next_cursor is None on the last page.
+    """
     join_query = (
         db.query(models.Team, models.Order, models.Stadium, models.StadiumCourt, models.User, models.TeamMember)
         .join(models.Order, models.Order.id == models.Team.order_id)
@@ -31,11 +42,37 @@ def get_join_list(
         .join(models.User, models.User.id == models.Order.renter_id)
         .join(models.TeamMember, models.TeamMember.team_id == models.Team.id)
         .filter(models.TeamMember.user_id == current_user.id)
-        .order_by(models.Order.date, models.Order.start_time)
     )
+    if period is not None:
+        today = datetime.now(tz=ZoneInfo("Asia/Taipei")).date()
+        if period == JoinListPeriod.upcoming:
+            join_query = join_query.filter(models.Order.date >= today)
+        else:
+            join_query = join_query.filter(models.Order.date < today)
+    if cursor:
+        try:
+            cursor_date, cursor_start_time, cursor_team_id = decode_cursor(cursor)
+            after = (date.fromisoformat(cursor_date), int(cursor_start_time), int(cursor_team_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        join_query = join_query.filter(
+            tuple_(models.Order.date, models.Order.start_time, models.Team.id) > tuple_(*after)
+        )
+    # fetch one extra team to know whether there is a next page
+    join_query = join_query.order_by(models.Order.date, models.Order.start_time, models.Team.id).limit(limit + 1)
 
     # Execute the query and fetch the results
     results = join_query.all()
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        last_team, last_order = results[-1][0], results[-1][1]
+        next_cursor = encode_cursor(last_order.date, last_order.start_time, last_team.id)
+
+    # Fetch the members of all teams at once
+    team_members = crud.team_member.get_active_members_by_team_ids(
+        db=db, team_ids=[team.id for team, *_ in results], exclude_user_id=current_user.id
+    )
 
     # Transform the results into the desired response format
     team_joint_list = []
@@ -58,20 +95,9 @@ def get_join_list(
             "max_number_of_member": team.max_number_of_member,
             "renter_name": renter.name,
             "renter_email": renter.email,
-            "join_status": join_status
+            "join_status": join_status,
+            "team_members": team_members.get(team.id, [])
         }
-
-        # Fetch team members
-        team_members = (
-            db.query(models.User.name, models.User.email)
-            .join(models.TeamMember, models.TeamMember.user_id == models.User.id)
-            .filter(models.TeamMember.team_id == team.id)
-            .filter(models.TeamMember.status==1)
-            .filter(models.TeamMember.user_id!=current_user.id)
-            .all()
-        )
-
-        team_data["team_members"] = [{"name": name, "email": email} for name, email in team_members]
         team_joint_list.append(team_data)
 
-    return {"team_joint_list": team_joint_list}
\ No newline at end of file
+    return {"team_joint_list": team_joint_list, "next_cursor": next_cursor}
\ No newline at end of file
@@ -1,16 +1,18 @@
-from typing import Generator
+from typing import AsyncGenerator, Generator, Optional
 
 import loguru
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import crud, models, schemas
 from app.core import security
 from app.core.config import settings
-from app.database.session import SessionLocal
+from app.core.user_status_cache import UserStatus, user_status_cache
+from app.database.session import AsyncSessionLocal, SessionLocal
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
@@ -25,15 +27,18 @@ def get_db() -> Generator:
         db.close()
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
-) -> models.user:
+async def get_async_db() -> AsyncGenerator:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def decode_token(token: str) -> schemas.TokenPayload:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
         loguru.logger.info(f"payload: {payload}")
-        token_data = schemas.TokenPayload(**payload)
+        return schemas.TokenPayload(**payload)
     except (jwt.JWTError, ValidationError) as e:
         loguru.logger.error(f"Error: {e}")
         raise HTTPException(
@@ -41,6 +46,12 @@ def get_current_user(
             detail=f"{e}",
         )
 
+
+def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
+) -> models.user:
+    token_data = decode_token(token)
+
     user = crud.user.get(db, id=token_data.user_id)
     if not user:
         raise HTTPException(status_code=204, detail="User not found")
@@ -88,23 +99,55 @@ def get_user_or_none(
     """
     Return the current active user if is present (using the token Bearer) or None
     """
-    try:
-        if token is None:
-            return None
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        loguru.logger.info(f"payload: {payload}")
-        token_data = schemas.TokenPayload(**payload)
-    except (jwt.JWTError, ValidationError) as e:
-        loguru.logger.error(f"Error: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"{e}",
-        )
+    if token is None:
+        return None
+    token_data = decode_token(token)
 
     user = crud.user.get(db, id=token_data.user_id)
     if not user:
         raise HTTPException(status_code=204, detail="User not found")
 
     return user
+
+
+# Endpoints on the hot read paths trust the claims of the signed token instead of loading the user:
+# they get a schemas.TokenUser, and only is_active/is_provider are checked, through the user status cache.
+
+def load_user_status(db: Session, user_id: int) -> Optional[UserStatus]:
+    user = crud.user.get(db, id=user_id)
+    return None if user is None else UserStatus(is_active=user.is_active, is_provider=user.is_provider)
+
+
+async def _get_token_user(db: AsyncSession, token: str, active_only: bool) -> schemas.TokenUser:
+    token_data = decode_token(token)
+    # the cache calls run off the event loop, the database load on the async connection
+    version, user_status = await user_status_cache.backend.run(user_status_cache.lookup, token_data.user_id)
+    if user_status is None:
+        user_status = await db.run_sync(load_user_status, token_data.user_id)
+        if user_status is None:
+            raise HTTPException(status_code=204, detail="User not found")
+        await user_status_cache.backend.run(user_status_cache.set, token_data.user_id, user_status, version)
+    if active_only and not user_status.is_active:
+        loguru.logger.info("Inactive user")
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return schemas.TokenUser(id=token_data.user_id, is_provider=user_status.is_provider)
+
+
+async def get_async_token_user(
+    db: AsyncSession = Depends(get_async_db), token: str = Depends(reusable_oauth2)
+) -> schemas.TokenUser:
+    """
+    Claims-based counterpart of `get_current_active_user`.
+    """
+    return await _get_token_user(db, token, active_only=True)
+
+
+async def get_async_token_user_or_none(
+    db: AsyncSession = Depends(get_async_db), token: str or None = Depends(optional_oauth2_scheme)
+) -> Optional[schemas.TokenUser]:
+    """
+    Claims-based counterpart of `get_user_or_none`.
+    """
+    if token is None:
+        return None
+    return await _get_token_user(db, token, active_only=False)
@@ -1,5 +1,5 @@
 from .sso_login import SSOLogin, SSOLoginMessage
-from .token import Token, TokenPayload
+from .token import Token, TokenPayload, TokenUser
 from .user import (
     User,
     UserCreate,
@@ -69,4 +69,10 @@ from .team_member import(
     TeamMemberCreate,
     TeamMemberUpdate,
     TeamMemberLeave
-)
\ No newline at end of file
+)
+from .notification import(
+    NotificationOrder,
+    NotificationTeam,
+    NotificationCreate,
+    NotificationUpdate
+)
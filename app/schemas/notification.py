@@ -0,0 +1,34 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+# Parts of the payload of a notification (see app/email/notifications.py)
+class NotificationOrder(BaseModel):
+    date: date
+    start_time: int
+    end_time: int
+    stadium: str
+    venue: str
+    court: str
+
+
+class NotificationTeam(BaseModel):
+    renter: str
+    current_member_number: int
+    max_number_of_member: int
+
+
+# Properties to receive on creation
+class NotificationCreate(BaseModel):
+    subject: str
+    template: str
+    payload: Dict[str, Any]
+    recipients: List[str]
+    digest: Optional[str] = None
+
+
+# Properties to receive on update
+class NotificationUpdate(BaseModel):
+    status: int
@@ -62,6 +62,7 @@ class OrderRentInfo(OrderBase):
 
 class OrderRentResponse(BaseModel):
     orders: List[OrderRentInfo]
+    next_cursor: Optional[str] = None
 
 class OrderCancelResponse(BaseModel):
     message: str
@@ -2,7 +2,7 @@
 BaseModel.schema will return a dict of the schema
 while BaseModel.schema_json will return a JSON string representation of that dict.
 """
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional, Dict, Union, Any
 
 from pydantic import BaseModel, Field
@@ -81,6 +81,23 @@ class StadiumListMessage(BaseModel):
     message: str
     stadium: Optional[List[StadiumList]] = None
 
+
+class StadiumAvailable(StadiumBase):
+    name: str
+    venue_name: str
+    address: Optional[str] = None
+    picture: Optional[str] = None
+    area: Optional[float] = None
+    google_map_url: Optional[str] = None
+    free_court_count: int
+
+
+class StadiumAvailableListMessage(BaseModel):
+    message: str
+    query_date: date
+    start_time: int
+    stadium: List[StadiumAvailable]
+
 # define in this file to avoid circular import
 class StadiumCourtForInfo(BaseModel):
     id: Optional[int] # optional for add new stadium_court when update stadium
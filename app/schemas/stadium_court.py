@@ -2,7 +2,7 @@
 BaseModel.schema will return a dict of the schema
 while BaseModel.schema_json will return a JSON string representation of that dict.
 """
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional, Union, Dict
 
 from pydantic import BaseModel, Field
@@ -69,4 +69,24 @@ class StadiumCourtWithRentInfo(StadiumCourtBase):
 
 class StadiumCourtWithRentInfoMessage(BaseModel):
     message: str
-    data: Optional[List[StadiumCourtWithRentInfo]]
\ No newline at end of file
+    data: Optional[List[StadiumCourtWithRentInfo]]
+
+# search of free courts and open teams
+
+class StadiumCourtSearchResult(BaseModel):
+    stadium_id: int
+    stadium_name: str
+    stadium_court_id: int
+    name: str
+    date: date
+    start_time: int
+    status: str # '租借' for a free court, '加入' for a team to join
+    team_id: Optional[int] = None
+    current_member_number: Optional[int] = None
+    max_number_of_member: Optional[int] = None
+    level_requirement: Optional[List[str]] = None
+
+class StadiumCourtSearchResponse(BaseModel):
+    message: str
+    data: List[StadiumCourtSearchResult]
+    next_cursor: Optional[str] = None
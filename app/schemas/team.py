@@ -35,6 +35,7 @@ class TeamUpdate(TeamBase):
 
 class TeamJointListResponse(BaseModel):
     team_joint_list: List[dict]
+    next_cursor: Optional[str] = None
 
 class TeamJoinInfo(BaseModel):
     team_id: int
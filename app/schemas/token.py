@@ -12,3 +12,11 @@ class TokenPayload(BaseModel):
     exp: Optional[int] = None
     user_id: Optional[int] = None
     is_provider: Optional[bool] = None
+
+
+class TokenUser(BaseModel):
+    """
+    The current user as seen by the endpoints trusting the token claims.
+    """
+    id: int
+    is_provider: bool
@@ -1,4 +1,6 @@
+import base64
 import datetime as dt
+import json
 import multiprocessing
 
 import pytz
@@ -14,4 +16,20 @@ def number_of_workers():
 
 def get_weekday(date_str: str, timezone_str: str = 'Asia/Taipei', date_str_format: str = '%Y-%m-%d') -> int:
     datetime_obj = dt.datetime.strptime(date_str, date_str_format)
-    return datetime_obj.astimezone(pytz.timezone(timezone_str)).weekday() + 1
\ No newline at end of file
+    return datetime_obj.astimezone(pytz.timezone(timezone_str)).weekday() + 1
+
+def encode_cursor(*values) -> str:
+    """
+    Encode keyset pagination values (e.g. date, start_time, id) into an opaque cursor string.
+    """
+    payload = json.dumps([v.isoformat() if isinstance(v, dt.date) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor: str) -> list:
+    """
+    Decode a cursor made by encode_cursor. Raise ValueError if it is malformed.
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception as e:
+        raise ValueError("Invalid cursor: {}".format(cursor)) from e
@@ -0,0 +1,165 @@
+"""
+Benchmark the booking hot-path queries with and without the model indexes.
+
+Seeds a large synthetic dataset into a scratch database, runs the real CRUD
+queries behind timetable, rent-info, stadium-list, my-rent-list, search and join, and
+prints their EXPLAIN ANALYZE plans and timings, first with the secondary
+indexes dropped and then with them created.
+
+    PYTHONPATH=. python scripts/benchmark_indexes.py --stadiums 100 --days 120
+
+The scratch database (bench-<POSTGRES_DB> by default) is dropped and recreated.
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy_utils.functions import create_database, database_exists, drop_database
+
+from app import crud
+from app.core.config import settings
+from app.database.base import Base
+
+START_DATE = date(2024, 1, 1)
+
+SEED_SQL = [
+    '''INSERT INTO "User"(name, email, is_provider, is_active)
+       SELECT 'bench' || g, 'bench' || g || '@example.com', g = 1, true FROM generate_series(1, :users) g''',
+    '''INSERT INTO "Stadium"(name, venue_name, address, area, description, max_number_of_people, created_user)
+       SELECT 'stadium ' || g, 'venue', 'address', 500, '', 6, 1 FROM generate_series(1, :stadiums) g''',
+    # every 10th court is disabled
+    '''INSERT INTO "StadiumCourt"(stadium_id, name, is_enabled)
+       SELECT s.id, 'court ' || c, c % 10 <> 0 FROM "Stadium" s, generate_series(1, :courts) c''',
+    '''INSERT INTO "StadiumAvailableTime"(stadium_id, weekday, start_time, end_time)
+       SELECT s.id, w, 8, 22 FROM "Stadium" s, generate_series(1, 7) w''',
+    # about one order in five is cancelled
+    '''INSERT INTO "Order"(stadium_court_id, renter_id, date, start_time, end_time, status, is_matching, created_time)
+       SELECT sc.id, 1 + floor(random() * :users)::int, CAST(:start_date AS date) + d, h, h + 1,
+              CASE WHEN random() < 0.2 THEN 0 ELSE 1 END, random() < 0.5, now()
+       FROM "StadiumCourt" sc, generate_series(0, :days - 1) d, generate_series(8, 21) h
+       WHERE random() < :density''',
+    '''INSERT INTO "Team"(order_id, max_number_of_member, current_member_number, level_requirement)
+       SELECT id, 6, 1 + floor(random() * 5)::int, 1 + floor(random() * 7)::int FROM "Order"''',
+    '''INSERT INTO "TeamMember"(team_id, user_id, status)
+       SELECT t.id, 1 + (t.id * 7 + k) % :users, 1 FROM "Team" t, generate_series(1, 2) k''',
+    # about one day in fifty is closed from 8:00 to 22:00
+    '''INSERT INTO "StadiumDisable"(stadium_id, period)
+       SELECT s.id, tsrange(CAST(:start_date AS date) + d + time '08:00', CAST(:start_date AS date) + d + time '22:00')
+       FROM "Stadium" s, generate_series(0, :days - 1) d
+       WHERE random() < 0.02''',
+]
+
+
+def hot_queries(db: Session, stadium_id: int, user_id: int):
+    """
+    (label, callable) of the CRUD calls behind the booking hot paths.
+    """
+    query_date = START_DATE + timedelta(days=30)
+    court_ids = crud.stadium_court.get_enabled_ids_by_stadium_id(db=db, stadium_id=stadium_id)
+    team_ids = [team.id for team in crud.team.get_multi(db, limit=20)]
+    return [
+        ("enabled courts (timetable)", lambda: crud.stadium_court.get_enabled_ids_by_stadium_id(db=db, stadium_id=stadium_id)),
+        ("disabled sessions (timetable)", lambda: crud.stadium_disable.get_disabled_sessions(
+            db=db, stadium_id=stadium_id, start_date=query_date, end_date=query_date + timedelta(days=7))),
+        ("orders with teams (timetable)", lambda: crud.order.get_all_with_team_by_court_ids_and_date_range(
+            db=db, stadium_court_ids=court_ids, start_date=query_date, end_date=query_date + timedelta(days=7))),
+        ("active order counts (provider timetable)", lambda: crud.order.count_active_by_session(
+            db=db, stadium_court_ids=court_ids, start_date=query_date, end_date=query_date + timedelta(days=7))),
+        ("rent info of a day (rent-info)", lambda: crud.stadium_court.get_all_with_rent_info(
+            db=db, stadium_id=stadium_id, date=query_date)),
+        ("joined teams (rent-info)", lambda: crud.team_member.get_joined_team_ids(db=db, user_id=user_id, team_ids=team_ids)),
+        ("occupancy (stadium-list)", lambda: crud.stadium.get_stadiums_occupancy(db=db, stadium_ids=list(range(1, 51)))),
+        ("order history page (my-rent-list)", lambda: crud.order.get_user_order_history(db=db, user_id=user_id, limit=51)),
+        ("free courts and open teams (search)", lambda: crud.stadium_court.search_slots(
+            db=db, start_date=query_date, end_date=query_date + timedelta(days=6), start_hour=18, end_hour=22,
+            headcount=2, levels=[3, 4, 5], limit=51)),
+    ]
+
+
+def capture_statements(engine, fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def run(engine, label: str, repeat: int, show_plans: bool):
+    print("\n=== {} ===".format(label))
+    with Session(engine) as db:
+        queries = hot_queries(db, stadium_id=1, user_id=2)
+        for name, fn in queries:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                fn()
+                timings.append((time.perf_counter() - started) * 1000)
+            print("{:<45} median {:8.2f} ms  (min {:.2f}, max {:.2f})".format(
+                name, statistics.median(timings), min(timings), max(timings)))
+            if show_plans:
+                for statement, parameters in capture_statements(engine, fn):
+                    plan = db.connection().exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+                    for row in plan:
+                        print("    " + row[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database", default="bench-{}".format(settings.POSTGRES_DB))
+    parser.add_argument("--stadiums", type=int, default=100)
+    parser.add_argument("--courts", type=int, default=6, help="courts per stadium")
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--density", type=float, default=0.6, help="share of court-hours with an order")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-plans", action="store_true")
+    args = parser.parse_args()
+
+    url = "postgresql://{}:{}@{}:{}/{}".format(
+        settings.POSTGRES_USER, settings.POSTGRES_PASSWORD, settings.POSTGRES_HOST, settings.DATABASE_PORT, args.database
+    )
+    if database_exists(url):
+        drop_database(url)
+    create_database(url)
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+
+    print("seeding {} stadiums x {} courts x {} days ...".format(args.stadiums, args.courts, args.days))
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(bind=conn)
+        for statement in SEED_SQL:
+            conn.execute(text(statement), {
+                "users": args.users, "stadiums": args.stadiums, "courts": args.courts,
+                "days": args.days, "density": args.density, "start_date": START_DATE,
+            })
+    with engine.connect() as conn:
+        for table in ("Order", "Team", "TeamMember", "StadiumDisable"):
+            count = conn.execute(text('SELECT count(*) FROM "{}"'.format(table))).scalar()
+            print("{:<15} {:>10} rows".format(table, count))
+
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    run(engine, "without secondary indexes", args.repeat, not args.no_plans)
+
+    with engine.begin() as conn:
+        for index in indexes:
+            index.create(bind=conn)
+        conn.execute(text("ANALYZE"))
+    run(engine, "with secondary indexes", args.repeat, not args.no_plans)
+
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import re
+import socketserver
+import threading
+import time
 from datetime import timedelta
 
 import pytest
@@ -6,17 +10,21 @@ from fastapi.testclient import TestClient
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy_utils.functions import create_database, database_exists
 
-from app import crud
+from app import crud, models
 from app.core import security
+from app.core.availability_cache import availability_cache
+from app.core.user_status_cache import user_status_cache
 from app.core.config import settings
 from app.database.base_class import Base
+from app.email.mailer import SMTPConnectionPool, mailer
 from app.database.test.test_database import (
     SQLALCHEMY_DATABASE_URL,
+    TestingAsyncSessionLocal,
     TestingSessionLocal,
     engine,
 )
 from app.main import app
-from app.routers.deps import get_db
+from app.routers.deps import get_async_db, get_db
 
 if not database_exists(SQLALCHEMY_DATABASE_URL):
     create_database(SQLALCHEMY_DATABASE_URL)
@@ -44,7 +52,15 @@ def test_client():
         finally:
             session.close()
 
+    async def override_get_async_db():
+        async with TestingAsyncSessionLocal() as session:
+            yield session
+
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    # start every module from the database, not from slot state cached by a previous one
+    availability_cache.clear()
+    user_status_cache.clear()
     with TestClient(app) as client:
         yield client
     # reset overrides
@@ -68,6 +84,184 @@ def get_user_authentication_headers(session, email):
     return headers
 
 
+def create_team(session, *, stadium_court_id, date, start_time, max_number_of_member, current_member_number):
+    """
+    Create an active one-hour order of user 1 with a matching team; deleting the order deletes the team.
+    """
+    order = models.order.Order(
+        stadium_court_id=stadium_court_id, renter_id=1, date=date, start_time=start_time,
+        end_time=start_time + 1, status=1, is_matching=True,
+    )
+    session.add(order)
+    session.flush()
+    team = models.team.Team(
+        order_id=order.id, max_number_of_member=max_number_of_member,
+        current_member_number=current_member_number, level_requirement=7,
+    )
+    session.add(team)
+    session.commit()
+    return order, team
+
+
+class FakeRedisServer:
+    """
+    Local stand-in for a Redis server: speaks enough of the protocol for the availability cache
+    (GET/MGET/SET EX/INCR/EXPIRE/PUBLISH/SUBSCRIBE), so tests run without a real Redis.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                while True:
+                    command = self._read_command()
+                    if command is None:
+                        return
+                    self.wfile.write(fake.execute(command, self))
+
+            def _read_command(self):
+                line = self.rfile.readline()
+                if not line:
+                    return None
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int(self.rfile.readline()[1:-2])
+                    args.append(self.rfile.read(length + 2)[:-2])
+                return args
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "redis://127.0.0.1:{}/0".format(self.server.server_address[1])
+
+    @staticmethod
+    def _bulk(value):
+        return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, args, handler):
+        name = args[0].upper()
+        with self.lock:
+            if name == b"GET":
+                return self._bulk(self.data.get(args[1]))
+            if name == b"MGET":
+                return b"*%d\r\n" % (len(args) - 1) + b"".join(self._bulk(self.data.get(key)) for key in args[1:])
+            if name == b"SET":
+                self.data[args[1]] = args[2]
+                return b"+OK\r\n"
+            if name == b"INCR":
+                value = int(self.data.get(args[1], b"0")) + 1
+                self.data[args[1]] = str(value).encode()
+                return b":%d\r\n" % value
+            if name == b"EXPIRE":
+                return b":1\r\n"
+            if name == b"PUBLISH":
+                message = b"*3\r\n" + self._bulk(b"message") + self._bulk(args[1]) + self._bulk(args[2])
+                for subscriber in self.subscribers:
+                    subscriber.wfile.write(message)
+                return b":%d\r\n" % len(self.subscribers)
+            if name == b"SUBSCRIBE":
+                self.subscribers.append(handler)
+                return b"*3\r\n" + self._bulk(b"subscribe") + self._bulk(args[1]) + b":1\r\n"
+        return b"-ERR unknown command\r\n"
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeSMTPServer:
+    """
+    Local stand-in for an SMTP server: accepts any login and records every message as
+    (sender, recipients, data), so tests never send real mail. Replies queued in `replies`
+    (e.g. "421 try again later", or "drop" to hang up) answer the next MAIL commands.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.replies = []
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with fake.lock:
+                    fake.connections += 1
+                self.wfile.write(b"220 localhost\r\n")
+                sender, recipients = None, []
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode().strip()
+                    verb = command.split(" ", 1)[0].upper()
+                    if verb == "EHLO":
+                        self.wfile.write(b"250-localhost\r\n250 AUTH PLAIN LOGIN\r\n")
+                    elif verb == "AUTH":
+                        self.wfile.write(b"235 authenticated\r\n")
+                    elif verb == "MAIL":
+                        with fake.lock:
+                            reply = fake.replies.pop(0) if fake.replies else None
+                        if reply == "drop":
+                            return
+                        if reply:
+                            self.wfile.write(reply.encode() + b"\r\n")
+                            continue
+                        sender, recipients = re.search("<(.*)>", command).group(1), []
+                        self.wfile.write(b"250 ok\r\n")
+                    elif verb == "RCPT":
+                        recipients.append(re.search("<(.*)>", command).group(1))
+                        self.wfile.write(b"250 ok\r\n")
+                    elif verb == "DATA":
+                        self.wfile.write(b"354 go ahead\r\n")
+                        data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                        with fake.lock:
+                            fake.messages.append((sender, recipients, data.decode()))
+                        self.wfile.write(b"250 queued\r\n")
+                    elif verb == "QUIT":
+                        self.wfile.write(b"221 bye\r\n")
+                        return
+                    else:
+                        # HELO, NOOP, RSET
+                        self.wfile.write(b"250 ok\r\n")
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+
+    def recipients(self):
+        with self.lock:
+            return [recipient for _, recipients, _ in self.messages for recipient in recipients]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# mail sent by the app under test goes to a local stand-in instead of the real SMTP server
+smtp_server = FakeSMTPServer().__enter__()
+mailer.pool = SMTPConnectionPool(*smtp_server.address, use_ssl=False)
+
+
 # def override_get_db():
 #     try:
 #         db = TestingSessionLocal()
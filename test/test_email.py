@@ -0,0 +1,195 @@
+import email
+from datetime import date
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from jinja2 import UndefinedError
+
+from app import crud, schemas
+from app.core.config import settings
+from app.database.test.test_database import TestingSessionLocal
+from app.email.dispatcher import OutboxDispatcher
+from app.email.mailer import Mail, Mailer, SMTPConnectionPool
+from app.email import mailer as mailer_module, notifications
+from app.email.send_email import queue_email
+from app.models.notification import NOTIFICATION_FAILED, NOTIFICATION_PENDING, NOTIFICATION_SENT, Notification
+from .contest import FakeSMTPServer, db_conn
+
+
+def _mailer(server):
+    return Mailer(
+        SMTPConnectionPool(*server.address, use_ssl=False, username="admin", password="x", size=1),
+        sender="admin@example.com",
+    )
+
+
+def test_mailer_reuses_one_connection():
+    with FakeSMTPServer() as server:
+        test_mailer = _mailer(server)
+        for i in range(20):
+            test_mailer.deliver(Mail("訂單取消通知", "order {}".format(i), ("user{}@example.com".format(i),)))
+        test_mailer.close()
+    assert server.connections == 1
+    assert sorted(server.recipients()) == sorted("user{}@example.com".format(i) for i in range(20))
+
+def test_mailer_groups_same_message():
+    batch = [
+        Mail("訂單取消通知", "order 1", ("a@example.com", "b@example.com")),
+        Mail("訂單取消通知", "order 2", ("a@example.com",)),
+        Mail("訂單取消通知", "order 1", ("b@example.com", "c@example.com")),
+    ]
+    assert Mailer.group(batch) == [
+        Mail("訂單取消通知", "order 1", ("a@example.com", "b@example.com", "c@example.com")),
+        Mail("訂單取消通知", "order 2", ("a@example.com",)),
+    ]
+    with FakeSMTPServer() as server:
+        test_mailer = _mailer(server)
+        for envelope in Mailer.group(batch):
+            test_mailer.deliver(envelope)
+        test_mailer.close()
+    assert len(server.messages) == 2
+
+def _order(court="A 場"):
+    return schemas.NotificationOrder(
+        date=date(2023, 11, 20), start_time=10, end_time=11, stadium="綜合體育館", venue="一樓", court=court
+    )
+
+def _team():
+    return schemas.NotificationTeam(renter="王小明", current_member_number=2, max_number_of_member=4)
+
+def _body(data):
+    return email.message_from_string(data).get_payload(decode=True).decode()
+
+def test_notification_templates_render():
+    payload = jsonable_encoder({"order": _order("<b>B</b> 場"), "team": _team(), "member": "李美美", "members": ["李美美", "吳暖暖"]})
+    for name in notifications.TEMPLATES:
+        subject, html = notifications.render(name, payload)
+        assert subject.startswith("Stadium Matching - ")
+        assert "2023-11-20" in html and "10:00-11:00" in html
+        # payload values are escaped
+        assert "&lt;b&gt;B&lt;/b&gt; 場" in html and "<b>" not in html
+    assert "租借者：王小明<br>隊伍人數：2/4" in notifications.render("rent_success", payload)[1]
+    assert "新成員 李美美, 吳暖暖" in notifications.render("new_member", payload)[1]
+    with pytest.raises(UndefinedError):
+        notifications.render("rent_success", jsonable_encoder({"order": _order()}))
+
+def _dispatcher(server, **kwargs):
+    return OutboxDispatcher(_mailer(server), session_factory=TestingSessionLocal, **kwargs)
+
+def _queue(template, payload, recipients, commit=True):
+    with TestingSessionLocal() as session:
+        queued = queue_email(session, template, payload, recipients)
+        session.flush()
+        ids = [x.id for x in queued]
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+    return ids
+
+def _statuses(ids):
+    with TestingSessionLocal() as session:
+        return [
+            (x.status, x.attempts)
+            for x in session.query(Notification).filter(Notification.id.in_(ids)).order_by(Notification.id)
+        ]
+
+def test_queue_email_follows_the_transaction(db_conn):
+    rolled_back = _queue("member_left", {"member": "李美美", "order": _order()}, ["a@example.com"], commit=False)
+    assert _statuses(rolled_back) == []
+    committed = _queue("member_left", {"member": "李美美", "order": _order()}, ["a@example.com", None])
+    notification = db_conn.query(Notification).filter(Notification.id.in_(committed)).one()
+    assert notification.recipients == ["a@example.com"]
+    assert notification.status == NOTIFICATION_PENDING
+    assert notification.template == "member_left"
+    assert notification.payload["order"]["date"] == "2023-11-20"
+
+def test_dispatcher_delivers_and_marks_sent():
+    payload = {"order": _order(), "team": _team()}
+    ids = _queue("join_success", payload, ["joined1@example.com"]) + _queue("join_success", payload, ["joined2@example.com"])
+    with FakeSMTPServer() as server:
+        dispatcher = _dispatcher(server, batch_size=1000)
+        assert dispatcher.dispatch_once() >= 2
+        dispatcher.mailer.close()
+    assert _statuses(ids) == [(NOTIFICATION_SENT, 1), (NOTIFICATION_SENT, 1)]
+    # the same message went out as one envelope
+    [(sender, recipients, data)] = [message for message in server.messages if "joined1@example.com" in message[1]]
+    assert recipients[-2:] == ["joined1@example.com", "joined2@example.com"]
+    assert "已成功加入隊伍！" in _body(data)
+
+def test_dispatchers_skip_locked_notifications():
+    ids = _queue("member_left", {"member": "李美美", "order": _order()}, ["locked@example.com"])
+    with FakeSMTPServer() as server, TestingSessionLocal() as other:
+        # another dispatcher holds the lock on every pending notification
+        assert set(ids) <= {x.id for x in crud.notification.claim_pending(other, limit=1000)}
+        dispatcher = _dispatcher(server, batch_size=1000)
+        assert dispatcher.dispatch_once() == 0
+        other.rollback()
+        assert dispatcher.dispatch_once() >= 1
+        dispatcher.mailer.close()
+    assert server.recipients().count("locked@example.com") == 1
+    assert _statuses(ids) == [(NOTIFICATION_SENT, 1)]
+
+def test_dispatcher_retries_temporary_failures():
+    with FakeSMTPServer() as server:
+        dispatcher = _dispatcher(server, batch_size=1000, max_attempts=2, retry_backoff=0)
+        # drain what other tests left in the outbox
+        dispatcher.dispatch_once()
+        temporary = _queue("order_cancelled", {"order": _order()}, ["temporary@example.com"])
+        server.replies = ["421 try again later"]
+        dispatcher.dispatch_once()
+        assert _statuses(temporary) == [(NOTIFICATION_PENDING, 1)]
+        # the last attempt fails for good
+        server.replies = ["421 try again later"]
+        dispatcher.dispatch_once()
+        assert _statuses(temporary) == [(NOTIFICATION_FAILED, 2)]
+
+        permanent = _queue("order_cancelled", {"order": _order()}, ["permanent@example.com"])
+        server.replies = ["550 mailbox unavailable"]
+        dispatcher.dispatch_once()
+        assert _statuses(permanent) == [(NOTIFICATION_FAILED, 1)]
+        dispatcher.mailer.close()
+    assert not {"temporary@example.com", "permanent@example.com"} & set(server.recipients())
+
+def test_dispatcher_does_not_resend_delivered_envelopes(monkeypatch):
+    monkeypatch.setattr(mailer_module, "MAX_RECIPIENTS_PER_MESSAGE", 1)
+    with FakeSMTPServer() as server:
+        dispatcher = _dispatcher(server, batch_size=1000, retry_backoff=0)
+        # drain what other tests left in the outbox
+        dispatcher.dispatch_once()
+        payload = {"member": "李美美", "order": _order()}
+        ids = [_queue("member_left", payload, ["split{}@example.com".format(i)])[0] for i in range(3)]
+        # the second envelope fails, the third is left for the next round
+        server.replies = ["", "421 try again later"]
+        dispatcher.dispatch_once()
+        assert _statuses(ids) == [(NOTIFICATION_SENT, 1), (NOTIFICATION_PENDING, 1), (NOTIFICATION_PENDING, 1)]
+        dispatcher.dispatch_once()
+        assert _statuses(ids) == [(NOTIFICATION_SENT, 1), (NOTIFICATION_SENT, 2), (NOTIFICATION_SENT, 2)]
+        dispatcher.mailer.close()
+    assert sorted(x for x in server.recipients() if x.startswith("split")) == [
+        "split0@example.com", "split1@example.com", "split2@example.com"
+    ]
+
+def test_dispatcher_sends_one_digest_per_recipient(monkeypatch):
+    # the first entry is due now, the others would wait for an hour
+    monkeypatch.setattr(settings, "NOTIFICATION_DIGEST_WINDOW", 0)
+    ids = _queue("venue_disabled", {"order": _order("court 1")}, ["digest1@example.com", "digest2@example.com"])
+    monkeypatch.setattr(settings, "NOTIFICATION_DIGEST_WINDOW", 3600)
+    ids += _queue("capacity_reduced", {"order": _order("court 2")}, ["digest1@example.com"])
+    ids += _queue("venue_disabled", {"order": _order("court 3")}, ["digest1@example.com", "digest1@example.com"])
+    assert len(ids) == 4
+    with FakeSMTPServer() as server:
+        dispatcher = _dispatcher(server, batch_size=1000)
+        dispatcher.dispatch_once()
+        dispatcher.mailer.close()
+    assert _statuses(ids) == [(NOTIFICATION_SENT, 1)] * 4
+    assert sorted(x for x in server.recipients() if x.startswith("digest")) == ["digest1@example.com", "digest2@example.com"]
+    bodies = {
+        recipients[0]: _body(data)
+        for _, recipients, data in server.messages
+        if recipients[0].startswith("digest")
+    }
+    assert "您有 3 筆訂單已被取消！" in bodies["digest1@example.com"]
+    assert all("court {}".format(i) in bodies["digest1@example.com"] for i in (1, 2, 3))
+    assert "最大使用人數調降" in bodies["digest1@example.com"]
+    assert "court 1" in bodies["digest2@example.com"] and "筆" not in bodies["digest2@example.com"]
@@ -6,7 +6,7 @@ import pytest
 from fastapi.encoders import jsonable_encoder
 from fastapi import HTTPException
 from unittest.mock import patch
-from app import crud
+from app import crud, models
 from app.core.config import settings
 from .contest import db_conn, get_user_authentication_headers, test_client
 
@@ -177,3 +177,81 @@ def test_cancel_order_already_canceled(db_conn, test_client):
     db_conn.delete(test_order_del)
     db_conn.commit()
 
+
+def test_get_rent_list_pagination(db_conn, test_client):
+    # Prepare authentication
+    email = "cloudnativeg23@gmail.com"
+    user = crud.user.get_by_email(db_conn, email=email)
+
+    # Prepare test orders with teams
+    test_orders = []
+    for start_time in [10, 11, 12]:
+        order_obj = OrderCreate(
+                stadium_court_id = 1,
+                renter_id = user.id,
+                date = date(2023, 12, 12),
+                start_time = start_time,
+                end_time = start_time + 1,
+                status = 1,
+                is_matching = False,
+            )
+        test_order = crud.order.create(db_conn, obj_in=order_obj)
+        db_conn.add(models.Team(order_id=test_order.id, max_number_of_member=2, current_member_number=2, level_requirement=1))
+        db_conn.commit()
+        test_orders.append(test_order)
+
+    headers = get_user_authentication_headers(db_conn, email)
+    response = test_client.post(f"{settings.API_V1_STR}/order/my-rent-list/?limit=200", headers=headers)
+    assert response.status_code == 200
+    all_order_ids = [order["id"] for order in response.json()["orders"]]
+    assert response.json()["next_cursor"] is None
+
+    # Walk all pages with limit=2
+    paged_order_ids = []
+    cursor = None
+    while True:
+        url = f"{settings.API_V1_STR}/order/my-rent-list/?limit=2"
+        if cursor:
+            url += f"&cursor={cursor}"
+        response = test_client.post(url, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()["orders"]) <= 2
+        paged_order_ids.extend([order["id"] for order in response.json()["orders"]])
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert paged_order_ids == all_order_ids
+    assert all(test_order.id in paged_order_ids for test_order in test_orders)
+
+    # Invalid cursor
+    response = test_client.post(f"{settings.API_V1_STR}/order/my-rent-list/?cursor=invalid", headers=headers)
+    assert response.status_code == 400
+
+    #delete test orders
+    for test_order in test_orders:
+        db_conn.delete(crud.order.get_by_order_id(db_conn, order_id=test_order.id))
+    db_conn.commit()
+
+def test_get_rent_list_trusts_token_claims(db_conn, test_client):
+    email = "cloudnativeg23@gmail.com"
+    headers = get_user_authentication_headers(db_conn, email)
+    user = crud.user.get_by_email(db_conn, email=email)
+
+    response = test_client.post(f"{settings.API_V1_STR}/order/my-rent-list/", headers=headers)
+    assert response.status_code == 200
+
+    # the status of the user is cached, the user row is not loaded again
+    with patch.object(crud.user, "get", side_effect=AssertionError("user loaded")):
+        response = test_client.post(f"{settings.API_V1_STR}/order/my-rent-list/", headers=headers)
+    assert response.status_code == 200
+
+    # deactivating the user invalidates the cached status
+    crud.user.deactivate(db_conn, db_obj=user)
+    try:
+        response = test_client.post(f"{settings.API_V1_STR}/order/my-rent-list/", headers=headers)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Inactive user"
+    finally:
+        crud.user.update(db_conn, db_obj=user, obj_in={"is_active": True})
+    response = test_client.post(f"{settings.API_V1_STR}/order/my-rent-list/", headers=headers)
+    assert response.status_code == 200
@@ -1,14 +1,24 @@
+import asyncio
+import json
 import random
 import string
+import threading
+from datetime import date, datetime
 
 import loguru
+import numpy as np
 import pytest
 from fastapi.encoders import jsonable_encoder
 from fastapi import HTTPException
+from sqlalchemy.dialects.postgresql import Range
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from unittest.mock import patch
 from app import crud, models
+from app.core import slot_bitmap, timetable
+from app.core.availability_cache import AvailabilityCache
+from app.core.cache_backends import InProcessBackend, RedisBackend, SharedMemoryBackend, create_backend
 from app.core.config import settings
-from .contest import db_conn, get_user_authentication_headers, test_client
+from .contest import FakeRedisServer, db_conn, get_user_authentication_headers, test_client
 
 from app.schemas.stadium import StadiumCreate
 from app.schemas.stadium_disable import StadiumDisableCreate
@@ -292,6 +302,31 @@ def test_get_stadium_list(db_conn, test_client):
         assert "max_number_of_people" in stadium
         assert "current_people_count" in stadium
 
+def test_get_stadium_list_pagination(db_conn, test_client):
+    response = test_client.get(
+        f"{settings.API_V1_STR}/stadium/stadium-list/",
+        params={"created_user": 1, "skip": 0, "limit": 1},
+    )
+    assert response.status_code == 200
+    first_page = response.json()["stadium"]
+    assert len(first_page) == 1
+
+    response = test_client.get(
+        f"{settings.API_V1_STR}/stadium/stadium-list/",
+        params={"created_user": 1, "skip": 1, "limit": 1},
+    )
+    assert response.status_code == 200
+    second_page = response.json()["stadium"]
+    assert len(second_page) == 1
+    assert first_page[0]["id"] < second_page[0]["id"]
+
+    response = test_client.get(
+        f"{settings.API_V1_STR}/stadium/stadium-list/",
+        params={"created_user": 99999},
+    )
+    assert response.status_code == 200
+    assert response.json()["stadium"] == []
+
 def test_get_stadium_list_exception(db_conn, test_client):
     # Make the request
     with patch('app.crud.stadium.get_stadium_list', side_effect=Exception("Simulated Failure")):
@@ -620,7 +655,7 @@ def test_disable_stadium_fail(db_conn, test_client):
     }
 
     # Make the POST request
-    with patch('app.crud.stadium_disable.create', return_value=None):
+    with patch('app.crud.stadium_disable.disable_period', side_effect=SQLAlchemyError("Simulated Failure")):
         response = test_client.post(
             f"{settings.API_V1_STR}/stadium/disable",
             json=disable_data,
@@ -633,6 +668,99 @@ def test_disable_stadium_fail(db_conn, test_client):
     assert response.json()["sessions"] == None
     assert response.json()["cancel_orders"] == None
 
+def test_stadium_closures_never_overlap(db_conn):
+    start = datetime(2030, 1, 1, 9)
+    crud.stadium_disable.disable_period(db_conn, stadium_id=1, start=start, end=start.replace(hour=11))
+    crud.stadium_disable.disable_period(db_conn, stadium_id=1, start=start.replace(hour=10), end=start.replace(hour=12))
+    db_conn.commit()
+    try:
+        # the overlapping closures were merged into one row
+        assert crud.stadium_disable.get_disabled_periods(
+            db_conn, stadium_id=1, start=start, end=start.replace(hour=23)
+        ) == [Range(start, start.replace(hour=12))]
+        # and the database refuses an overlapping row
+        db_conn.add(models.StadiumDisable(stadium_id=1, period=Range(start.replace(hour=11), start.replace(hour=13))))
+        with pytest.raises(IntegrityError):
+            db_conn.commit()
+        db_conn.rollback()
+    finally:
+        crud.stadium_disable.undisable_period(db_conn, stadium_id=1, start=start, end=start.replace(hour=23))
+        db_conn.commit()
+
+def test_disable_stadium_several_days(db_conn, test_client):
+    email = "cloudnativeg23@gmail.com"
+    # stadium 2 opens 8-22 every day; order 11 is at 2023-11-20 10:00 and order 18 at 2023-11-21 11:00 (both on court 8)
+    disable_data = {
+        "stadium_id": 2,
+        "start_date": "2023-11-20",
+        "start_time": 0,
+        "end_date": "2023-11-21",
+        "end_time": 12
+    }
+    crud.stadium_disable.create(db_conn, obj_in=StadiumDisableCreate(stadium_id=2, date="2023-11-21", start_time=8, end_time=9))
+    response = test_client.post(
+        f"{settings.API_V1_STR}/stadium/disable",
+        json=disable_data,
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert response.status_code == 200
+    response_data = response.json()
+    assert response_data["message"] == "success"
+    # 8-22 of the first day and 9-12 of the second one, 8:00 of which was already disabled
+    assert len(response_data["sessions"]) == 14 + 3
+    assert {"date": "2023-11-21", "start_time": 8} not in response_data["sessions"]
+    assert response_data["cancel_orders"] == [11, 18]
+    db_conn.expire_all()
+    assert [crud.order.get_by_order_id(db_conn, order_id=order).status for order in response_data["cancel_orders"]] == [0, 0]
+
+    # disabling the same range again cancels nothing
+    response = test_client.post(
+        f"{settings.API_V1_STR}/stadium/disable",
+        json=disable_data,
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert response.json()["message"] == "Stadium is already disabled at the time."
+    assert response.json()["cancel_orders"] == []
+
+    #undisable the created sessions
+    for session in response_data["sessions"] + [{"date": "2023-11-21", "start_time": 8}]:
+        crud.stadium_disable.delete_by_stadium_id_and_session(db_conn, stadium_id=2, date=session["date"], start_time=session["start_time"])
+    #clear order status
+    for order in response_data["cancel_orders"]:
+        order_obj = crud.order.get_by_order_id(db_conn, order_id=order)
+        crud.order.update(db_conn, db_obj=order_obj, obj_in={"status": 1})
+
+def test_disable_stadium_month_is_one_closure(db_conn, test_client):
+    email = "cloudnativeg23@gmail.com"
+    month_start, month_end = datetime(2023, 12, 1), datetime(2023, 12, 31)
+    response = test_client.post(
+        f"{settings.API_V1_STR}/stadium/disable",
+        json={"stadium_id": 2, "start_date": "2023-12-01", "start_time": 0, "end_date": "2023-12-31", "end_time": 0},
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert response.status_code == 200
+    # stadium 2 opens 8-22
+    assert len(response.json()["sessions"]) == 30 * 14
+    periods = crud.stadium_disable.get_disabled_periods(db_conn, stadium_id=2, start=month_start, end=month_end)
+    assert [(x.lower, x.upper) for x in periods] == [(month_start, month_end)]
+    assert crud.stadium_disable.is_disabled(db_conn, stadium_id=2, date=date(2023, 12, 15), start_time=12)
+
+    # reopening one day splits the closure in two
+    response = test_client.delete(
+        f"{settings.API_V1_STR}/stadium/undisable?stadium_id=2&start_date=2023-12-15&start_time=0&end_date=2023-12-16&end_time=0",
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert len(response.json()["sessions"]) == 14
+    periods = crud.stadium_disable.get_disabled_periods(db_conn, stadium_id=2, start=month_start, end=month_end)
+    assert sorted((x.lower, x.upper) for x in periods) == [
+        (month_start, datetime(2023, 12, 15)), (datetime(2023, 12, 16), month_end),
+    ]
+    assert not crud.stadium_disable.is_disabled(db_conn, stadium_id=2, date=date(2023, 12, 15), start_time=12)
+
+    #undisable the created closures
+    crud.stadium_disable.undisable_period(db_conn, stadium_id=2, start=month_start, end=month_end)
+    db_conn.commit()
+
 # Undisable API
 
 def test_undisable_stadium_logged_in(db_conn, test_client):
@@ -677,6 +805,31 @@ def test_undisable_stadium_logged_in(db_conn, test_client):
         disable_obj = StadiumDisableCreate(**disable_data)
         crud.stadium_disable.create(db_conn, obj_in=disable_obj)
 
+def test_undisable_stadium_several_days(db_conn, test_client):
+    email = "cloudnativeg23@gmail.com"
+    # stadium 2 opens 8-22; 7:00 is outside the opening hours and 2023-11-28 15:00 outside the range
+    sessions = [("2023-11-27", 7), ("2023-11-27", 8), ("2023-11-27", 21), ("2023-11-28", 9), ("2023-11-28", 15)]
+    for session_date, session_start_time in sessions:
+        crud.stadium_disable.create(db_conn, obj_in=StadiumDisableCreate(
+            stadium_id=2, date=session_date, start_time=session_start_time, end_time=session_start_time + 1
+        ))
+    response = test_client.delete(
+        f"{settings.API_V1_STR}/stadium/undisable?stadium_id=2&start_date=2023-11-27&start_time=0&end_date=2023-11-28&end_time=10",
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert response.status_code == 200
+    assert response.json()["message"] == "success"
+    assert response.json()["sessions"] == [
+        {"date": "2023-11-27", "start_time": 8}, {"date": "2023-11-27", "start_time": 21}, {"date": "2023-11-28", "start_time": 9},
+    ]
+    remaining = crud.stadium_disable.get_disabled_sessions(
+        db_conn, stadium_id=2, start_date=date(2023, 11, 27), end_date=date(2023, 11, 29)
+    )
+    # the closure at 7:00 is reopened with the range, but only sessions within the opening hours are reported
+    assert remaining == {(date(2023, 11, 28), 15)}
+    for session_date, session_start_time in remaining:
+        crud.stadium_disable.delete_by_stadium_id_and_session(db_conn, stadium_id=2, date=session_date, start_time=session_start_time)
+
 def test_undisable_stadium_not_logged_in(db_conn, test_client):
     # Create test data for a stadium and its availability
 
@@ -797,7 +950,7 @@ def test_undisable_stadium_exception(db_conn, test_client):
     end_time = 11
 
     # Make the POST request
-    with patch('app.crud.stadium_disable.delete_by_stadium_id_and_session', return_value=None):
+    with patch('app.crud.stadium_disable.undisable_period', side_effect=SQLAlchemyError("Simulated Failure")):
         response = test_client.delete(
                 f"{settings.API_V1_STR}/stadium/undisable?stadium_id={stadium_id}&start_date={start_date}&start_time={start_time}&end_date={end_date}&end_time={end_time}",
                 headers=get_user_authentication_headers(db_conn, email),
@@ -1178,4 +1331,254 @@ def test_get_stadium_availability_for_provider(db_conn, test_client):
                 f"{settings.API_V1_STR}/stadium/providertimetable/?stadium_id={stadium_id}&query_date={query_date}",
                 headers=get_user_authentication_headers(db_conn, email),
             )
-    assert response.status_code == 404
\ No newline at end of file
+    assert response.status_code == 404
+
+def test_get_stadium_availability_in_range(db_conn, test_client):
+    #stadium 1
+    email = "test1@gmail.com"
+    stadium_id = 1
+    start_date = "2023-11-14"
+    end_date = "2023-11-27"
+    headcount = 3
+    level_requirement = "EASY"
+
+    with patch.object(timetable, "get_day_slots", wraps=timetable.get_day_slots) as get_day_slots:
+        response = test_client.post(
+                f"{settings.API_V1_STR}/stadium/timetable/range/?stadium_id={stadium_id}&start_date={start_date}&end_date={end_date}&headcount={headcount}&level_requirement={level_requirement}",
+                headers=get_user_authentication_headers(db_conn, email),
+            )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    # loaded a week at a time while streaming
+    assert [call.kwargs["days"] for call in get_day_slots.call_args_list] == [7, 7]
+    days = [json.loads(line) for line in response.text.splitlines()]
+    assert len(days) == 14
+    assert days[0]["date"] == start_date
+    assert days[-1]["date"] == end_date
+
+    # the first week matches the 7-day timetable
+    response = test_client.post(
+            f"{settings.API_V1_STR}/stadium/timetable/?stadium_id={stadium_id}&query_date={start_date}&headcount={headcount}&level_requirement={level_requirement}",
+            headers=get_user_authentication_headers(db_conn, email),
+        )
+    week = response.json()["data"]
+    for i in range(7):
+        assert days[i]["timetable"] == week[i]["day_{}".format(i + 1)]
+    assert days[0]["timetable"]["9"] == "Disabled"
+
+def test_get_available_stadium_list(db_conn, test_client):
+    email = "test1@gmail.com"
+    query_date = "2023-11-14"
+    headcount = 3
+    level_requirement = "EASY"
+    headers = get_user_authentication_headers(db_conn, email)
+
+    timetables = {}
+    for stadium_id in (1, 2):
+        response = test_client.post(
+                f"{settings.API_V1_STR}/stadium/timetable/?stadium_id={stadium_id}&query_date={query_date}&headcount={headcount}&level_requirement={level_requirement}",
+                headers=headers,
+            )
+        timetables[stadium_id] = response.json()["data"][0]["day_1"]
+
+    # a stadium is listed exactly when its timetable shows the session as available
+    for start_time in range(8, 22):
+        response = test_client.get(
+                f"{settings.API_V1_STR}/stadium/available-list/?query_date={query_date}&start_time={start_time}&headcount={headcount}&level_requirement={level_requirement}",
+                headers=headers,
+            )
+        assert response.status_code == 200
+        listed = {stadium["id"] for stadium in response.json()["stadium"]}
+        for stadium_id, day in timetables.items():
+            assert (stadium_id in listed) == (day.get(str(start_time)) == "Available")
+    assert timetables[1]["9"] == "Disabled"
+
+    response = test_client.get(
+            f"{settings.API_V1_STR}/stadium/available-list/?query_date={query_date}&start_time=24&headcount={headcount}&level_requirement={level_requirement}",
+            headers=headers,
+        )
+    assert response.status_code == 422
+
+def test_get_stadium_availability_for_provider_in_range(db_conn, test_client):
+    #stadium 1
+    email = "cloudnativeg23@gmail.com"
+    stadium_id = 1
+    start_date = "2023-11-13"
+    end_date = "2023-11-15"
+
+    response = test_client.post(
+            f"{settings.API_V1_STR}/stadium/providertimetable/range/?stadium_id={stadium_id}&start_date={start_date}&end_date={end_date}",
+            headers=get_user_authentication_headers(db_conn, email),
+        )
+    assert response.status_code == 200
+    days = [json.loads(line) for line in response.text.splitlines()]
+    assert [day["date"] for day in days] == ["2023-11-13", "2023-11-14", "2023-11-15"]
+    assert days[1]["timetable"]["9"] == "disable"
+    assert days[2]["timetable"]["11"] == "has_order"
+
+def test_get_stadium_availability_in_range_invalid_range(db_conn, test_client):
+    email = "test1@gmail.com"
+    stadium_id = 1
+
+    # more than 90 days
+    response = test_client.post(
+            f"{settings.API_V1_STR}/stadium/timetable/range/?stadium_id={stadium_id}&start_date=2023-11-14&end_date=2024-02-12&headcount=3&level_requirement=EASY",
+            headers=get_user_authentication_headers(db_conn, email),
+        )
+    assert response.status_code == 400
+
+    # end_date before start_date
+    response = test_client.post(
+            f"{settings.API_V1_STR}/stadium/providertimetable/range/?stadium_id={stadium_id}&start_date=2023-11-14&end_date=2023-11-13",
+            headers=get_user_authentication_headers(db_conn, email),
+        )
+    assert response.status_code == 400
+
+    # stadium not exist
+    response = test_client.post(
+            f"{settings.API_V1_STR}/stadium/timetable/range/?stadium_id=300000&start_date=2023-11-14&end_date=2023-11-20&headcount=3&level_requirement=EASY",
+            headers=get_user_authentication_headers(db_conn, email),
+        )
+    assert response.status_code == 404
+
+def test_stadium_availability_cache_invalidation(db_conn, test_client):
+    #stadium 2
+    email = "cloudnativeg23@gmail.com"
+    headers = get_user_authentication_headers(db_conn, email)
+    timetable_url = f"{settings.API_V1_STR}/stadium/providertimetable/?stadium_id=2&query_date=2023-11-22"
+
+    # first read fills the cache, second one is served from it
+    response = test_client.post(timetable_url, headers=headers)
+    assert response.json()["data"][0]["day_1"]["9"] == "no_order"
+    response = test_client.post(timetable_url, headers=headers)
+    assert response.json()["data"][0]["day_1"]["9"] == "no_order"
+
+    # disable evicts the cached day
+    disable_data = {"stadium_id": 2, "start_date": "2023-11-22", "start_time": 9, "end_date": "2023-11-22", "end_time": 10}
+    response = test_client.post(f"{settings.API_V1_STR}/stadium/disable", json=disable_data, headers=headers)
+    assert response.json()["message"] == "success"
+    response = test_client.post(timetable_url, headers=headers)
+    assert response.json()["data"][0]["day_1"]["9"] == "disable"
+
+    # so does undisable
+    response = test_client.delete(
+        f"{settings.API_V1_STR}/stadium/undisable?stadium_id=2&start_date=2023-11-22&start_time=9&end_date=2023-11-22&end_time=10",
+        headers=headers,
+    )
+    assert response.json()["message"] == "success"
+    response = test_client.post(timetable_url, headers=headers)
+    assert response.json()["data"][0]["day_1"]["9"] == "no_order"
+
+def test_slot_bitmap_operations():
+    # court 1 busy 9-12, court 2 busy 10-11, court 3 free
+    occupied = slot_bitmap.to_array([slot_bitmap.hours_mask(9, 12), slot_bitmap.mask_of([10]), 0])
+    assert slot_bitmap.hours_of(slot_bitmap.intersection(occupied[:2])) == [10]
+    assert slot_bitmap.hours_of(slot_bitmap.union(occupied)) == [9, 10, 11]
+    assert slot_bitmap.popcount(occupied).tolist() == [3, 1, 0]
+    free = ~occupied & slot_bitmap.FULL_DAY
+    assert slot_bitmap.count_per_hour(free)[9:12].tolist() == [2, 1, 2]
+    assert slot_bitmap.sessions_mask(np.array([8, 8, 23, 24, -1])) == slot_bitmap.mask_of([8, 23])
+    assert slot_bitmap.union(slot_bitmap.to_array([])) == 0
+
+def test_availability_cache_ttl_lru_and_version():
+    now = [0.0]
+    cache = AvailabilityCache(InProcessBackend(maxsize=2, timer=lambda: now[0]), ttl=10)
+    day = date(2023, 11, 22)
+
+    version = cache.versions(1, [day])[day]
+    cache.set(1, day, "slots", "a", version)
+    assert cache.get(1, day, "slots", version) == "a"
+    # expired after ttl
+    now[0] = 10
+    assert cache.get(1, day, "slots", version) is None
+
+    # least recently used entry is evicted first
+    cache.set(1, day, "slots", "a", version)
+    cache.set(2, day, "slots", "b", cache.versions(2, [day])[day])
+    cache.get(1, day, "slots", version)
+    cache.set(3, day, "slots", "c", cache.versions(3, [day])[day])
+    assert cache.get(2, day, "slots", cache.versions(2, [day])[day]) is None
+    assert cache.get(1, day, "slots", version) == "a"
+
+    # a value loaded before an invalidation is stored under a dead version
+    cache.invalidate(1, day)
+    cache.set(1, day, "slots", "stale", version)
+    assert cache.get(1, day, "slots", cache.versions(1, [day])[day]) is None
+
+    # counters idle for COUNTER_TTL are dropped, so they do not pile up in a long-lived worker
+    backend = cache.backend
+    assert "avail-gen:1:2023-11-22" in backend._counters
+    now[0] += backend.COUNTER_TTL
+    cache.invalidate(2, day)
+    assert list(backend._counters) == ["avail-gen:2:2023-11-22"]
+
+def _assert_invalidation_crosses_workers(worker_a, worker_b):
+    day = date(2023, 11, 22)
+    version = worker_a.versions(1, [day])[day]
+    worker_a.set(1, day, "slots", {"9": "no_order"}, version)
+    assert worker_b.get(1, day, "slots", worker_b.versions(1, [day])[day]) == {"9": "no_order"}
+
+    # a booking in worker_b evicts the day in worker_a
+    worker_b.invalidate(1, day)
+    assert worker_a.get(1, day, "slots", worker_a.versions(1, [day])[day]) is None
+    # and so does a change of the whole stadium
+    version = worker_a.versions(1, [day])[day]
+    worker_a.set(1, day, "slots", {"9": "disable"}, version)
+    worker_b.invalidate(1)
+    assert worker_a.get(1, day, "slots", worker_a.versions(1, [day])[day]) is None
+
+def test_create_cache_backend(tmp_path):
+    options = dict(maxsize=2, mmap_path=str(tmp_path / "cache"), mmap_slots=64, mmap_slot_size=4096, redis_url="redis://localhost:6379/0")
+    assert isinstance(create_backend("mmap", **options), SharedMemoryBackend)
+    assert isinstance(create_backend("memory", **options), InProcessBackend)
+    # a typo must not fall back to a per-worker cache
+    for kind in ("Redis", "mmap ", ""):
+        with pytest.raises(ValueError):
+            create_backend(kind, **options)
+
+def test_availability_cache_shared_memory_backend(tmp_path):
+    path = str(tmp_path / "availability")
+    worker_a = AvailabilityCache(SharedMemoryBackend(path, slots=64, slot_size=4096), ttl=10)
+    worker_b = AvailabilityCache(SharedMemoryBackend(path, slots=64, slot_size=4096), ttl=10)
+    _assert_invalidation_crosses_workers(worker_a, worker_b)
+
+    # values larger than a slot are simply not cached
+    worker_a.backend.set("too-large", "x" * 8192, 10)
+    assert worker_b.backend.get_many(["too-large"]) == [None]
+
+    # a worker with another layout maps a file of its own and leaves the live one alone
+    worker_a.backend.set("kept", "a", 10)
+    resized = SharedMemoryBackend(path, slots=128, slot_size=4096)
+    assert resized.path != worker_a.backend.path
+    assert resized.get_many(["kept"]) == [None]
+    assert worker_b.backend.get_many(["kept"]) == ["a"]
+    # and a file of the right name but the wrong size is refused, not truncated
+    with open(path + ".32x4096", "wb") as f:
+        f.write(b"x" * 100)
+    with pytest.raises(ValueError):
+        SharedMemoryBackend(path, slots=32, slot_size=4096)
+
+def test_shared_cache_backends_run_off_the_event_loop(tmp_path):
+    async def thread_of(backend):
+        return await backend.run(threading.get_ident)
+
+    assert asyncio.run(thread_of(InProcessBackend(maxsize=2))) == threading.get_ident()
+    shared = SharedMemoryBackend(str(tmp_path / "availability"), slots=64, slot_size=4096)
+    assert asyncio.run(thread_of(shared)) != threading.get_ident()
+
+def test_availability_cache_redis_backend():
+    with FakeRedisServer() as server:
+        worker_a = AvailabilityCache(RedisBackend(server.url), ttl=10)
+        worker_b = AvailabilityCache(RedisBackend(server.url), ttl=10)
+        _assert_invalidation_crosses_workers(worker_a, worker_b)
+
+        # the invalidation event also frees the other worker's in-process copy
+        day = date(2023, 11, 24)
+        version = worker_a.versions(2, [day])[day]
+        worker_a.set(2, day, "slots", "a", version)
+        assert worker_b.get(2, day, "slots", version) == "a"
+        stadium_2_keys = lambda: [key for key in worker_b._local if key.startswith("avail:2:")]
+        assert len(stadium_2_keys()) == 1
+        assert server.wait_for(lambda: len(server.subscribers) == 2)
+        worker_a.invalidate(2, day)
+        assert server.wait_for(lambda: not stadium_2_keys())
@@ -1,12 +1,16 @@
 import random
 import string
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 
 import loguru
 import pytest
 from fastapi.encoders import jsonable_encoder
-from app import crud
+from app import crud, models
 from app.core.config import settings
-from .contest import db_conn, get_user_authentication_headers, test_client
+from app.models.notification import Notification
+from .contest import create_team, db_conn, get_user_authentication_headers, test_client
 
 # pytest fixture
 db_conn = db_conn
@@ -190,6 +194,63 @@ def test_get_rent_info_stadium_not_exist_not_logged_in(db_conn, test_client):
     assert response.status_code == 400
     assert response.json()["detail"] == "Fail to find stadium with stadium_id = {}.".format(5)
 
+def test_search_stadium_court_logged_in(db_conn, test_client):
+    search_url = f"{settings.API_V1_STR}/stadium-court/search/?start_date=2023-11-16&end_date=2023-11-16&start_hour=20&end_hour=21&headcount=2&level_requirement=hard"
+    response = test_client.get(search_url, headers=get_user_authentication_headers(db_conn, "test2@gmail.com"))
+    assert response.status_code == 200
+    response_data = response.json()["data"]
+    assert response.json()["next_cursor"] == None
+    team = [x for x in response_data if x["stadium_court_id"] == 7][0]
+    assert team["stadium_id"] == 2
+    assert team["name"] == "A場"
+    assert team["team_id"] == 16
+    assert team["level_requirement"] == ["中級", "高級"]
+    assert team["status"] == "加入"
+
+    # every candidate is what rent-info offers for its court
+    for candidate in response_data:
+        response = test_client.post(
+            f"{settings.API_V1_STR}/stadium-court/rent-info?stadium_id={candidate['stadium_id']}&date=2023-11-16&start_time=20&headcount=2&level_requirement=hard",
+            headers=get_user_authentication_headers(db_conn, "test2@gmail.com"),
+        )
+        court = [x for x in response.json()["data"] if x["stadium_court_id"] == candidate["stadium_court_id"]][0]
+        assert court["status"] == candidate["status"]
+        assert court["team_id"] == candidate["team_id"]
+
+    # the renter is not offered his own team
+    response = test_client.get(search_url, headers=get_user_authentication_headers(db_conn, "test1@gmail.com"))
+    assert 16 not in [x["team_id"] for x in response.json()["data"]]
+
+def test_search_stadium_court_pagination(db_conn, test_client):
+    search_url = f"{settings.API_V1_STR}/stadium-court/search/?start_date=2023-11-16&end_date=2023-11-16&headcount=1&level_requirement=medium"
+    response = test_client.get(search_url + "&limit=200")
+    assert response.status_code == 200
+    all_slots = response.json()["data"]
+    assert len(all_slots) > 7
+
+    pages = []
+    next_cursor = None
+    while True:
+        response = test_client.get(search_url + "&limit=7" + (f"&cursor={next_cursor}" if next_cursor else ""))
+        assert response.status_code == 200
+        pages += response.json()["data"]
+        next_cursor = response.json()["next_cursor"]
+        if next_cursor is None:
+            break
+    assert pages == all_slots
+    keys = [(x["date"], x["start_time"], x["status"] == "租借", x["stadium_court_id"]) for x in all_slots]
+    assert keys == sorted(keys)
+
+def test_search_stadium_court_invalid_range(db_conn, test_client):
+    search_url = f"{settings.API_V1_STR}/stadium-court/search/?headcount=1&level_requirement=medium"
+    response = test_client.get(search_url + "&start_date=2023-11-14&end_date=2023-11-14&start_hour=20&end_hour=20")
+    assert response.status_code == 400
+    response = test_client.get(search_url + "&start_date=2023-11-14&end_date=2023-11-13")
+    assert response.status_code == 400
+    response = test_client.get(search_url + "&start_date=2023-11-14&end_date=2023-11-14&cursor=abc")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor."
+
 def test_rent_logged_in(db_conn, test_client):
     email = "test1@gmail.com"
     post_data = {
@@ -229,6 +290,65 @@ def test_rent_logged_in(db_conn, test_client):
     db_conn.delete(obj)
     db_conn.commit()
 
+def test_rent_already_rented_logged_in(db_conn, test_client):
+    email = "test2@gmail.com"
+    post_data = {
+                    "stadium_court_id": 1,
+                    "date": "2023-11-15",
+                    "start_time": 11,
+                    "end_time": 12,
+                    "current_member_number": 2,
+                    "max_number_of_member": 4,
+                    "is_matching": True,
+                    "level_requirement": ["初級", "中級", "高級"],
+                    "team_member_emails": [
+                        "test3@gmail.com"
+                    ]
+                }
+    response = test_client.post(
+        f"{settings.API_V1_STR}/stadium-court/rent",
+        json=post_data,
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert response.status_code == 409
+    detail = response.json()["detail"]
+    assert detail["message"] == "Fail to rent stadium_court. stadium_court_id = 1 is already rented at this time."
+    # every other court of stadium 1 is free on 2023-11-15 at 11
+    assert [x["stadium_court_id"] for x in detail["alternative_courts"]] == [2, 3, 4, 5, 6]
+    assert detail["alternative_courts"][0]["name"] == "B桌"
+
+def test_rent_same_session_in_parallel(db_conn, test_client):
+    post_data = {
+                    "stadium_court_id": 2,
+                    "date": "2023-11-15",
+                    "start_time": 20,
+                    "end_time": 21,
+                    "current_member_number": 1,
+                    "max_number_of_member": 4,
+                    "is_matching": True,
+                    "level_requirement": ["初級", "中級", "高級"],
+                    "team_member_emails": []
+                }
+    emails = ["test1@gmail.com", "test2@gmail.com", "test3@gmail.com", "test4@gmail.com", "test5@gmail.com"]
+    headers = [get_user_authentication_headers(db_conn, email) for email in emails]
+    barrier = threading.Barrier(len(emails))
+
+    def rent(header):
+        barrier.wait()
+        return test_client.post(f"{settings.API_V1_STR}/stadium-court/rent", json=post_data, headers=header)
+
+    with ThreadPoolExecutor(max_workers=len(emails)) as executor:
+        responses = list(executor.map(rent, headers))
+    succeeded = [response for response in responses if response.status_code == 200]
+    assert len(succeeded) == 1
+    assert sorted(response.status_code for response in responses) == [200, 409, 409, 409, 409]
+    # delete created data
+    obj = crud.order.get_by_order_id(
+        db=db_conn, order_id=succeeded[0].json()["data"]["id"]
+    )
+    db_conn.delete(obj)
+    db_conn.commit()
+
 def test_rent_not_logged_in(db_conn, test_client):
     email = "test1@gmail.com"
     post_data = {
@@ -393,6 +513,44 @@ def test_join_logged_in(db_conn, test_client):
     db_conn.add(update_obj)
     db_conn.commit()
 
+def test_join_notifies_only_new_members(db_conn, test_client):
+    email = "test1@gmail.com"
+    headers = get_user_authentication_headers(db_conn, email)
+    team_id = 11
+
+    def last_notification(template):
+        return db_conn.query(Notification).filter(Notification.template == template).order_by(Notification.id.desc()).first()
+
+    try:
+        response = test_client.post(f"{settings.API_V1_STR}/stadium-court/join", json={"team_id": team_id, "team_member_emails": []}, headers=headers)
+        assert response.status_code == 200
+        # test1 is a member already, only test8 joins
+        response = test_client.post(
+            f"{settings.API_V1_STR}/stadium-court/join", json={"team_id": team_id, "team_member_emails": ["test8@gmail.com"]}, headers=headers
+        )
+        assert response.status_code == 200
+        assert last_notification("join_success").recipients == ["test8@gmail.com"]
+        new_member = last_notification("new_member")
+        assert new_member.payload["members"] == [crud.user.get_by_email(db=db_conn, email="test8@gmail.com").name]
+        assert "test1@gmail.com" in new_member.recipients and "test8@gmail.com" not in new_member.recipients
+
+        # nobody new: nothing to join, nobody notified
+        join_success_id = last_notification("join_success").id
+        response = test_client.post(
+            f"{settings.API_V1_STR}/stadium-court/join", json={"team_id": team_id, "team_member_emails": ["test8@gmail.com"]}, headers=headers
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Fail to join. Users have already joined team_id = {}.".format(team_id)
+        assert last_notification("join_success").id == join_success_id
+    finally:
+        # delete created data and recover current_member_number of Team
+        for delete_obj in crud.team_member.get_all_by_team_id(db=db_conn, team_id=team_id):
+            db_conn.delete(delete_obj)
+        update_obj = crud.team.get_by_team_id(db=db_conn, team_id=team_id)
+        update_obj.current_member_number = update_obj.current_member_number - 2
+        db_conn.add(update_obj)
+        db_conn.commit()
+
 def test_join_not_logged_in(db_conn, test_client):
     email = "test1@gmail.com"
     post_data = {
@@ -461,4 +619,59 @@ def test_join_user_not_exist_not_logged_in(db_conn, test_client):
         # headers=get_user_authentication_headers(db_conn, email),
     )
     assert response.status_code == 401
-    assert response.json()["detail"] == "Not authenticated"
\ No newline at end of file
+    assert response.json()["detail"] == "Not authenticated"
+
+def test_join_full_team_logged_in(db_conn, test_client):
+    email = "test6@gmail.com"
+    post_data = {
+                    "team_id": 2, # 4/4 members
+                    "team_member_emails": []
+                }
+    response = test_client.post(
+        f"{settings.API_V1_STR}/stadium-court/join",
+        json=post_data,
+        headers=get_user_authentication_headers(db_conn, email),
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Fail to join. team_id = {} does not have enough vacancies.".format(post_data["team_id"])
+    db_conn.expire_all()
+    assert crud.team.get_by_team_id(db=db_conn, team_id=2).current_member_number == 4
+    # the membership of the rejected user is rolled back with the team update
+    assert sorted(x.user_id for x in crud.team_member.get_all_by_team_id(db=db_conn, team_id=2)) == [2, 3, 5]
+
+def test_join_same_team_in_parallel(db_conn, test_client):
+    joins = 200
+    order, team = create_team(
+        db_conn, stadium_court_id=9, date=date(2023, 11, 25), start_time=9, max_number_of_member=20, current_member_number=1
+    )
+    users = [
+        models.user.User(name="joiner{}".format(i), email="joiner{}@example.com".format(i), is_provider=False, is_active=True)
+        for i in range(joins)
+    ]
+    db_conn.add_all(users)
+    db_conn.commit()
+    headers = [get_user_authentication_headers(db_conn, user.email) for user in users]
+
+    def join(i):
+        # every other request also brings the next user along, so the joins overlap
+        post_data = {"team_id": team.id, "team_member_emails": [users[(i + 1) % joins].email] if i % 2 else []}
+        return test_client.post(f"{settings.API_V1_STR}/stadium-court/join", json=post_data, headers=headers[i])
+
+    try:
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            responses = list(executor.map(join, range(joins)))
+        assert {response.status_code for response in responses} <= {200, 400}
+        assert any(response.status_code == 400 for response in responses)
+        counts = [response.json()["team"]["current_member_number"] for response in responses if response.status_code == 200]
+        assert max(counts) <= 20
+        db_conn.expire_all()
+        active_members = [x for x in crud.team_member.get_all_by_team_id(db=db_conn, team_id=team.id) if x.status == 1]
+        current_member_number = crud.team.get_by_team_id(db=db_conn, team_id=team.id).current_member_number
+        assert current_member_number == 1 + len(active_members) # renter + team_member
+        assert current_member_number <= 20
+    finally:
+        # delete created data
+        db_conn.delete(order)
+        for user in users:
+            db_conn.delete(user)
+        db_conn.commit()
@@ -79,3 +79,53 @@ def test_get_rent_list_not_logged_in(db_conn, test_client):
     # Assert response data
     response_data = response.json()
     assert response_data["detail"] == "Not authenticated"
+
+def test_get_join_list_pagination(db_conn, test_client):
+    email = "test2@gmail.com"
+    headers = get_user_authentication_headers(db_conn, email)
+    response = test_client.post(f"{settings.API_V1_STR}/team/my-join-list/?limit=200", headers=headers)
+    assert response.status_code == 200
+    all_team_ids = [team["team_id"] for team in response.json()["team_joint_list"]]
+    assert len(all_team_ids) > 1
+    assert response.json()["next_cursor"] is None
+
+    # Walk all pages with limit=1
+    paged_team_ids = []
+    cursor = None
+    while True:
+        url = f"{settings.API_V1_STR}/team/my-join-list/?limit=1"
+        if cursor:
+            url += f"&cursor={cursor}"
+        response = test_client.post(url, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()["team_joint_list"]) <= 1
+        paged_team_ids.extend([team["team_id"] for team in response.json()["team_joint_list"]])
+        cursor = response.json()["next_cursor"]
+        if cursor is None:
+            break
+    assert paged_team_ids == all_team_ids
+
+    # Invalid cursor
+    response = test_client.post(f"{settings.API_V1_STR}/team/my-join-list/?cursor=invalid", headers=headers)
+    assert response.status_code == 400
+
+def test_get_join_list_period(db_conn, test_client):
+    email = "test1@gmail.com"
+    headers = get_user_authentication_headers(db_conn, email)
+    response = test_client.post(f"{settings.API_V1_STR}/team/my-join-list/?limit=200", headers=headers)
+    all_teams = response.json()["team_joint_list"]
+
+    response = test_client.post(f"{settings.API_V1_STR}/team/my-join-list/?limit=200&period=past", headers=headers)
+    assert response.status_code == 200
+    past_teams = response.json()["team_joint_list"]
+    response = test_client.post(f"{settings.API_V1_STR}/team/my-join-list/?limit=200&period=upcoming", headers=headers)
+    assert response.status_code == 200
+    upcoming_teams = response.json()["team_joint_list"]
+
+    assert len(past_teams) + len(upcoming_teams) == len(all_teams)
+    if past_teams and upcoming_teams:
+        assert past_teams[-1]["order_time"] < upcoming_teams[0]["order_time"]
+
+    # invalid period
+    response = test_client.post(f"{settings.API_V1_STR}/team/my-join-list/?period=tomorrow", headers=headers)
+    assert response.status_code == 422
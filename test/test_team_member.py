@@ -1,14 +1,16 @@
 import random
 import string
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 
 import loguru
 import pytest
 from fastapi.encoders import jsonable_encoder
 from fastapi import HTTPException
 from unittest.mock import patch
-from app import crud
+from app import crud, models
 from app.core.config import settings
-from .contest import db_conn, get_user_authentication_headers, test_client
+from .contest import create_team, db_conn, get_user_authentication_headers, test_client
 
 from app.schemas.stadium import StadiumCreate
 from app.schemas.stadium_disable import StadiumDisableCreate
@@ -43,4 +45,64 @@ def test_leave(db_conn, test_client):
         headers=get_user_authentication_headers(db_conn, email)
     )
     assert response.status_code == 400
-    assert "No team to leave." in response.text
\ No newline at end of file
+    assert "No team to leave." in response.text
+
+def test_leave_and_join_in_parallel(db_conn, test_client):
+    order, team = create_team(
+        db_conn, stadium_court_id=8, date=date(2023, 11, 26), start_time=9, max_number_of_member=10, current_member_number=1
+    )
+    users = [
+        models.user.User(name="member{}".format(i), email="member{}@example.com".format(i), is_provider=False, is_active=True)
+        for i in range(30)
+    ]
+    db_conn.add_all(users)
+    db_conn.commit()
+    headers = [get_user_authentication_headers(db_conn, user.email) for user in users]
+    # every user joins and leaves several times, in random order
+    operations = [(i, action) for i in range(len(users)) for action in ("join", "leave") * 5]
+    random.Random(0).shuffle(operations)
+
+    def run(operation):
+        i, action = operation
+        if action == "join":
+            return test_client.post(
+                f"{settings.API_V1_STR}/stadium-court/join",
+                json={"team_id": team.id, "team_member_emails": []},
+                headers=headers[i],
+            )
+        return test_client.post(f"{settings.API_V1_STR}/team-member/leave?team_id={team.id}", headers=headers[i])
+
+    try:
+        with ThreadPoolExecutor(max_workers=40) as executor:
+            responses = list(executor.map(run, operations))
+        assert {response.status_code for response in responses} <= {200, 400}
+        db_conn.expire_all()
+        active_members = [x for x in crud.team_member.get_all_by_team_id(db=db_conn, team_id=team.id) if x.status == 1]
+        current_member_number = crud.team.get_by_team_id(db=db_conn, team_id=team.id).current_member_number
+        assert current_member_number == 1 + len(active_members) # renter + team_member
+        assert current_member_number <= 10
+    finally:
+        # delete created data
+        db_conn.delete(order)
+        for user in users:
+            db_conn.delete(user)
+        db_conn.commit()
+
+def test_leave_twice(db_conn, test_client):
+    email = "test7@gmail.com"
+    team_id = 18
+    current_member_number = crud.team.get_by_team_id(db=db_conn, team_id=team_id).current_member_number
+    response = test_client.post(
+        f"{settings.API_V1_STR}/team-member/leave?team_id={team_id}",
+        headers=get_user_authentication_headers(db_conn, email)
+    )
+    assert response.status_code == 200
+    # already left: the counter is not decreased again
+    response = test_client.post(
+        f"{settings.API_V1_STR}/team-member/leave?team_id={team_id}",
+        headers=get_user_authentication_headers(db_conn, email)
+    )
+    assert response.status_code == 400
+    assert "No team to leave." in response.text
+    db_conn.expire_all()
+    assert crud.team.get_by_team_id(db=db_conn, team_id=team_id).current_member_number == current_member_number - 1
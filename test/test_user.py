@@ -5,7 +5,9 @@ import loguru
 import pytest
 from fastapi.encoders import jsonable_encoder
 
+from app.core.cache_backends import InProcessBackend
 from app.core.config import settings
+from app.core.user_status_cache import UserStatus, UserStatusCache
 from .contest import db_conn, get_user_authentication_headers, test_client
 
 # pytest fixture
@@ -29,4 +31,12 @@ def test_get_all_user_except_provider_and_current_user_not_logged_in(db_conn, te
         # headers=get_user_authentication_headers(db_conn, email),
     )
     assert response.status_code == 401
-    assert response.json()["detail"] == "Not authenticated"
\ No newline at end of file
+    assert response.json()["detail"] == "Not authenticated"
+
+
+def test_user_status_cache_off_without_shared_backend():
+    # a per-worker backend cannot see invalidations made in other workers
+    cache = UserStatusCache(InProcessBackend(maxsize=8), ttl=60)
+    version, _ = cache.lookup(1)
+    cache.set(1, UserStatus(is_active=True, is_provider=False), version)
+    assert cache.lookup(1) == (version, None)